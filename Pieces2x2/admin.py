@@ -5,7 +5,8 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.contrib import admin
-from Pieces2x2.models import TwoSide, TwoSideOptions, EvalProgress, Piece2x2
+from Pieces2x2.models import (TwoSide, TwoSideOptions, SegmentOptions, EvalProgress, EvalCheckpoint, SquareWitness,
+                              Piece2x2)
 
 
 class TwoSideOptionsAdmin(admin.ModelAdmin):
@@ -13,11 +14,26 @@ class TwoSideOptionsAdmin(admin.ModelAdmin):
     list_filter = ('processor', 'segment')
 
 
+class SegmentOptionsAdmin(admin.ModelAdmin):
+
+    list_filter = ('processor',)
+
+
 class ProgressAdmin(admin.ModelAdmin):
 
     list_filter = ('eval_size', 'processor')
 
 
+class CheckpointAdmin(admin.ModelAdmin):
+
+    list_filter = ('eval_size', 'processor')
+
+
+class SquareWitnessAdmin(admin.ModelAdmin):
+
+    list_filter = ('locs',)
+
+
 class Piece2x2Admin(admin.ModelAdmin):
 
     list_filter = ('is_border', 'has_hint', 'side4')
@@ -25,7 +41,10 @@ class Piece2x2Admin(admin.ModelAdmin):
 
 admin.site.register(TwoSide)
 admin.site.register(TwoSideOptions, TwoSideOptionsAdmin)
+admin.site.register(SegmentOptions, SegmentOptionsAdmin)
 admin.site.register(EvalProgress, ProgressAdmin)
+admin.site.register(EvalCheckpoint, CheckpointAdmin)
+admin.site.register(SquareWitness, SquareWitnessAdmin)
 admin.site.register(Piece2x2, Piece2x2Admin)
 
 # end of file
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Evaluation of all single locations of a board in one pass
+
+    eval_loc_1 answers "which options of the 4 sides of this location are still used by a Piece2x2?"
+    for one location, with its own queries. The BoardScan1x1 does the same for all open locations
+    of a board, with the options and unused base pieces loaded once by the caller:
+        - the options no Piece2x2 can use anymore are removed from the segments
+        - a location with only one fitting Piece2x2 is filled, which takes its base pieces from the other locations
+        - the locations next to a changed segment are evaluated again, until nothing changes
+
+    Nothing is written to the database: the caller applies .reductions and .fills.
+    The base pieces on each quadrant of a location can be limited further with the result of the ClaimMatrix.
+
+    With NumPy available, each location is evaluated with boolean masks over the columns of the Piece2x2Index
+    (shared with the index, not copied). Without NumPy the bitsets of the Piece2x2Index are used.
+"""
+
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.helpers import calc_segment
+from Pieces2x2.piece_index import get_piece_index
+from Pieces2x2.square_search import LOC_HINTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def get_other_hints_mask(loc):
+    """ returns the PieceSet mask of the hint base pieces that belong to other locations """
+    mask = 0
+    for hint_loc, hint in LOC_HINTS.items():
+        if hint_loc != loc:
+            mask |= 1 << hint[1]
+    # for
+    return mask
+
+
+class BoardScan1x1(object):
+
+    """ Reduce the options of all open locations of a board """
+
+    def __init__(self, seg2options, loc2unused, piece_index=None, use_numpy=True):
+        """
+            seg2options: [segment] = options, as returned by load_segment_options
+            loc2unused: [loc] = PieceSet mask of the base pieces available to that location, for each open location
+        """
+        self.piece_index = piece_index or get_piece_index()
+        self.seg2options = dict(seg2options)
+        self.loc2unused = dict(loc2unused)
+
+        # [loc] = (segment of side1..4)
+        self.loc2segments = {loc: tuple([calc_segment(loc, side_nr) for side_nr in (1, 2, 3, 4)])
+                             for loc in self.loc2unused.keys()}
+
+        # [segment] = [loc, ..] open locations on this segment
+        self.segment2locs = dict()
+        for loc, segments in self.loc2segments.items():
+            for segment in segments:
+                try:
+                    self.segment2locs[segment].append(loc)
+                except KeyError:
+                    self.segment2locs[segment] = [loc]
+            # for
+        # for
+
+        # [loc] = (PieceSet mask for quadrant 1..4), see set_quadrant_masks
+        self.loc2quadrants = dict()
+
+        self.reductions = dict()        # [segment] = set(two_side, ..)
+        self.fills = dict()             # [loc] = Piece2x2 index
+        self.dead_loc = 0               # location without any fitting Piece2x2
+        self.rounds = 0
+        self.evaluations = 0
+
+        self.engine = 'bitsets'
+        if use_numpy and np is not None:
+            self.engine = 'numpy'
+            index = self.piece_index
+            # views on the columns of the index
+            self._sides = [np.asarray(view) for view in index.sides]
+            self._base_nrs = [np.asarray(view) for view in index.base_nrs]
+            self._side_tables = [np.zeros(int(sides.max()) + 1 if len(sides) else 1, dtype=bool)
+                                 for sides in self._sides]
+
+    def set_quadrant_masks(self, loc, masks):
+        """ limit the base nrs on each quadrant 1..4 of the location (for example from the claims)
+            masks: PieceSet mask for each quadrant
+        """
+        self.loc2quadrants[loc] = tuple(masks)
+
+    @staticmethod
+    def _get_mask_table(mask):
+        """ returns the lookup table [base nr] = True for the base nrs in the PieceSet mask """
+        return np.array([(mask >> nr) & 1 for nr in range(256 + 1)], dtype=bool)
+
+    def _fit_numpy(self, options_sides, unused_mask, hint, quadrant_masks):
+        """ returns the indices of the Piece2x2 that fit """
+        # start with the side with the fewest options, then only look at the indices that are left
+        order = sorted(range(4), key=lambda pos: len(options_sides[pos]))
+
+        indices = None
+        for pos in order:
+            table = self._side_tables[pos]
+            table[:] = False
+            options = [option for option in options_sides[pos] if option < len(table)]
+            table[options] = True
+
+            sides = self._sides[pos]
+            if indices is None:
+                indices = np.flatnonzero(table[sides])
+            else:
+                indices = indices[table[sides[indices]]]
+            if len(indices) == 0:
+                return indices
+        # for
+
+        if hint:
+            pos, base_nr = hint
+            indices = indices[self._base_nrs[pos - 1][indices] == base_nr]
+
+        unused_table = self._get_mask_table(unused_mask)
+        for base_nrs in self._base_nrs:
+            indices = indices[unused_table[base_nrs[indices]]]
+        # for
+
+        if quadrant_masks:
+            for base_nrs, mask in zip(self._base_nrs, quadrant_masks):
+                indices = indices[self._get_mask_table(mask)[base_nrs[indices]]]
+            # for
+
+        return indices
+
+    def _fit(self, loc):
+        """ returns the side options of the location and the Piece2x2 that fit:
+            an array with indices (NumPy) or a bitset (bitsets)
+        """
+        options_sides = [sorted(self.seg2options[segment]) for segment in self.loc2segments[loc]]
+        hint = LOC_HINTS.get(loc, None)
+        unused_mask = self.loc2unused[loc]
+        quadrant_masks = self.loc2quadrants.get(loc, None)
+
+        if self.engine == 'numpy':
+            return options_sides, self._fit_numpy(options_sides, unused_mask, hint, quadrant_masks)
+
+        index = self.piece_index
+        bits = index.fits(options_sides[0], options_sides[1], options_sides[2], options_sides[3],
+                          PieceSet.from_mask(unused_mask), hint)
+        if quadrant_masks:
+            for pos, mask in enumerate(quadrant_masks, start=1):
+                if bits:
+                    bits = index.filter_base_nrs(bits, pos, mask)
+            # for
+        return options_sides, bits
+
+    def _evaluate(self, loc):
+        """ returns the number of Piece2x2 that fit, the remaining options for side 1..4
+            and the index of a Piece2x2 that fits
+        """
+        self.evaluations += 1
+        options_sides, fit = self._fit(loc)
+
+        if self.engine == 'numpy':
+            if len(fit) == 0:
+                return 0, None, -1
+            remaining = [set(np.unique(self._sides[pos][fit]).tolist()) for pos in range(4)]
+            return len(fit), remaining, int(fit[0])
+
+        index = self.piece_index
+        if not fit:
+            return 0, None, -1
+        remaining = [set(index.get_remaining_options(fit, pos + 1, options_sides[pos])) for pos in range(4)]
+        return fit.bit_count(), remaining, next(index.iter_indices(fit))
+
+    def get_quadrant_nrs(self, loc):
+        """ returns the base nrs that can still be placed on each quadrant 1..4 of the location
+            an empty list for each quadrant when no Piece2x2 fits
+        """
+        _, fit = self._fit(loc)
+
+        if self.engine == 'numpy':
+            return [np.unique(base_nrs[fit]).tolist() for base_nrs in self._base_nrs]
+
+        if not fit:
+            return [[], [], [], []]
+        return [self.piece_index.get_base_nrs(fit, pos) for pos in (1, 2, 3, 4)]
+
+    def _fill(self, loc, idx):
+        self.fills[loc] = idx
+        nrs1, nrs2, nrs3, nrs4 = self.piece_index.base_nrs
+        bits = (1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])
+        for other_loc in self.loc2unused.keys():
+            self.loc2unused[other_loc] &= ~bits
+        # for
+
+    def scan(self):
+        """ evaluate the open locations until nothing changes
+            returns False when a location has no fitting Piece2x2 left (see .dead_loc)
+        """
+        todo = sorted(self.loc2unused.keys())
+        while todo:
+            self.rounds += 1
+            changed_segments = set()
+            has_fill = False
+
+            for loc in todo:
+                if loc in self.fills:
+                    continue
+
+                count, remaining, idx = self._evaluate(loc)
+                if count == 0:
+                    self.dead_loc = loc
+                    return False
+
+                for pos, segment in enumerate(self.loc2segments[loc]):
+                    options = self.seg2options[segment]
+                    if len(remaining[pos]) < len(options):
+                        removed = [option for option in options if option not in remaining[pos]]
+                        try:
+                            self.reductions[segment].update(removed)
+                        except KeyError:
+                            self.reductions[segment] = set(removed)
+                        self.seg2options[segment] = frozenset(remaining[pos])
+                        changed_segments.add(segment)
+                # for
+
+                if count == 1:
+                    self._fill(loc, idx)
+                    has_fill = True
+            # for
+
+            if has_fill:
+                # base pieces were taken: all open locations can have changed
+                todo = sorted([loc for loc in self.loc2unused.keys() if loc not in self.fills])
+            else:
+                locs = set()
+                for segment in changed_segments:
+                    locs.update(self.segment2locs[segment])
+                # for
+                todo = sorted([loc for loc in locs if loc not in self.fills])
+        # while
+
+        return True
+
+
+# end of file
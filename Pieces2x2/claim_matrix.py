@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Claims of base pieces by the open locations of a board
+
+    Each open location has 4 quadrants (nr1..nr4 of the Piece2x2) and every unused base piece
+    must end up on exactly one of these quadrants. The ClaimMatrix keeps, for each quadrant,
+    the base pieces that can still be placed there and applies the pigeonhole rules until nothing changes:
+        - k quadrants that can only take the same k base pieces claim these base pieces;
+          the base pieces are removed from all other quadrants (k=1 is a single claim)
+        - a base piece that fits on only one quadrant is claimed by that quadrant
+        - a quadrant without base pieces, a base piece without quadrant or
+          more quadrants than base pieces in a group is a dead end
+
+    With NumPy available the matrix is a boolean array [quadrant, base nr] and each rule is
+    a vectorized operation. Without NumPy each quadrant is a PieceSet mask.
+
+    After these rules, the matching between the quadrants and the base pieces finds what is left (Hall's theorem):
+        - no complete assignment of the base pieces to the quadrants is a dead end
+        - a (quadrant, base piece) pair that is not part of any complete assignment is removed
+        - the quadrants and base pieces that can only be assigned to each other form a tight set;
+          these are the claims
+    A pair is part of a complete assignment when it is in the found assignment, or when the quadrant and
+    the quadrant that has the base piece are in the same strongly connected component of the alternating graph.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class ClaimMatrix(object):
+
+    """ Which unused base pieces can still be placed on which quadrant of the open locations """
+
+    def __init__(self, slot2nrs, unused_mask, use_numpy=True):
+        """
+            slot2nrs: [(loc, pos)] = [base nr, ..] for quadrant 1..4 of each open location
+            unused_mask: PieceSet mask of the base pieces that are not on the board
+        """
+        self.slots = sorted(slot2nrs.keys())
+        self.unused_mask = unused_mask
+        self.dead_end = ''          # reason
+        self.rounds = 0
+
+        self.removed = []           # [(loc, pos, nr), ..] pairs removed by the matching
+        self.tight_sets = None      # [(base nrs, quadrants), ..] found by the matching
+
+        self.engine = 'bitsets'
+        if use_numpy and np is not None:
+            self.engine = 'numpy'
+            self._matrix = np.zeros((len(self.slots), 256 + 1), dtype=bool)
+            for row, slot in enumerate(self.slots):
+                self._matrix[row, slot2nrs[slot]] = True
+            # for
+            self._unused = np.array([(unused_mask >> nr) & 1 for nr in range(256 + 1)], dtype=bool)
+            self._matrix &= self._unused
+        else:
+            self._rows = []
+            for slot in self.slots:
+                mask = 0
+                for nr in slot2nrs[slot]:
+                    mask |= 1 << nr
+                # for
+                self._rows.append(mask & unused_mask)
+            # for
+
+    def _slot_str(self, row):
+        loc, pos = self.slots[row]
+        return '%s.nr%s' % (loc, pos)
+
+    def _round_numpy(self):
+        matrix = self._matrix
+
+        row_counts = matrix.sum(axis=1)
+        empty = np.flatnonzero(row_counts == 0)
+        if len(empty):
+            self.dead_end = 'no base pieces left for %s' % self._slot_str(empty[0])
+            return False
+
+        col_counts = matrix.sum(axis=0)
+        lost = np.flatnonzero(self._unused & (col_counts == 0))
+        if len(lost):
+            self.dead_end = 'base %s fits nowhere' % lost[0]
+            return False
+
+        changed = False
+
+        # k quadrants with the same k base pieces
+        rows, inverse, counts = np.unique(matrix, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+        sizes = rows.sum(axis=1)
+        for group in np.flatnonzero(counts >= sizes):
+            members = inverse == group
+            if counts[group] > sizes[group]:
+                self.dead_end = '%s quadrants for %s base pieces: %s' % (
+                                    counts[group], sizes[group],
+                                    " + ".join([self._slot_str(row) for row in np.flatnonzero(members)]))
+                return False
+            others = np.ix_(~members, rows[group])
+            if matrix[others].any():
+                matrix[others] = False
+                changed = True
+        # for
+
+        # base pieces that fit on only one quadrant
+        col_counts = matrix.sum(axis=0)
+        nrs = np.flatnonzero(self._unused & (col_counts == 1))
+        if len(nrs):
+            nr_rows = matrix[:, nrs].argmax(axis=0)
+            if len(np.unique(nr_rows)) < len(nr_rows):
+                self.dead_end = 'one quadrant is the only place for several base pieces'
+                return False
+            shrink = matrix[nr_rows].sum(axis=1) > 1
+            if shrink.any():
+                matrix[nr_rows[shrink]] = False
+                matrix[nr_rows[shrink], nrs[shrink]] = True
+                changed = True
+
+        return changed
+
+    def _round_bitsets(self):
+        rows = self._rows
+
+        for row, mask in enumerate(rows):
+            if not mask:
+                self.dead_end = 'no base pieces left for %s' % self._slot_str(row)
+                return False
+        # for
+
+        nr2rows = dict()        # [nr] = [row, ..]
+        for row, mask in enumerate(rows):
+            for nr in range(1, 256+1):
+                if (mask >> nr) & 1:
+                    try:
+                        nr2rows[nr].append(row)
+                    except KeyError:
+                        nr2rows[nr] = [row]
+            # for
+        # for
+
+        for nr in range(1, 256+1):
+            if (self.unused_mask >> nr) & 1 and nr not in nr2rows:
+                self.dead_end = 'base %s fits nowhere' % nr
+                return False
+        # for
+
+        changed = False
+
+        # k quadrants with the same k base pieces
+        groups = dict()     # [mask] = [row, ..]
+        for row, mask in enumerate(rows):
+            try:
+                groups[mask].append(row)
+            except KeyError:
+                groups[mask] = [row]
+        # for
+        for mask, members in groups.items():
+            size = mask.bit_count()
+            if len(members) > size:
+                self.dead_end = '%s quadrants for %s base pieces: %s' % (
+                                    len(members), size, " + ".join([self._slot_str(row) for row in members]))
+                return False
+            if len(members) == size:
+                for row in range(len(rows)):
+                    if row not in members and rows[row] & mask:
+                        rows[row] &= ~mask
+                        changed = True
+                # for
+        # for
+
+        # base pieces that fit on only one quadrant
+        done = set()
+        for nr, nr_rows in nr2rows.items():
+            if len(nr_rows) == 1:
+                row = nr_rows[0]
+                if row in done:
+                    self.dead_end = 'one quadrant is the only place for several base pieces'
+                    return False
+                done.add(row)
+                if rows[row] != 1 << nr:
+                    rows[row] = 1 << nr
+                    changed = True
+        # for
+
+        return changed
+
+    def _get_row_nrs(self, row):
+        if self.engine == 'numpy':
+            return np.flatnonzero(self._matrix[row]).tolist()
+        mask = self._rows[row]
+        return [nr for nr in range(1, 256+1) if (mask >> nr) & 1]
+
+    def _remove(self, row, nr):
+        if self.engine == 'numpy':
+            self._matrix[row, nr] = False
+        else:
+            self._rows[row] &= ~(1 << nr)
+        loc, pos = self.slots[row]
+        self.removed.append((loc, pos, nr))
+
+    @staticmethod
+    def _augment(start, rows, row2nr, nr2row):
+        """ extend the assignment with quadrant start, by moving other assigned base pieces
+            returns False when this is not possible
+        """
+        reached = dict()        # [nr] = row
+        todo = [start]
+        while todo:
+            row = todo.pop()
+            for nr in rows[row]:
+                if nr in reached:
+                    continue
+                reached[nr] = row
+                if nr not in nr2row:
+                    # free base piece: flip the path back to start
+                    while True:
+                        row = reached[nr]
+                        prev_nr = row2nr[row]
+                        row2nr[row] = nr
+                        nr2row[nr] = row
+                        if row == start:
+                            return True
+                        nr = prev_nr
+                    # while
+                todo.append(nr2row[nr])
+            # for
+        # while
+        return False
+
+    @staticmethod
+    def _calc_components(edges):
+        """ returns [node] = component nr, for the strongly connected components of the directed graph
+            edges: [node] = [next node, ..]
+        """
+        count = len(edges)
+        order = [-1] * count
+        low = [0] * count
+        comp = [-1] * count
+        stack = []
+        next_order = 0
+        next_comp = 0
+
+        for root in range(count):
+            if order[root] >= 0:
+                continue
+            order[root] = low[root] = next_order
+            next_order += 1
+            stack.append(root)
+            work = [(root, iter(edges[root]))]
+            while work:
+                node, it = work[-1]
+                pushed = False
+                for nxt in it:
+                    if order[nxt] < 0:
+                        order[nxt] = low[nxt] = next_order
+                        next_order += 1
+                        stack.append(nxt)
+                        work.append((nxt, iter(edges[nxt])))
+                        pushed = True
+                        break
+                    if comp[nxt] < 0:
+                        low[node] = min(low[node], order[nxt])
+                # for
+                if pushed:
+                    continue
+
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+
+                if low[node] == order[node]:
+                    while True:
+                        member = stack.pop()
+                        comp[member] = next_comp
+                        if member == node:
+                            break
+                    # while
+                    next_comp += 1
+            # while
+        # for
+
+        return comp
+
+    def _match(self):
+        """ remove the pairs that are not part of any complete assignment and find the tight sets
+            returns False when a dead end was found
+        """
+        rows = [self._get_row_nrs(row) for row in range(len(self.slots))]
+        row2nr = [0] * len(rows)
+        nr2row = dict()
+
+        for row in range(len(rows)):
+            if not self._augment(row, rows, row2nr, nr2row):
+                self.dead_end = 'no assignment of the base pieces possible for %s' % self._slot_str(row)
+                return False
+        # for
+
+        for nr in range(1, 256+1):
+            if (self.unused_mask >> nr) & 1 and nr not in nr2row:
+                self.dead_end = 'no quadrant left for base %s' % nr
+                return False
+        # for
+
+        # alternating graph, with each quadrant and its assigned base piece as a single node
+        edges = [[nr2row[nr] for nr in nrs if nr != row2nr[row]] for row, nrs in enumerate(rows)]
+        comp = self._calc_components(edges)
+
+        for row, nrs in enumerate(rows):
+            for nr in nrs:
+                if nr != row2nr[row] and comp[row] != comp[nr2row[nr]]:
+                    self._remove(row, nr)
+            # for
+        # for
+
+        comp2rows = dict()      # [comp] = [row, ..]
+        for row in range(len(rows)):
+            try:
+                comp2rows[comp[row]].append(row)
+            except KeyError:
+                comp2rows[comp[row]] = [row]
+        # for
+
+        self.tight_sets = sorted([(sorted([row2nr[row] for row in comp_rows]),
+                                   [self.slots[row] for row in comp_rows])
+                                  for comp_rows in comp2rows.values()])
+        return True
+
+    def solve(self):
+        """ apply the rules until nothing changes, then the matching
+            returns False when a dead end was found (see .dead_end)
+        """
+        changed = True
+        while changed:
+            self.rounds += 1
+            if self.engine == 'numpy':
+                changed = self._round_numpy()
+            else:
+                changed = self._round_bitsets()
+        # while
+
+        if self.dead_end == '':
+            self._match()
+
+        return self.dead_end == ''
+
+    def get_nrs(self, slot):
+        """ returns the base nrs that can still be placed on the quadrant (loc, pos) """
+        return self._get_row_nrs(self.slots.index(slot))
+
+    def get_groups(self):
+        """ returns the claims: [(base nrs, quadrants), ..] where k quadrants share the same k base pieces """
+        if self.tight_sets is not None:
+            return self.tight_sets
+
+        groups = dict()     # [nrs] = [slot, ..]
+        for slot in self.slots:
+            nrs = tuple(self.get_nrs(slot))
+            try:
+                groups[nrs].append(slot)
+            except KeyError:
+                groups[nrs] = [slot]
+        # for
+        return [(list(nrs), slots) for nrs, slots in sorted(groups.items()) if len(nrs) == len(slots)]
+
+    def get_quadrant_masks(self):
+        """ returns [loc] = (PieceSet mask for quadrant 1..4), for BoardScan1x1.set_quadrant_masks """
+        loc2masks = dict()
+        for row, (loc, pos) in enumerate(self.slots):
+            mask = 0
+            for nr in self._get_row_nrs(row):
+                mask |= 1 << nr
+            # for
+            masks = loc2masks.setdefault(loc, [0, 0, 0, 0])
+            masks[pos - 1] = mask
+        # for
+        return loc2masks
+
+    def get_claims(self):
+        """ returns the single claims [(nr, loc), ..] and the double claims [(nr, loc1, loc2), ..] """
+        claims_single = []
+        claims_double = []
+        for nrs, slots in self.get_groups():
+            locs = sorted(set([loc for loc, _ in slots]))
+            if len(locs) == 1:
+                claims_single.extend([(nr, locs[0]) for nr in nrs])
+            elif len(locs) == 2:
+                claims_double.extend([(nr, locs[0], locs[1]) for nr in nrs])
+        # for
+        claims_single.sort()
+        claims_double.sort()
+        return claims_single, claims_double
+
+
+# end of file
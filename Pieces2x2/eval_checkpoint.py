@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Checkpoints for evaluator jobs
+
+    An evaluator job that is interrupted (worker restart, do_work with worker 0) starts again from zero.
+    The Checkpointer stores the options that are already decided in an EvalCheckpoint record,
+    together with a fingerprint of the board state the job started with.
+
+    The fingerprint covers the options of the segments of the evaluator and the unused base pieces.
+    The options the job removed itself are added back before the fingerprint is compared,
+    so a restarted job resumes unless another job changed the board in the meantime.
+"""
+
+from Pieces2x2.models import EvalCheckpoint
+import hashlib
+import time
+
+
+def calc_board_fingerprint(seg2options, unused):
+    """ returns the fingerprint of the options of some segments and the unused base pieces
+
+        seg2options: [segment] = options
+        unused: PieceSet
+    """
+    digest = hashlib.sha1()
+    for segment in sorted(seg2options.keys()):
+        digest.update(('%s:%s;' % (segment, ",".join([str(nr) for nr in sorted(seg2options[segment])]))).encode())
+    # for
+    digest.update(('unused:%x' % unused.mask).encode())
+    return digest.hexdigest()
+
+
+class Checkpointer(object):
+
+    """ Keeps track of the decided options of an evaluator job and stores them every SAVE_SECONDS """
+
+    SAVE_SECONDS = 60
+
+    def __init__(self, processor, eval_size, eval_loc, segment, seg2options, unused):
+        """
+            segment: segment the job works on, or 0 when the job covers all segments of the evaluator
+            seg2options: [segment] = options, for the segments of the evaluator
+            unused: PieceSet with the base pieces available to the evaluator
+        """
+        self.proven = set()         # (segment, two_side)
+        self.reduced = set()        # (segment, two_side)
+        self._next_save = time.monotonic() + self.SAVE_SECONDS
+
+        self._checkpoint, _ = EvalCheckpoint.objects.get_or_create(processor=processor,
+                                                                   eval_size=eval_size,
+                                                                   eval_loc=eval_loc,
+                                                                   segment=segment,
+                                                                   defaults={'fingerprint': ''})
+
+        # add back the options this job removed, before the previous restart
+        start_options = {seg: set(options) for seg, options in seg2options.items()}
+        for seg, two_side in self._checkpoint.reduced:
+            if seg in start_options:
+                start_options[seg].add(two_side)
+        # for
+        fingerprint = calc_board_fingerprint(start_options, unused)
+
+        if self._checkpoint.fingerprint and self._checkpoint.fingerprint == fingerprint:
+            # same board: resume
+            self.proven = set([tuple(pair) for pair in self._checkpoint.proven])
+            self.reduced = set([tuple(pair) for pair in self._checkpoint.reduced])
+        else:
+            # new job or changed board
+            self._checkpoint.fingerprint = calc_board_fingerprint(seg2options, unused)
+            self._checkpoint.proven = list()
+            self._checkpoint.reduced = list()
+            self._checkpoint.save(update_fields=['fingerprint', 'proven', 'reduced', 'updated'])
+
+    def resumed_count(self):
+        """ returns the number of options that were decided before the restart """
+        return len(self.proven) + len(self.reduced)
+
+    def is_decided(self, segment, two_side):
+        key = (segment, two_side)
+        return key in self.proven or key in self.reduced
+
+    def add(self, segment, two_side, is_reduced):
+        """ remember a decided option; stored in the database every SAVE_SECONDS """
+        if is_reduced:
+            self.reduced.add((segment, two_side))
+        else:
+            self.proven.add((segment, two_side))
+
+        if time.monotonic() > self._next_save:
+            self.save()
+
+    def save(self):
+        self._checkpoint.proven = sorted([list(pair) for pair in self.proven])
+        self._checkpoint.reduced = sorted([list(pair) for pair in self.reduced])
+        self._checkpoint.save(update_fields=['proven', 'reduced', 'updated'])
+        self._next_save = time.monotonic() + self.SAVE_SECONDS
+
+    def delete(self):
+        """ the job is complete: the checkpoint is no longer needed """
+        self._checkpoint.delete()
+
+
+# end of file
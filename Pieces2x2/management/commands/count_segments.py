@@ -5,7 +5,7 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions
+from Pieces2x2.segment_options import count_segment_options
 
 
 class Command(BaseCommand):
@@ -19,7 +19,7 @@ class Command(BaseCommand):
 
         processor = options['processor'][0]
 
-        count = TwoSideOptions.objects.filter(processor=processor).count()
+        count = count_segment_options(processor)
         self.stdout.write("%s" % count)
 
 
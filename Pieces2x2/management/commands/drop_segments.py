@@ -5,7 +5,8 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions, EvalProgress
+from Pieces2x2.models import EvalProgress
+from Pieces2x2.segment_options import count_segment_options, delete_segment_options
 from WorkQueue.models import Work, ProcessorUsedPieces
 
 
@@ -19,14 +20,13 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
 
         for processor in options['processor']:
-            qset = TwoSideOptions.objects.filter(processor=processor)
-            count = qset.count()
+            count = count_segment_options(processor)
 
             if count == 0:
                 self.stderr.write('[ERROR] Processor %s not found' % processor)
             else:
-                self.stdout.write('[INFO] Deleting %s TwoSide records' % count)
-                qset.delete()
+                self.stdout.write('[INFO] Deleting %s TwoSide options' % count)
+                delete_segment_options(processor)
 
                 count = Work.objects.filter(processor=processor).count()
                 Work.objects.filter(processor=processor).delete()
@@ -5,9 +5,10 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions
+from Pieces2x2.segment_options import count_segment_options
 from WorkQueue.models import ProcessorUsedPieces
-from WorkQueue.operations import used_note_add
+from WorkQueue.operations import clone_board
+import time
 
 
 class Command(BaseCommand):
@@ -22,44 +23,24 @@ class Command(BaseCommand):
 
         processor = options['processor']
 
-        if TwoSideOptions.objects.filter(processor=processor).count() > 0:
+        if count_segment_options(processor) > 0:
             self.stderr.write('[ERROR] Processor %s already exists' % processor)
             return
 
         source = options['source']
-        count = TwoSideOptions.objects.filter(processor=source).count()
+        count = count_segment_options(source)
         if count == 0:
             self.stderr.write('[ERROR] Nothing to copy')
             return
 
         self.stdout.write('[INFO] Duplicating processor %s to %s' % (source, processor))
 
-        bulk = []
-        for options in TwoSideOptions.objects.filter(processor=source):
-            option = TwoSideOptions(
-                        processor=processor,
-                        segment=options.segment,
-                        two_side=options.two_side)
-            bulk.append(option)
-        # for
-
-        self.stdout.write('[INFO] Creating %s records' % len(bulk))
-        TwoSideOptions.objects.bulk_create(bulk)
-
-        try:
-            work = ProcessorUsedPieces.objects.get(processor=source)
-        except ProcessorUsedPieces.DoesNotExist:
+        if ProcessorUsedPieces.objects.filter(processor=source).count() == 0:
             self.stdout.write('[WARNING] Could not load used pieces for processor %s; creating new' % source)
-            work = ProcessorUsedPieces()
-        else:
-            # force creation of a new record
-            work.pk = None
-
-        work.processor = processor
-        work.created_from = source
-        work.save()
 
-        used_note_add(work.processor, 'Dup from %s' % source)
+        started = time.monotonic()
+        clone_board(source, processor, 'Dup from %s' % source)
+        self.stdout.write('[INFO] Copied %s options in %.3f seconds' % (count, time.monotonic() - started))
 
 
 # end of file
@@ -5,9 +5,9 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions
 from WorkQueue.models import ProcessorUsedPieces
-from WorkQueue.operations import used_note_add
+from WorkQueue.operations import clone_board
+import time
 
 
 class Command(BaseCommand):
@@ -25,27 +25,14 @@ class Command(BaseCommand):
         last_proc = ProcessorUsedPieces.objects.order_by('processor').last()
         new_processor = last_proc.processor + 1
 
-        # clean-up (just in case)
-        TwoSideOptions.objects.filter(processor=new_processor).all().delete()
-
-        # copy all the TwoSideOptions
-        bulk = []
-        for options in TwoSideOptions.objects.filter(processor=source):
-            option = TwoSideOptions(
-                        processor=new_processor,
-                        segment=options.segment,
-                        two_side=options.two_side)
-            bulk.append(option)
-        # for
-        TwoSideOptions.objects.bulk_create(bulk)
-
-        work = ProcessorUsedPieces.objects.get(processor=source)
-        work.pk = None
-        work.processor = new_processor
-        work.created_from = source
-        work.save()
-
-        used_note_add(work.processor, 'DupNew from %s' % source)
+        if ProcessorUsedPieces.objects.filter(processor=source).count() == 0:
+            self.stderr.write('[ERROR] Processor %s not found' % source)
+            return
+
+        started = time.monotonic()
+        clone_board(source, new_processor, 'DupNew from %s' % source)
+        self.stderr.write('[INFO] Cloned %s to %s in %.3f seconds' % (source, new_processor,
+                                                                     time.monotonic() - started))
 
         # output only 1 thing: the new processor number
         self.stdout.write(str(new_processor))
@@ -5,7 +5,7 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2, EvalProgress
+from Pieces2x2.models import TwoSide, TwoSideOptions, SegmentOptions, Piece2x2, EvalProgress
 from Pieces2x2.helpers import LOC_CORNERS, LOC_BORDERS, LOC_HINTS, calc_segment
 from WorkQueue.operations import used_note_add
 from WorkQueue.models import ProcessorUsedPieces, Work
@@ -145,6 +145,7 @@ class Command(BaseCommand):
         if options['confirm']:
             EvalProgress.objects.all().delete()
             TwoSideOptions.objects.all().delete()
+            SegmentOptions.objects.all().delete()
             ProcessorUsedPieces.objects.all().delete()
             Work.objects.all().delete()
 
@@ -4,9 +4,11 @@
 #  All rights reserved.
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from BasePieces.models import BasePiece
 from Pieces2x2.models import TwoSide, Piece2x2
+from Pieces2x2.piece_index import write_piece_snapshot
 
 
 class Command(BaseCommand):
@@ -312,4 +314,7 @@ class Command(BaseCommand):
 
         self.stdout.write('[INFO] Generated %s Piece2x2 (includes rotation variants)' % nr)
 
+        self.stdout.write('[INFO] Writing snapshot %s' % settings.PIECE2X2_SNAPSHOT)
+        write_piece_snapshot(settings.PIECE2X2_SNAPSHOT)
+
 # end of file
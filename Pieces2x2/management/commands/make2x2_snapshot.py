@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from Pieces2x2.piece_index import write_piece_snapshot
+
+
+class Command(BaseCommand):
+
+    help = "Write the Piece2x2 and TwoSide snapshot file used by the evaluators"
+
+    def handle(self, *args, **options):
+
+        fname = settings.PIECE2X2_SNAPSHOT
+        self.stdout.write('[INFO] Writing snapshot %s' % fname)
+        count = write_piece_snapshot(fname)
+        self.stdout.write('[INFO] Snapshot contains %s Piece2x2' % count)
+
+
+# end of file
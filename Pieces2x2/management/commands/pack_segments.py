@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+from django.core.management.base import BaseCommand
+from Pieces2x2.segment_options import pack_segment_options, get_segment_option_processors, is_packed
+
+
+class Command(BaseCommand):
+
+    help = "Convert the TwoSideOptions of boards into the packed SegmentOptions form"
+
+    """
+        Only run this for boards that are not being worked on:
+        reductions made while a board is converted can get lost.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('processor', type=int, nargs='*', help='Processor number(s) to pack')
+        parser.add_argument('--all', action='store_true', help='Pack all boards')
+
+    def handle(self, *args, **options):
+
+        processors = options['processor']
+        if options['all']:
+            processors = get_segment_option_processors()
+
+        for processor in processors:
+            if is_packed(processor):
+                self.stdout.write('[INFO] Processor %s is already packed' % processor)
+                continue
+
+            count = pack_segment_options(processor)
+            if count == 0:
+                self.stderr.write('[ERROR] Processor %s not found' % processor)
+            else:
+                self.stdout.write('[INFO] Processor %s: packed %s TwoSide records' % (processor, count))
+        # for
+
+
+# end of file
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pieces2x2', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SegmentOptions',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processor', models.PositiveIntegerField()),
+                ('segment', models.PositiveSmallIntegerField()),
+                ('bits', models.BinaryField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('processor', 'segment'),
+                                                        name='segment_options_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.13 on 2026-10-18 16:40
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pieces2x2', '0002_segmentoptions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SquareWitness',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('locs', models.CharField(max_length=100)),
+                ('segment', models.PositiveSmallIntegerField()),
+                ('two_side', models.PositiveSmallIntegerField()),
+                ('p2x2_nrs', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(),
+                                                                      size=None)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('locs', 'segment', 'two_side'),
+                                                        name='square_witness_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.13 on 2026-10-18 17:30
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Pieces2x2', '0003_squarewitness'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvalCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('eval_size', models.PositiveSmallIntegerField()),
+                ('eval_loc', models.PositiveSmallIntegerField()),
+                ('processor', models.PositiveIntegerField()),
+                ('segment', models.PositiveSmallIntegerField()),
+                ('fingerprint', models.CharField(max_length=40)),
+                ('proven', django.contrib.postgres.fields.ArrayField(
+                                base_field=django.contrib.postgres.fields.ArrayField(
+                                                base_field=models.PositiveSmallIntegerField(), size=2),
+                                blank=True, default=list, size=None)),
+                ('reduced', django.contrib.postgres.fields.ArrayField(
+                                base_field=django.contrib.postgres.fields.ArrayField(
+                                                base_field=models.PositiveSmallIntegerField(), size=2),
+                                blank=True, default=list, size=None)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('processor', 'eval_size', 'eval_loc', 'segment'),
+                                                        name='eval_checkpoint_unique')],
+            },
+        ),
+    ]
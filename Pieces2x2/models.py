@@ -4,6 +4,7 @@
 #  All rights reserved.
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
 
 
@@ -48,6 +49,31 @@ class TwoSideOptions(models.Model):
     objects = models.Manager()  # for the editor only
 
 
+class SegmentOptions(models.Model):
+    """
+        Compact storage of the TwoSideOptions: one record per segment of a board.
+        The remaining TwoSide numbers are the set bits of a bitmap (bit n = TwoSide nr n).
+
+        Use the functions in Pieces2x2.segment_options to access either storage.
+    """
+
+    # which instance does this belong to?
+    processor = models.PositiveIntegerField()
+
+    # line segment around the 64 locations
+    segment = models.PositiveSmallIntegerField()        # max 32767
+
+    # bitmap over all TwoSide numbers (see SEGMENT_BITMAP_SIZE)
+    bits = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['processor', 'segment'], name='segment_options_unique'),
+        ]
+
+    objects = models.Manager()  # for the editor only
+
+
 class EvalProgress(models.Model):
 
     # size of the evaluator: 4, 9, 16, etc.
@@ -74,6 +100,72 @@ class EvalProgress(models.Model):
     objects = models.Manager()  # for the editor only
 
 
+class EvalCheckpoint(models.Model):
+    """
+        The options an evaluator job has already decided, so a restarted job can continue where it stopped.
+        Only used when the board still matches the fingerprint.
+
+        Use the Checkpointer in Pieces2x2.eval_checkpoint to access these.
+    """
+
+    # same as EvalProgress
+    eval_size = models.PositiveSmallIntegerField()        # max 32767
+    eval_loc = models.PositiveSmallIntegerField()         # max 32767
+    processor = models.PositiveIntegerField()
+
+    # segment the job works on; 0 = all segments of the evaluator
+    segment = models.PositiveSmallIntegerField()        # max 32767
+
+    # fingerprint of the options and unused base pieces when the job started
+    fingerprint = models.CharField(max_length=40)
+
+    # decided options: [[segment, two_side], ..]
+    proven = ArrayField(ArrayField(models.PositiveSmallIntegerField(), size=2), default=list, blank=True)
+    reduced = ArrayField(ArrayField(models.PositiveSmallIntegerField(), size=2), default=list, blank=True)
+
+    # last updated
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['processor', 'eval_size', 'eval_loc', 'segment'],
+                                    name='eval_checkpoint_unique'),
+        ]
+
+    objects = models.Manager()  # for the editor only
+
+
+class SquareWitness(models.Model):
+    """
+        A fill of the locations of an evaluator that shows a TwoSide on a segment can still be used.
+        Kept across evaluator runs and boards; checked against the current options before it is trusted.
+
+        Use the functions in Pieces2x2.witness_cache to access these.
+    """
+
+    # locations of the evaluator, comma separated
+    locs = models.CharField(max_length=100)
+
+    # line segment around the 64 locations
+    segment = models.PositiveSmallIntegerField()        # max 32767
+
+    # reference to a TwoSide
+    two_side = models.PositiveSmallIntegerField()       # max 32767
+
+    # Piece2x2 nr for each of the locations; 0 for a location that was already filled
+    p2x2_nrs = ArrayField(models.PositiveIntegerField())
+
+    # last time this witness was found
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['locs', 'segment', 'two_side'], name='square_witness_unique'),
+        ]
+
+    objects = models.Manager()  # for the editor only
+
+
 # TODO: Beware that Piece2x2 might be a subset with the hint pieces, used to generate the corners 4x4
 
 class Piece2x2(models.Model):
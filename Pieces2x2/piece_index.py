@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" In-memory index over the Piece2x2 table
+
+    The evaluators ask the same question for every search node:
+        "which Piece2x2 fit these side options, using only these unused base pieces?"
+
+    Instead of asking the database, the complete Piece2x2 table is loaded once per process.
+    Each Piece2x2 gets an index (0..N-1) and every question is answered with bitsets (python int):
+        - for each side position (1..4) and TwoSide nr: which Piece2x2 have that side
+        - for each base piece nr: which Piece2x2 use that base piece
+
+    Bitsets are built on first use, so only the sides touched by an evaluator take memory.
+
+    The table is taken from the snapshot file written by make2x2 when it is present and up-to-date,
+    otherwise it is streamed from the database.
+"""
+
+from django.conf import settings
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.models import TwoSide, Piece2x2
+from Pieces2x2.snapshot import (Piece2x2Snapshot, PIECE2X2_COLUMNS, PIECE2X2_FIELDS, calc_db_fingerprint,
+                                write_snapshot)
+from array import array
+from bisect import bisect_left
+import sys
+import re
+
+
+# [byte value] = bit positions that are set
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value & (1 << bit)) for value in range(256))
+
+_RE_NONZERO = re.compile(rb'[^\x00]')
+
+
+class Piece2x2Index(object):
+
+    """ Process-local copy of the Piece2x2 table with bitset lookups """
+
+    # avoid unbounded growth of the caches: each bitset can take (count / 8) bytes
+    MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+    # up to this number of side matches, the unused check is done per Piece2x2 instead of with a bitset
+    MAX_SPARSE_CHECK = 4096
+
+    def __init__(self):
+        self.count = 0
+        self.all_bits = 0
+        self.source = ''                # 'snapshot' or 'database'
+
+        # [two_sides] = nr
+        self.two_sides = dict()
+
+        # [field name] = (memoryview, buffer with .find, offset in buffer)
+        self._columns = dict()
+
+        # [idx] = value, for each Piece2x2 in the table
+        self.nrs = None
+        self.is_border = None
+        self.has_hint = None
+        self.sides = ()         # side1..side4
+        self.base_nrs = ()      # nr1..nr4
+        self.base_rots = ()     # rot1..rot4
+
+        # used while loading from the database
+        self._arrays = {name: array(typecode) for name, typecode in PIECE2X2_COLUMNS}     # [field name] = array
+
+        self._side_bits = (dict(), dict(), dict(), dict())     # [side_pos][two_side] = bitset
+        self._base_bits = dict()                               # [base nr] = bitset
+        self._base_pos_bits = dict()                           # [(pos, base nr)] = bitset
+
+        self._options_cache = dict()        # [(side_pos, frozenset(options))] = bitset
+        self._unused_cache = dict()         # [unused mask] = bitset
+        self._options_cache_bytes = 0
+        self._unused_cache_bytes = 0
+
+    def load(self):
+        """ load all Piece2x2 and TwoSide from the database """
+        for tup in Piece2x2.objects.order_by('nr').values_list(*PIECE2X2_FIELDS).iterator(chunk_size=10000):
+            self.add(*tup)
+        # for
+
+        self.two_sides = dict()
+        for nr, two_sides in TwoSide.objects.values_list('nr', 'two_sides'):
+            self.two_sides[two_sides] = nr
+        # for
+
+        self.source = 'database'
+        self.finish()
+
+    def load_snapshot(self, fname):
+        """ map the snapshot file read-only
+            returns False when the snapshot is not available or does not match the database
+        """
+        snapshot = Piece2x2Snapshot(fname)
+        if not snapshot.map() or not snapshot.is_current():
+            return False
+
+        self.count = snapshot.count
+        self.two_sides = snapshot.two_sides
+        self._columns = snapshot.columns
+        self.source = 'snapshot'
+        self._prepare()
+        return True
+
+    def add(self, nr, is_border, has_hint, side1, side2, side3, side4, nr1, nr2, nr3, nr4, rot1, rot2, rot3, rot4):
+        """ add one Piece2x2; call finish() when all have been added """
+        arrays = self._arrays
+        arrays['nr'].append(nr)
+        arrays['is_border'].append(1 if is_border else 0)
+        arrays['has_hint'].append(1 if has_hint else 0)
+
+        arrays['side1'].append(side1)
+        arrays['side2'].append(side2)
+        arrays['side3'].append(side3)
+        arrays['side4'].append(side4)
+
+        arrays['nr1'].append(nr1)
+        arrays['nr2'].append(nr2)
+        arrays['nr3'].append(nr3)
+        arrays['nr4'].append(nr4)
+
+        arrays['rot1'].append(rot1)
+        arrays['rot2'].append(rot2)
+        arrays['rot3'].append(rot3)
+        arrays['rot4'].append(rot4)
+
+    def finish(self):
+        """ prepare for use, after all Piece2x2 have been added """
+        self._columns = dict()
+        for name, typecode in PIECE2X2_COLUMNS:
+            # keep a single copy as bytes, which supports a fast find
+            raw = self._arrays[name].tobytes()
+            self._columns[name] = (memoryview(raw).cast(typecode), raw, 0)
+        # for
+        self._arrays = dict()
+        self.count = len(self._columns['nr'][0])
+        self._prepare()
+
+    def _prepare(self):
+        columns = self._columns
+        self.nrs = columns['nr'][0]
+        self.is_border = columns['is_border'][0]
+        self.has_hint = columns['has_hint'][0]
+        self.sides = tuple([columns['side%s' % pos][0] for pos in range(1, 4+1)])
+        self.base_nrs = tuple([columns['nr%s' % pos][0] for pos in range(1, 4+1)])
+        self.base_rots = tuple([columns['rot%s' % pos][0] for pos in range(1, 4+1)])
+
+        self.all_bits = (1 << self.count) - 1
+
+        self._side_bits = (dict(), dict(), dict(), dict())
+        self._base_bits = dict()
+        self._base_pos_bits = dict()
+        self._options_cache = dict()
+        self._unused_cache = dict()
+        self._options_cache_bytes = 0
+        self._unused_cache_bytes = 0
+
+    def get_columns(self):
+        """ returns [field name] = buffer, for writing a snapshot """
+        return {name: tup[0] for name, tup in self._columns.items()}
+
+    def get_twoside_nr(self, two_sides):
+        return self.two_sides[two_sides]
+
+    def get_index(self, nr):
+        """ returns the index of the Piece2x2 with this nr, or -1 when it is not in the table """
+        # the table is ordered by nr
+        idx = bisect_left(self.nrs, nr)
+        if idx < self.count and self.nrs[idx] == nr:
+            return idx
+        return -1
+
+    def _make_bits(self, field_name, wanted):
+        """ create a bitset for all indices where the field has the wanted value """
+        view, raw, offset = self._columns[field_name]
+        itemsize = view.itemsize
+        pattern = wanted.to_bytes(itemsize, sys.byteorder)
+        end = offset + self.count * itemsize
+
+        buf = bytearray((self.count + 7) // 8)
+        pos = raw.find(pattern, offset, end)
+        while pos >= 0:
+            rel = pos - offset
+            if rel % itemsize == 0:
+                idx = rel // itemsize
+                buf[idx >> 3] |= 1 << (idx & 7)
+                pos = raw.find(pattern, pos + itemsize, end)
+            else:
+                # match across two values
+                pos = raw.find(pattern, pos + 1, end)
+        # while
+        return int.from_bytes(buf, 'little')
+
+    def _get_side_bits(self, side_pos, two_side):
+        cache = self._side_bits[side_pos]
+        try:
+            bits = cache[two_side]
+        except KeyError:
+            bits = cache[two_side] = self._make_bits('side%s' % (side_pos + 1), two_side)
+        return bits
+
+    def _get_base_bits(self, base_nr):
+        try:
+            bits = self._base_bits[base_nr]
+        except KeyError:
+            bits = 0
+            for pos in range(4):
+                bits |= self._get_base_pos_bits(pos, base_nr)
+            # for
+            self._base_bits[base_nr] = bits
+        return bits
+
+    def _get_base_pos_bits(self, pos, base_nr):
+        tup = (pos, base_nr)
+        try:
+            bits = self._base_pos_bits[tup]
+        except KeyError:
+            bits = self._base_pos_bits[tup] = self._make_bits('nr%s' % (pos + 1), base_nr)
+        return bits
+
+    @staticmethod
+    def _get_bits_size(bits):
+        """ returns the approximate memory use of the bitset, in bytes """
+        return (bits.bit_length() + 7) // 8
+
+    def _get_options_bits(self, side_pos, options):
+        if len(options) == 1:
+            return self._get_side_bits(side_pos, options[0])
+
+        tup = (side_pos, frozenset(options))
+        try:
+            bits = self._options_cache[tup]
+        except KeyError:
+            bits = 0
+            for two_side in tup[1]:
+                bits |= self._get_side_bits(side_pos, two_side)
+            # for
+            size = self._get_bits_size(bits)
+            if self._options_cache_bytes + size > self.MAX_CACHE_BYTES:
+                self._options_cache = dict()
+                self._options_cache_bytes = 0
+            self._options_cache[tup] = bits
+            self._options_cache_bytes += size
+        return bits
+
+    @staticmethod
+    def _get_unused_mask(unused):
+        if isinstance(unused, PieceSet):
+            return unused.mask
+        return PieceSet(unused).mask
+
+    def get_unused_bits(self, unused):
+        """ returns the bitset of all Piece2x2 that consist only of unused base pieces
+            unused: PieceSet or list of base piece nrs
+        """
+        return self._get_unused_bits_for_mask(self._get_unused_mask(unused))
+
+    def _get_unused_bits_for_mask(self, mask):
+        try:
+            bits = self._unused_cache[mask]
+        except KeyError:
+            used_bits = 0
+            for nr in range(1, 256+1):
+                if not (mask >> nr) & 1:
+                    used_bits |= self._get_base_bits(nr)
+            # for
+            bits = self.all_bits & ~used_bits
+            size = self._get_bits_size(bits)
+            if self._unused_cache_bytes + size > self.MAX_CACHE_BYTES:
+                self._unused_cache = dict()
+                self._unused_cache_bytes = 0
+            self._unused_cache[mask] = bits
+            self._unused_cache_bytes += size
+        return bits
+
+    def _get_sides_bits(self, options_side1, options_side2, options_side3, options_side4, hint):
+        """ returns the bitset of Piece2x2 that fit the side options and hint, without the unused check """
+        bits = self.all_bits
+
+        if hint:
+            pos, base_nr = hint
+            bits &= self._get_base_pos_bits(pos - 1, base_nr)
+
+        for side_pos, options in enumerate((options_side1, options_side2, options_side3, options_side4)):
+            if not bits:
+                break
+            if options is not None:
+                bits &= self._get_options_bits(side_pos, options)
+        # for
+
+        return bits
+
+    def _iter_fit_indices(self, options_side1, options_side2, options_side3, options_side4, unused_mask, hint):
+        bits = self._get_sides_bits(options_side1, options_side2, options_side3, options_side4, hint)
+        if not bits:
+            return
+
+        if bits.bit_count() > self.MAX_SPARSE_CHECK:
+            yield from self.iter_indices(bits & self._get_unused_bits_for_mask(unused_mask))
+            return
+
+        # few candidates: check the base pieces of each candidate against the unused mask
+        used_mask = ~unused_mask
+        nrs1, nrs2, nrs3, nrs4 = self.base_nrs
+        for idx in self.iter_indices(bits):
+            if not ((1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])) & used_mask:
+                yield idx
+        # for
+
+    def fits(self, options_side1, options_side2, options_side3, options_side4, unused, hint=None):
+        """ returns the bitset of Piece2x2 that fit the side options and only use unused base pieces
+
+            options_sideN: list of TwoSide nrs, or None for no restriction on that side
+            hint: optional tuple (pos, base nr) that demands a specific base piece on position 1..4
+        """
+        bits = self._get_sides_bits(options_side1, options_side2, options_side3, options_side4, hint)
+        if bits:
+            bits &= self.get_unused_bits(unused)
+        return bits
+
+    def has_fit(self, options_side1, options_side2, options_side3, options_side4, unused, hint=None):
+        """ returns True when at least one Piece2x2 fits the side options and only uses unused base pieces
+
+            Stops at the first fit and checks the base pieces of each candidate directly,
+            so a search with a different unused set on each node does not build the unused bitset.
+        """
+        bits = self._get_sides_bits(options_side1, options_side2, options_side3, options_side4, hint)
+        if not bits:
+            return False
+
+        used_mask = ~self._get_unused_mask(unused)
+        nrs1, nrs2, nrs3, nrs4 = self.base_nrs
+        for idx in self.iter_indices(bits):
+            if not ((1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])) & used_mask:
+                return True
+        # for
+
+        return False
+
+    def fit_indices(self, options_side1, options_side2, options_side3, options_side4, unused_mask, hint=None):
+        """ returns the list of indices of the Piece2x2 that fit, for a search that tracks the unused mask itself """
+        return list(self._iter_fit_indices(options_side1, options_side2, options_side3, options_side4,
+                                           unused_mask, hint))
+
+    def get_remaining_options(self, bits, side_pos, options):
+        """ returns the options for side 1..4 that are used by at least one Piece2x2 in the bitset """
+        if bits.bit_count() < 5000:
+            # few pieces: collect the sides directly
+            sides = self.sides[side_pos - 1]
+            seen = set([sides[idx] for idx in self.iter_indices(bits)])
+            return [option for option in options if option in seen]
+
+        return [option for option in options if bits & self._get_side_bits(side_pos - 1, option)]
+
+    def get_base_nrs(self, bits, pos):
+        """ returns the sorted base nrs on position 1..4 of the Piece2x2 in the bitset """
+        if bits.bit_count() < 5000:
+            # few pieces: collect the base nrs directly
+            nrs = self.base_nrs[pos - 1]
+            return sorted(set([nrs[idx] for idx in self.iter_indices(bits)]))
+
+        return [nr for nr in range(1, 256+1) if bits & self._get_base_pos_bits(pos - 1, nr)]
+
+    def filter_base_nrs(self, bits, pos, mask):
+        """ returns the bitset with only the Piece2x2 that have a base nr from the PieceSet mask on position 1..4 """
+        if bits.bit_count() <= self.MAX_SPARSE_CHECK:
+            nrs = self.base_nrs[pos - 1]
+            for idx in self.iter_indices(bits):
+                if not (mask >> nrs[idx]) & 1:
+                    bits &= ~(1 << idx)
+            # for
+            return bits
+
+        keep = 0
+        for nr in range(1, 256+1):
+            if (mask >> nr) & 1:
+                keep |= self._get_base_pos_bits(pos - 1, nr)
+        # for
+        return bits & keep
+
+    def count_fits(self, options_side1, options_side2, options_side3, options_side4, unused, hint=None):
+        """ returns the number of Piece2x2 that fit the side options and only use unused base pieces """
+        unused_mask = self._get_unused_mask(unused)
+        count = 0
+        for _ in self._iter_fit_indices(options_side1, options_side2, options_side3, options_side4, unused_mask, hint):
+            count += 1
+        # for
+        return count
+
+    def iter_fits(self, options_side1, options_side2, options_side3, options_side4, unused, hint=None):
+        """ returns an iterator over the Piece2x2 that fit
+            the unused set is copied first, so the caller can take and give back pieces while iterating
+        """
+        unused_mask = self._get_unused_mask(unused)
+        indices = self._iter_fit_indices(options_side1, options_side2, options_side3, options_side4, unused_mask, hint)
+        return map(self.get_piece, indices)
+
+    @staticmethod
+    def iter_indices(bits):
+        """ yield the index of each set bit, lowest first """
+        if bits:
+            data = bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+            for match in _RE_NONZERO.finditer(data):
+                offset = match.start()
+                base = offset << 3
+                for bit in _BYTE_BITS[data[offset]]:
+                    yield base + bit
+            # for
+
+    def iter_pieces(self, bits):
+        for idx in self.iter_indices(bits):
+            yield self.get_piece(idx)
+        # for
+
+    def get_piece(self, idx):
+        """ returns an (unsaved) Piece2x2 filled from the index """
+        return Piece2x2(nr=self.nrs[idx],
+                        is_border=self.is_border[idx] == 1,
+                        has_hint=self.has_hint[idx] == 1,
+                        side1=self.sides[0][idx],
+                        side2=self.sides[1][idx],
+                        side3=self.sides[2][idx],
+                        side4=self.sides[3][idx],
+                        nr1=self.base_nrs[0][idx],
+                        nr2=self.base_nrs[1][idx],
+                        nr3=self.base_nrs[2][idx],
+                        nr4=self.base_nrs[3][idx],
+                        rot1=self.base_rots[0][idx],
+                        rot2=self.base_rots[1][idx],
+                        rot3=self.base_rots[2][idx],
+                        rot4=self.base_rots[3][idx])
+
+
+def write_piece_snapshot(fname):
+    """ load the Piece2x2 and TwoSide tables from the database and write them as a snapshot file """
+    fingerprint = calc_db_fingerprint()
+    index = Piece2x2Index()
+    index.load()
+    write_snapshot(fname, index.count, index.get_columns(), index.two_sides, fingerprint)
+    return index.count
+
+
+_piece_index = None
+_twoside_nrs = None
+
+
+def get_twoside_nrs():
+    """ returns [two_sides] = nr for all TwoSide, loaded once per process """
+    global _twoside_nrs
+    if _twoside_nrs is None:
+        if _piece_index is not None:
+            _twoside_nrs = _piece_index.two_sides
+        else:
+            _twoside_nrs = dict(TwoSide.objects.values_list('two_sides', 'nr'))
+    return _twoside_nrs
+
+
+def get_twoside_nr(two_sides):
+    return get_twoside_nrs()[two_sides]
+
+
+def get_piece_index():
+    """ returns the process-wide Piece2x2Index, loading it on first use """
+    global _piece_index
+    if _piece_index is None:
+        index = Piece2x2Index()
+        if not index.load_snapshot(settings.PIECE2X2_SNAPSHOT):
+            index.load()
+        _piece_index = index
+    return _piece_index
+
+
+# end of file
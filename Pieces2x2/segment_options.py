@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Access to the remaining TwoSide options of each segment of a board
+
+    A board keeps its options in one of two forms:
+        TwoSideOptions: one record per (segment, two_side)           (init_segments, older boards)
+        SegmentOptions: one record per segment with a bitmap         (boards created by duplication, pack_segments)
+
+    A board with SegmentOptions records is "packed" and has no TwoSideOptions records.
+    The functions below work for both, so the evaluators do not need to know which one is used.
+"""
+
+from django.db import connection, transaction
+from django.db.models import Count
+from Pieces2x2.models import TwoSideOptions, SegmentOptions
+
+# size of the bitmap in bytes; room for TwoSide nr 0..511
+SEGMENT_BITMAP_SIZE = 64
+
+# segments used by calc_segment
+SEGMENT_NRS = tuple(range(1, 165+1))
+
+
+def encode_two_sides(two_sides):
+    """ returns the bitmap for the given TwoSide numbers """
+    value = 0
+    for two_side in two_sides:
+        value |= 1 << two_side
+    # for
+    return value.to_bytes(SEGMENT_BITMAP_SIZE, 'little')
+
+
+def decode_two_sides(bits):
+    """ returns the TwoSide numbers present in the bitmap """
+    value = int.from_bytes(bytes(bits), 'little')
+    two_sides = []
+    while value:
+        low = value & -value
+        two_sides.append(low.bit_length() - 1)
+        value ^= low
+    # while
+    return frozenset(two_sides)
+
+
+def _count_two_sides(bits):
+    return int.from_bytes(bytes(bits), 'little').bit_count()
+
+
+def _load_two_side_records(processor):
+    """ returns [segment] = [two_side, ..] from the TwoSideOptions records of a board """
+    seg2options = dict()
+    for segment, two_side in (TwoSideOptions
+                              .objects
+                              .filter(processor=processor)
+                              .order_by('segment', 'two_side')
+                              .values_list('segment', 'two_side')):
+        try:
+            seg2options[segment].append(two_side)
+        except KeyError:
+            seg2options[segment] = [two_side]
+    # for
+    return seg2options
+
+
+def is_packed(processor):
+    return SegmentOptions.objects.filter(processor=processor).exists()
+
+
+def load_segment_options(processor):
+    """ load the remaining options for all segments of a board with a single query
+        returns [segment] = frozenset(two_side, ..), with an empty set for segments without options
+    """
+    seg2options = dict()
+    for segment in SEGMENT_NRS:
+        seg2options[segment] = frozenset()
+    # for
+
+    packed = False
+    for segment, bits in (SegmentOptions
+                          .objects
+                          .filter(processor=processor)
+                          .values_list('segment', 'bits')):
+        seg2options[segment] = decode_two_sides(bits)
+        packed = True
+    # for
+
+    if not packed:
+        for segment, options in _load_two_side_records(processor).items():
+            seg2options[segment] = frozenset(options)
+        # for
+
+    return seg2options
+
+
+def count_segment_options(processor):
+    """ returns the number of remaining options for a board """
+    count = 0
+    packed = False
+    for bits in SegmentOptions.objects.filter(processor=processor).values_list('bits', flat=True):
+        count += _count_two_sides(bits)
+        packed = True
+    # for
+
+    if not packed:
+        count = TwoSideOptions.objects.filter(processor=processor).count()
+
+    return count
+
+
+def get_segment_option_counts():
+    """ returns [processor] = number of remaining options, for all boards """
+    counts = dict()
+    for processor, bits in SegmentOptions.objects.values_list('processor', 'bits').iterator():
+        try:
+            counts[processor] += _count_two_sides(bits)
+        except KeyError:
+            counts[processor] = _count_two_sides(bits)
+    # for
+
+    for obj in TwoSideOptions.objects.values('processor').annotate(count=Count('processor')):
+        processor = obj['processor']
+        counts[processor] = counts.get(processor, 0) + obj['count']
+    # for
+
+    return counts
+
+
+def get_segment_option_processors():
+    """ returns the sorted list of processors that have options """
+    processors = set(SegmentOptions.objects.distinct('processor').order_by('processor')
+                     .values_list('processor', flat=True))
+    processors.update(TwoSideOptions.objects.distinct('processor').order_by('processor')
+                      .values_list('processor', flat=True))
+    return sorted(processors)
+
+
+def has_segment_option(processor, segment, two_side):
+    """ returns True when the option is still available for the segment """
+    bits = SegmentOptions.objects.filter(processor=processor, segment=segment).values_list('bits', flat=True).first()
+    if bits is None:
+        # not packed
+        return TwoSideOptions.objects.filter(processor=processor, segment=segment, two_side=two_side).exists()
+
+    return two_side in decode_two_sides(bits)
+
+
+def remove_segment_options(processor, segment, two_sides):
+    """ remove options from one segment of a board
+
+        for a packed board this is a single UPDATE that clears the bits,
+        so concurrent reductions of the same segment cannot undo each other.
+    """
+    two_sides = list(two_sides)
+    if len(two_sides) == 0:
+        return
+
+    expr = 'bits'
+    for _ in two_sides:
+        expr = 'set_bit(%s, %%s, 0)' % expr
+    # for
+
+    sql = 'UPDATE "%s" SET bits = %s WHERE processor = %%s AND segment = %%s' % (SegmentOptions._meta.db_table, expr)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, two_sides + [processor, segment])
+        updated = cursor.rowcount
+    # with
+
+    if updated == 0:
+        # not packed
+        TwoSideOptions.objects.filter(processor=processor, segment=segment, two_side__in=two_sides).delete()
+
+
+def store_segment_options(processor, seg2options):
+    """ store the options of a board in packed form, replacing what is stored for that board
+        seg2options: [segment] = [two_side, ..]
+    """
+    bulk = [SegmentOptions(processor=processor, segment=segment, bits=encode_two_sides(two_sides))
+            for segment, two_sides in seg2options.items()]
+
+    with transaction.atomic():
+        delete_segment_options(processor)
+        SegmentOptions.objects.bulk_create(bulk)
+    # atomic
+
+    return len(bulk)
+
+
+def copy_segment_options(source, processor):
+    """ copy the options of a board to a new board (in packed form)
+        returns the number of segments copied
+    """
+    if is_packed(source):
+        table = SegmentOptions._meta.db_table
+        with transaction.atomic():
+            delete_segment_options(processor)
+            with connection.cursor() as cursor:
+                cursor.execute('INSERT INTO "%s" (processor, segment, bits) '
+                               'SELECT %%s, segment, bits FROM "%s" WHERE processor = %%s' % (table, table),
+                               [processor, source])
+                count = cursor.rowcount
+            # with
+        # atomic
+        return count
+
+    seg2options = _load_two_side_records(source)
+    if len(seg2options) == 0:
+        return 0
+
+    return store_segment_options(processor, seg2options)
+
+
+def pack_segment_options(processor):
+    """ convert the TwoSideOptions records of a board into the packed form
+        returns the number of TwoSideOptions records that were replaced
+    """
+    seg2options = _load_two_side_records(processor)
+    count = sum([len(two_sides) for two_sides in seg2options.values()])
+    if count > 0:
+        store_segment_options(processor, seg2options)
+
+    return count
+
+
+def delete_segment_options(processor):
+    """ remove all options of a board, in either form """
+    SegmentOptions.objects.filter(processor=processor).delete()
+    TwoSideOptions.objects.filter(processor=processor).delete()
+
+
+# end of file
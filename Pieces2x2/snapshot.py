@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Binary snapshot of the Piece2x2 and TwoSide tables
+
+    Written by make2x2 (or make2x2_snapshot) and mapped read-only by the evaluators,
+    so all workers share one page-cached copy instead of each streaming the table from the database.
+
+    File layout (version 1, native byte order, recorded in the header):
+        header: magic, version, byte order, piece count, twoside count, database fingerprint
+        one fixed-width array per Piece2x2 field, each starting at an 8-byte boundary
+        TwoSide nrs + two_sides (2 characters each)
+
+    The fingerprint is taken from the database when the snapshot is written
+    and is checked again when the snapshot is mapped, to detect a stale snapshot.
+    It covers all rows of both tables, so any change to a Piece2x2 makes the snapshot stale.
+"""
+
+from django.db import connection
+from Pieces2x2.models import TwoSide, Piece2x2
+import hashlib
+import struct
+import mmap
+import sys
+import os
+
+SNAPSHOT_MAGIC = b'E2P2X2SN'
+SNAPSHOT_VERSION = 1
+
+# magic, version, byte order (1=little, 2=big), piece count, twoside count, fingerprint
+_HEADER = struct.Struct('<8sHHII32s')
+_HEADER_SIZE = 64
+
+# Piece2x2 fields in the snapshot, with the array typecode
+PIECE2X2_COLUMNS = (('nr', 'I'),
+                    ('is_border', 'B'), ('has_hint', 'B'),
+                    ('side1', 'H'), ('side2', 'H'), ('side3', 'H'), ('side4', 'H'),
+                    ('nr1', 'H'), ('nr2', 'H'), ('nr3', 'H'), ('nr4', 'H'),
+                    ('rot1', 'B'), ('rot2', 'B'), ('rot3', 'B'), ('rot4', 'B'))
+
+PIECE2X2_FIELDS = tuple([name for name, _ in PIECE2X2_COLUMNS])
+
+_ITEMSIZE = {'B': 1, 'H': 2, 'I': 4}
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _calc_piece2x2_checksum():
+    """ returns the number of Piece2x2 rows and a checksum over all of them
+
+        PostgreSQL computes the checksum as the sum of an md5-derived number per row, in a single table scan,
+        so the rows do not have to be sent to the worker (and no huge string has to be aggregated).
+        Other databases: all rows are hashed here.
+    """
+    if connection.vendor == 'postgresql':
+        sql = """SELECT COUNT(*),
+                        COALESCE(SUM(('x' || LEFT(MD5(CONCAT_WS(',', {fields})), 15))::bit(60)::bigint), 0)::text
+                 FROM {table}""".format(fields=', '.join(PIECE2X2_FIELDS),
+                                        table=connection.ops.quote_name(Piece2x2._meta.db_table))
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            count, checksum = cursor.fetchone()
+        return count, checksum
+
+    digest = hashlib.sha256()
+    count = 0
+    for tup in Piece2x2.objects.order_by('nr').values_list(*PIECE2X2_FIELDS).iterator(chunk_size=10000):
+        digest.update(repr(tup).encode())
+        count += 1
+    # for
+    return count, digest.hexdigest()
+
+
+def calc_db_fingerprint():
+    """ fingerprint of the complete Piece2x2 and TwoSide tables """
+    digest = hashlib.sha256()
+
+    for tup in TwoSide.objects.order_by('nr').values_list('nr', 'two_sides'):
+        digest.update(repr(tup).encode())
+    # for
+
+    digest.update(repr(_calc_piece2x2_checksum()).encode())
+
+    return digest.digest()
+
+
+def write_snapshot(fname, count, columns, two_sides, fingerprint):
+    """ write a new snapshot file
+
+        columns: [field name] = buffer with count values, using the typecode from PIECE2X2_COLUMNS
+        two_sides: [two_sides] = nr
+
+        The file is written under a temporary name and then moved in place,
+        so running evaluators keep their existing mapping.
+    """
+    byte_order = 1 if sys.byteorder == 'little' else 2
+    twosides = sorted([(nr, two) for two, nr in two_sides.items()])
+
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'wb') as f:
+        header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, byte_order, count, len(twosides), fingerprint)
+        f.write(header)
+        offset = _HEADER_SIZE
+        f.write(bytes(offset - len(header)))
+
+        for name, typecode in PIECE2X2_COLUMNS:
+            data = memoryview(columns[name]).cast('B')
+            if len(data) != count * _ITEMSIZE[typecode]:
+                raise ValueError('Snapshot column %s has unexpected size' % name)
+            f.write(data)
+            offset += len(data)
+            padded = _align(offset)
+            f.write(bytes(padded - offset))
+            offset = padded
+        # for
+
+        f.write(b''.join([struct.pack('=H', nr) for nr, _ in twosides]))
+        f.write(b''.join([two.encode('ascii') for _, two in twosides]))
+    # with
+
+    os.replace(tmp_fname, fname)
+
+
+class Piece2x2Snapshot(object):
+
+    """ Read-only mapping of a snapshot file """
+
+    def __init__(self, fname):
+        self.fname = fname
+        self.count = 0
+        self.fingerprint = b''
+        self.columns = dict()       # [field name] = (memoryview, mmap, offset)
+        self.two_sides = dict()     # [two_sides] = nr
+        self._mm = None
+
+    def map(self):
+        """ returns False when the file is missing, of another version or truncated """
+        try:
+            with open(self.fname, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+
+        mm = self._mm
+        if len(mm) < _HEADER_SIZE:
+            return False
+
+        magic, version, byte_order, count, twoside_count, fingerprint = _HEADER.unpack_from(mm, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            return False
+
+        if byte_order != (1 if sys.byteorder == 'little' else 2):
+            return False
+
+        offset = _HEADER_SIZE
+        for name, typecode in PIECE2X2_COLUMNS:
+            size = count * _ITEMSIZE[typecode]
+            if offset + size > len(mm):
+                return False
+            view = memoryview(mm)[offset:offset + size].cast(typecode)
+            self.columns[name] = (view, mm, offset)
+            offset = _align(offset + size)
+        # for
+
+        if offset + twoside_count * 4 > len(mm):
+            return False
+
+        nrs = memoryview(mm)[offset:offset + twoside_count * 2].cast('H')
+        offset += twoside_count * 2
+        for idx in range(twoside_count):
+            two = mm[offset + idx * 2:offset + idx * 2 + 2].decode('ascii')
+            self.two_sides[two] = nrs[idx]
+        # for
+
+        self.count = count
+        self.fingerprint = fingerprint
+        return True
+
+    def is_current(self):
+        """ verify the snapshot was made from the Piece2x2/TwoSide tables currently in the database """
+        return self.fingerprint == calc_db_fingerprint()
+
+
+# end of file
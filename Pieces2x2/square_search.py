@@ -0,0 +1,672 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" In-memory search for a set of board locations
+
+    The evaluators for 4, 9, 16 and 25 locations and the 4 corners all ask the same question:
+        "can these locations still be filled, with this TwoSide on this segment?"
+
+    The search works on Piece2x2 indices of the Piece2x2Index and a bitmask of the unused base pieces,
+    so no Piece2x2 objects are created and nothing is asked from the database.
+
+    The neighbours and segments of each position are calculated once.
+    Each empty position keeps its list of candidates:
+        - placing a piece only recalculates the candidates of its empty neighbours (forward checking);
+          when one of them has no candidates left, the placement is undone before recursing
+        - removing a piece restores the candidate lists of its neighbours
+        - the search continues with the position that has the fewest candidates (MRV)
+
+    The candidate lists do not follow the base pieces used elsewhere on the board;
+    these are skipped while iterating over the candidates.
+
+    Each successful search leaves its fill of the locations in .witness.
+    Witnesses of earlier runs (see Pieces2x2.witness_cache) can be put in .witnesses;
+    has_solution first checks whether the witness still fits, before it starts a search.
+    A fill proves the TwoSide it has on each segment, not only the one that was asked for;
+    these are kept in .proven, so the other segments of the same fill need no search.
+
+    For the profiling report (see WorkQueue.profiling) the search counts the nodes, the candidates it
+    generated, the placements that were undone by forward checking and the number of nodes per depth.
+
+    The options of a segment can be evaluated in parallel with a SquareSearchPool:
+    each worker process has its own copy of the search and the read-only piece index, inherited by fork.
+
+    The BudgetScheduler gives all options of a segment a short time slice first and only spends
+    more time on the options that are not decided yet, so the easy reductions are found first.
+
+            side1
+          +-------+
+    side4 |  p_nr | side2           p_nr = index in locs
+          +-------+
+            side3
+"""
+
+from Pieces2x2.helpers import calc_segment, LOC_NEIGHBOURS
+from Pieces2x2.piece_index import get_piece_index
+import multiprocessing
+import time
+
+
+# [loc] = (position in the Piece2x2, base nr) of the hint piece
+LOC_HINTS = {
+    36: (2, 139),
+    10: (1, 208),
+    15: (2, 255),
+    50: (3, 181),
+    55: (4, 249),
+}
+
+# [side_pos] = side_pos of the neighbour that touches it
+_OPPOSITE = (2, 3, 0, 1)
+
+# board value for a position that was already filled before the search
+_FIXED = -2
+
+
+class SquareSearch(object):
+
+    """ Search for a fill of a set of board locations """
+
+    # check the time limit and call on_tick after this many nodes
+    CHECK_INTERVAL = 256
+
+    def __init__(self, locs, seg2options, unused, piece_index=None):
+        """
+            locs: board locations (1..64) to fill
+            seg2options: [segment] = options, as returned by load_segment_options
+            unused: PieceSet with the base pieces available to this search
+        """
+        self.piece_index = piece_index or get_piece_index()
+        self.locs = tuple(locs)
+        self.size = len(self.locs)
+
+        # [p_nr] = (p_nr on side1..4, or -1 when not part of the search)
+        self.neighbours = tuple([tuple([self.locs.index(n_loc) if n_loc in self.locs else -1
+                                        for n_loc in LOC_NEIGHBOURS[loc]])
+                                 for loc in self.locs])
+
+        # [p_nr] = (segment of side1..4)
+        self.segments = tuple([tuple([calc_segment(loc, side_nr) for side_nr in (1, 2, 3, 4)])
+                               for loc in self.locs])
+
+        # [p_nr] = hint or None
+        self.hints = tuple([LOC_HINTS.get(loc, None) for loc in self.locs])
+
+        # [segment] = [two_side, ..]
+        self.seg2options = dict()
+        for segments in self.segments:
+            for segment in segments:
+                self.seg2options[segment] = sorted(seg2options[segment])
+        # for
+
+        # [p_nr] = [options side1..4]
+        self.options = [[self.seg2options[segment] for segment in segments] for segments in self.segments]
+
+        self.unused_mask = unused.mask
+        self._start_unused = unused
+        self.board = [-1] * self.size                 # [p_nr] = Piece2x2 index, -1 when empty
+        self.board_sides = [None] * self.size         # [p_nr] = (side1, side2, side3, side4)
+        self.board_order = []                         # p_nr in the order they were filled
+        self.empty_count = self.size
+
+        # [p_nr] = [Piece2x2 index, ..] for empty positions next to a filled position, otherwise None
+        self.candidates = [None] * self.size
+        self._undo = []                 # per placement: [(p_nr, previous candidates), ..]
+
+        # [p_nr] = number of candidates without any filled neighbour (calculated on first use)
+        self._static_counts = [None] * self.size
+
+        # p_nr to fill first, before deciding by the number of candidates
+        self.preferred_order = []
+
+        # optional limits; a search that is stopped is reported as "solution possible"
+        self.deadline = 0.0             # time.monotonic() value; 0 = none
+        self.on_tick = None             # function(search) called every tick_seconds; return True to stop
+        self.tick_seconds = 30
+        self.stopped = False
+        self.timed_out = False          # last has_solution was stopped by the time limit
+
+        self.nodes = 0
+        self.candidates_count = 0       # length of all candidate lists generated
+        self.pruned = 0                 # placements undone because a neighbour had no candidates left
+        self.depth_counts = [0] * (self.size + 1)   # [number of filled positions] = nodes
+        self._next_tick = 0.0
+
+        # [(segment, two_side)] = (Piece2x2 nr for each p_nr, 0 = filled before the search)
+        self.witnesses = dict()
+        self.witness = None             # fill found by the last has_solution, or None
+        self.proven = dict()            # [(segment, two_side)] = fill found during this run
+        self.witness_hits = 0
+        self.witness_misses = 0
+
+        self._find_filled_locs()
+
+    def _find_filled_locs(self):
+        """ locations with a single option on each side are already filled """
+        for p_nr in range(self.size):
+            options = self.options[p_nr]
+            if all([len(side_options) == 1 for side_options in options]):
+                self.board[p_nr] = _FIXED
+                self.board_sides[p_nr] = tuple([side_options[0] for side_options in options])
+                self.board_order.append(p_nr)
+                self.empty_count -= 1
+        # for
+
+    def is_filled(self, p_nr):
+        return self.board[p_nr] != -1
+
+    def get_side_options(self, p_nr, side_nr):
+        """ returns the options for side 1..4 of a position """
+        return self.options[p_nr][side_nr - 1]
+
+    def calc_variation(self):
+        """ returns a number that is different for each state of the options """
+        return sum([sum(options) for options in self.seg2options.values()])
+
+    def get_solve_order(self):
+        """ returns the locations in the order they were filled """
+        return [self.locs[p_nr] for p_nr in self.board_order]
+
+    def _get_options_sides(self, p_nr):
+        options = self.options[p_nr]
+        options_side = [options[0], options[1], options[2], options[3]]
+        for side_pos, n_nr in enumerate(self.neighbours[p_nr]):
+            if n_nr >= 0:
+                sides = self.board_sides[n_nr]
+                if sides:
+                    options_side[side_pos] = [sides[_OPPOSITE[side_pos]]]
+        # for
+        return options_side
+
+    def _get_candidates(self, p_nr):
+        """ returns the list of Piece2x2 indices that fit on this position """
+        options_side = self._get_options_sides(p_nr)
+        candidates = self.piece_index.fit_indices(options_side[0], options_side[1], options_side[2],
+                                                  options_side[3], self.unused_mask, self.hints[p_nr])
+        self.candidates_count += len(candidates)
+        return candidates
+
+    def _get_count(self, p_nr):
+        """ returns the (estimated) number of candidates of an empty position """
+        candidates = self.candidates[p_nr]
+        if candidates is not None:
+            return len(candidates)
+
+        count = self._static_counts[p_nr]
+        if count is None:
+            options_side = self._get_options_sides(p_nr)
+            bits = self.piece_index.fits(options_side[0], options_side[1], options_side[2], options_side[3],
+                                         self._start_unused, self.hints[p_nr])
+            count = self._static_counts[p_nr] = bits.bit_count()
+        return count
+
+    def _place(self, p_nr, idx):
+        """ put a piece on the board and update the candidates of the empty neighbours
+            returns False when a neighbour has no candidates left
+        """
+        index = self.piece_index
+        nrs1, nrs2, nrs3, nrs4 = index.base_nrs
+        sides1, sides2, sides3, sides4 = index.sides
+        self.unused_mask ^= (1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])
+        self.board[p_nr] = idx
+        self.board_sides[p_nr] = (sides1[idx], sides2[idx], sides3[idx], sides4[idx])
+        self.board_order.append(p_nr)
+        self.empty_count -= 1
+
+        is_possible = True
+        undo = []
+        for n_nr in self.neighbours[p_nr]:
+            if n_nr >= 0 and self.board[n_nr] == -1:
+                undo.append((n_nr, self.candidates[n_nr]))
+                candidates = self.candidates[n_nr] = self._get_candidates(n_nr)
+                if not candidates:
+                    self.pruned += 1
+                    is_possible = False
+                    break
+        # for
+        self._undo.append(undo)
+
+        return is_possible
+
+    def _pop(self):
+        for n_nr, candidates in self._undo.pop():
+            self.candidates[n_nr] = candidates
+        # for
+
+        p_nr = self.board_order.pop()
+        idx = self.board[p_nr]
+        nrs1, nrs2, nrs3, nrs4 = self.piece_index.base_nrs
+        self.unused_mask |= (1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])
+        self.board[p_nr] = -1
+        self.board_sides[p_nr] = None
+        self.empty_count += 1
+
+    def _select(self):
+        """ returns the empty position to fill next """
+        board = self.board
+
+        for p_nr in self.preferred_order:
+            if board[p_nr] == -1:
+                return p_nr
+        # for
+
+        best_p_nr = -1
+        best_count = -1
+        for p_nr in range(self.size):
+            if board[p_nr] == -1:
+                count = self._get_count(p_nr)
+                if best_count < 0 or count < best_count:
+                    best_p_nr = p_nr
+                    best_count = count
+        # for
+
+        return best_p_nr
+
+    def _check_limits(self):
+        tick = time.monotonic()
+        if self.deadline and tick > self.deadline:
+            self.stopped = True
+            self.timed_out = True
+        elif self.on_tick and tick > self._next_tick:
+            self._next_tick = tick + self.tick_seconds
+            if self.on_tick(self):
+                self.stopped = True
+
+    def _try_candidates(self, p_nr, candidates):
+        """ returns True when one of the candidates on p_nr leads to a solution """
+        nrs1, nrs2, nrs3, nrs4 = self.piece_index.base_nrs
+        for idx in candidates:
+            bits = (1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])
+            if self.unused_mask & bits != bits:
+                # base piece was used elsewhere on the board
+                continue
+
+            if self._place(p_nr, idx):
+                found = self._search()
+            else:
+                found = False
+            self._pop()
+
+            if found:
+                return True
+        # for
+
+        return False
+
+    def _search(self):
+        self.nodes += 1
+        self.depth_counts[len(self.board_order)] += 1
+        if self.nodes % self.CHECK_INTERVAL == 0:
+            self._check_limits()
+        if self.stopped:
+            return True
+
+        if self.empty_count == 0:
+            nrs = self.piece_index.nrs
+            self.witness = tuple([0 if idx == _FIXED else nrs[idx] for idx in self.board])
+            return True
+
+        p_nr = self._select()
+        candidates = self.candidates[p_nr]
+        if candidates is None:
+            # no filled neighbours
+            candidates = self._get_candidates(p_nr)
+
+        return self._try_candidates(p_nr, candidates)
+
+    def _is_witness(self, witness, p_nr, side_nr, two_side):
+        """ returns True when the witness still fits the options and the unused base pieces """
+        if len(witness) != self.size:
+            return False
+
+        index = self.piece_index
+        nrs1, nrs2, nrs3, nrs4 = index.base_nrs
+        sides1, sides2, sides3, sides4 = index.sides
+        used_mask = 0
+        fill = []           # [p_nr] = (side1, side2, side3, side4)
+        for p_nr2, nr in enumerate(witness):
+            if self.board[p_nr2] == _FIXED:
+                fill.append(self.board_sides[p_nr2])
+                continue
+
+            idx = index.get_index(nr) if nr else -1
+            if idx < 0:
+                return False
+
+            bits = (1 << nrs1[idx]) | (1 << nrs2[idx]) | (1 << nrs3[idx]) | (1 << nrs4[idx])
+            if used_mask & bits or self.unused_mask & bits != bits:
+                return False
+            used_mask |= bits
+
+            hint = self.hints[p_nr2]
+            if hint and index.base_nrs[hint[0] - 1][idx] != hint[1]:
+                return False
+
+            sides = (sides1[idx], sides2[idx], sides3[idx], sides4[idx])
+            for side, options in zip(sides, self.options[p_nr2]):
+                if side not in options:
+                    return False
+            # for
+            fill.append(sides)
+        # for
+
+        # the neighbours must match
+        for p_nr2, neighbours in enumerate(self.neighbours):
+            for side_pos, n_nr in enumerate(neighbours):
+                if n_nr >= 0 and fill[p_nr2][side_pos] != fill[n_nr][_OPPOSITE[side_pos]]:
+                    return False
+            # for
+        # for
+
+        return fill[p_nr][side_nr - 1] == two_side
+
+    def _get_fill_sides(self, witness):
+        """ returns [p_nr] = (side1, side2, side3, side4) of a witness """
+        index = self.piece_index
+        sides1, sides2, sides3, sides4 = index.sides
+        fill = []
+        for p_nr, nr in enumerate(witness):
+            if nr:
+                idx = index.get_index(nr)
+                fill.append((sides1[idx], sides2[idx], sides3[idx], sides4[idx]))
+            else:
+                fill.append(self.board_sides[p_nr])
+        # for
+        return fill
+
+    def add_proven(self, witness):
+        """ remember the witness for each (segment, two_side) it contains """
+        for segments, sides in zip(self.segments, self._get_fill_sides(witness)):
+            for segment, side in zip(segments, sides):
+                self.proven.setdefault((segment, side), witness)
+            # for
+        # for
+
+    def find_witness(self, p_nr, side_nr, two_side):
+        """ returns a known witness that still fits, or None """
+        key = (self.segments[p_nr][side_nr - 1], two_side)
+        for witnesses in (self.proven, self.witnesses):
+            witness = witnesses.get(key, None)
+            if witness and self._is_witness(witness, p_nr, side_nr, two_side):
+                return witness
+        # for
+        return None
+
+    def has_solution(self, p_nr, side_nr, two_side, time_limit=0):
+        """ returns True when the locations can be filled with the two_side on side 1..4 of position p_nr
+            also returns True when the search was stopped by the time limit or on_tick
+        """
+        self.witness = None
+        self.timed_out = False
+
+        if self.board[p_nr] != -1:
+            # already filled
+            return self.board_sides[p_nr][side_nr - 1] == two_side
+
+        witness = self.find_witness(p_nr, side_nr, two_side)
+        if witness:
+            self.witness_hits += 1
+            self.witness = witness
+            return True
+        self.witness_misses += 1
+
+        self.stopped = False
+        self.deadline = time.monotonic() + time_limit if time_limit else 0.0
+        self._next_tick = time.monotonic() + self.tick_seconds
+
+        # start with the candidates next to the locations that were already filled
+        self.candidates = [None] * self.size
+        for p_nr2 in range(self.size):
+            if self.board[p_nr2] == -1:
+                for n_nr in self.neighbours[p_nr2]:
+                    if n_nr >= 0 and self.board[n_nr] != -1:
+                        self.candidates[p_nr2] = self._get_candidates(p_nr2)
+                        break
+                # for
+        # for
+
+        options = self.options[p_nr]
+        keep = options[side_nr - 1]
+        options[side_nr - 1] = [two_side]
+        try:
+            found = self._try_candidates(p_nr, self._get_candidates(p_nr))
+        finally:
+            options[side_nr - 1] = keep
+
+        if self.witness:
+            self.add_proven(self.witness)
+
+        return found
+
+    def get_counters(self):
+        """ returns the counters of the search as a list, to calculate the work done by a part of the search """
+        return ([self.nodes, self.candidates_count, self.pruned, self.witness_hits, self.witness_misses]
+                + self.depth_counts)
+
+    def add_counters(self, delta):
+        """ add the difference of two get_counters results, from the search in a worker process """
+        self.nodes += delta[0]
+        self.candidates_count += delta[1]
+        self.pruned += delta[2]
+        self.witness_hits += delta[3]
+        self.witness_misses += delta[4]
+        for depth, count in enumerate(delta[5:]):
+            self.depth_counts[depth] += count
+        # for
+
+    def iter_results(self, p_nr, side_nr, two_sides, time_limit=0):
+        """ yields (two_side, found, timed_out, nodes, seconds) for each two_side; see has_solution
+            the witness of each result is in .witness
+        """
+        for two_side in two_sides:
+            nodes = self.nodes
+            start = time.monotonic()
+            found = self.has_solution(p_nr, side_nr, two_side, time_limit)
+            yield two_side, found, self.timed_out, self.nodes - nodes, time.monotonic() - start
+        # for
+
+    def iter_has_solution(self, p_nr, side_nr, two_sides, time_limit=0):
+        """ yields (two_side, found) for each two_side; see has_solution
+            the witness of each result is in .witness
+        """
+        for two_side, found, _, _, _ in self.iter_results(p_nr, side_nr, two_sides, time_limit):
+            yield two_side, found
+        # for
+
+
+# state of a SquareSearchPool worker process
+_worker_search = None
+_worker_generation = None           # shared with the parent; changes when the results are no longer needed
+_worker_task_generation = 0
+
+
+def _worker_init(search, generation):
+    global _worker_search, _worker_generation
+    _worker_search = search
+    _worker_generation = generation
+    search.on_tick = _worker_on_tick
+    search.tick_seconds = 1
+
+
+def _worker_on_tick(_search):
+    # stop searching when the parent is no longer interested in the result
+    return _worker_generation.value != _worker_task_generation
+
+
+def _worker_has_solution(task):
+    global _worker_task_generation
+    generation, p_nr, side_nr, two_side, time_limit = task
+
+    if _worker_generation.value != generation:
+        # skipped: result is not used
+        return two_side, True, False, 0.0, None, None
+
+    _worker_task_generation = generation
+    search = _worker_search
+    before = search.get_counters()
+    start = time.monotonic()
+    found = search.has_solution(p_nr, side_nr, two_side, time_limit)
+    seconds = time.monotonic() - start
+    delta = [count - count_before for count, count_before in zip(search.get_counters(), before)]
+    return two_side, found, search.timed_out, seconds, search.witness, delta
+
+
+class SquareSearchPool(object):
+
+    """ Evaluate the options of a segment in parallel worker processes
+
+        Only the parent process talks to the database: it receives the results and decides on the reductions.
+        The on_tick of the search is called in the parent while waiting for results.
+    """
+
+    def __init__(self, search, jobs):
+        self.search = search
+
+        # fork: the workers inherit the search and the piece index without pickling
+        context = multiprocessing.get_context('fork')
+        self._generation = context.RawValue('i', 0)
+        self._pool = context.Pool(jobs, initializer=_worker_init, initargs=(search, self._generation))
+
+    def iter_results(self, p_nr, side_nr, two_sides, time_limit=0):
+        """ yields (two_side, found, timed_out, nodes, seconds) for each two_side,
+            in the order the searches complete
+            the witness of each result is in search.witness
+            stopping the iteration early also stops the searches that are still running
+        """
+        search = self.search
+        generation = self._generation.value
+        tasks = []
+        proven = []
+        for two_side in two_sides:
+            witness = search.find_witness(p_nr, side_nr, two_side)
+            if witness:
+                # no need to search
+                proven.append((two_side, witness))
+            else:
+                tasks.append((generation, p_nr, side_nr, two_side, time_limit))
+        # for
+
+        results = self._pool.imap_unordered(_worker_has_solution, tasks)
+        todo = len(tasks)
+        try:
+            for two_side, witness in proven:
+                search.witness_hits += 1
+                search.witness = witness
+                yield two_side, True, False, 0, 0.0
+            # for
+
+            while todo > 0:
+                try:
+                    result = results.next(timeout=search.tick_seconds)
+                except multiprocessing.TimeoutError:
+                    if search.on_tick and search.on_tick(search):
+                        return
+                    continue
+
+                two_side, found, timed_out, seconds, witness, delta = result
+                nodes = 0
+                if delta:
+                    search.add_counters(delta)
+                    nodes = delta[0]
+                search.witness = witness
+                if witness:
+                    search.add_proven(witness)
+                todo -= 1
+                yield two_side, found, timed_out, nodes, seconds
+            # while
+        finally:
+            self._generation.value = generation + 1
+
+    def iter_has_solution(self, p_nr, side_nr, two_sides, time_limit=0):
+        """ yields (two_side, found) for each two_side, in the order the searches complete """
+        for two_side, found, _, _, _ in self.iter_results(p_nr, side_nr, two_sides, time_limit):
+            yield two_side, found
+        # for
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+class BudgetScheduler(object):
+
+    """ Decide the options of a segment in rounds with a growing time limit
+
+        Every option first gets a short time slice. Options that are not decided when their time runs out
+        are searched again in the next round, with a longer time slice, up to max_slice.
+        An option that is still not decided after max_slice, or when the budget for the whole job is used up,
+        is assumed to have a solution, just like has_solution does when it runs out of time.
+    """
+
+    def __init__(self, search, pool=None, first_slice=5, growth=4, max_slice=0, budget=0):
+        """
+            search: SquareSearch
+            pool: optional SquareSearchPool for this search
+            first_slice: seconds per option in the first round
+            growth: factor for the time slice of the next round
+            max_slice: maximum seconds per option per round; 0 = no limit
+            budget: maximum seconds for all searches of this scheduler; 0 = no limit
+        """
+        self.search = search
+        self.searcher = pool or search
+        self.first_slice = first_slice
+        self.growth = growth
+        self.max_slice = max_slice
+        self.deadline = time.monotonic() + budget if budget else 0.0
+
+        # [two_side] = [nodes, seconds, rounds] for the options of the last segment
+        self.stats = dict()
+        self.rounds = 0
+
+    def iter_has_solution(self, p_nr, side_nr, two_sides):
+        """ yields (two_side, found) for each two_side; quick decisions first """
+        self.stats = {two_side: [0, 0.0, 0] for two_side in two_sides}
+        self.rounds = 0
+        todo = list(two_sides)
+        time_slice = self.first_slice
+
+        while todo:
+            is_last = False
+            if self.max_slice and time_slice >= self.max_slice:
+                time_slice = self.max_slice
+                is_last = True
+
+            if self.deadline:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if time_slice >= remaining:
+                    time_slice = remaining
+                    is_last = True
+
+            self.rounds += 1
+            next_todo = []
+            for two_side, found, timed_out, nodes, seconds in self.searcher.iter_results(p_nr, side_nr, todo,
+                                                                                          time_slice):
+                stats = self.stats[two_side]
+                stats[0] += nodes
+                stats[1] += seconds
+                stats[2] += 1
+
+                if timed_out and not is_last:
+                    # try again in the next round, with more time
+                    next_todo.append(two_side)
+                else:
+                    yield two_side, found
+            # for
+
+            todo = next_todo
+            time_slice *= self.growth
+        # while
+
+        # out of budget: assume a solution is possible
+        self.search.witness = None
+        for two_side in todo:
+            yield two_side, True
+        # for
+
+
+# end of file
@@ -7,13 +7,13 @@
 from django.http import Http404
 from django.urls import reverse
 from django.utils import timezone
-from django.db.models import Count
 from django.views.generic import TemplateView
 from django.templatetags.static import static
-from Pieces2x2.models import Piece2x2, TwoSideOptions, EvalProgress
+from Pieces2x2.models import Piece2x2, EvalProgress
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options, get_segment_option_processors, get_segment_option_counts
 from Ring1.models import Ring1
-from WorkQueue.models import Work, ProcessorUsedPieces
+from WorkQueue.models import Work, ProcessorUsedPieces, EvalProfile
 from types import SimpleNamespace
 import time
 
@@ -112,11 +112,11 @@ class OptionsView(TemplateView):
             segment2count[segment] = 0
             prev_segment2count[segment] = 0
         # for
-        for option in TwoSideOptions.objects.filter(processor=used.processor):
-            segment2count[option.segment] += 1
+        for segment, options in load_segment_options(used.processor).items():
+            segment2count[segment] = len(options)
         # for
-        for option in TwoSideOptions.objects.filter(processor=used.created_from):
-            prev_segment2count[option.segment] += 1
+        for segment, options in load_segment_options(used.created_from).items():
+            prev_segment2count[segment] = len(options)
         # for
 
         if used.from_ring1 > 0:
@@ -391,6 +391,29 @@ class OptionsView(TemplateView):
 
         return work
 
+    @staticmethod
+    def _get_profiles(processor):
+        """ the profiles of the last evaluator jobs, see WorkQueue.profiling """
+        objs = EvalProfile.objects.filter(processor=processor).order_by('-when')[:10]
+        for obj in objs:
+            obj.when_str = timezone.localtime(obj.when).strftime("%Y-%m-%d %H:%M")
+            obj.db_perc = 0
+            if obj.seconds > 0:
+                obj.db_perc = round(100 * obj.db_seconds / obj.seconds)
+            obj.seconds = round(obj.seconds, 1)
+            obj.depth_str = ', '.join([str(count) for count in obj.depth_counts])
+
+            # the options that took the most time
+            obj.slowest = []
+            for segment, two_side, found, rounds, nodes, search_ms, db_queries, db_ms in sorted(
+                                            obj.options, key=lambda row: row[5] + row[7], reverse=True)[:3]:
+                obj.slowest.append('s%s=%s %s: %s nodes in %s ms (%s rounds); %s queries in %s ms' % (
+                                        segment, two_side, 'found' if found else 'reduced',
+                                        nodes, search_ms, rounds, db_queries, db_ms))
+            # for
+        # for
+        return objs
+
     @staticmethod
     def _make_sol_loc(loc, sol, seg2sides, unused, is_last=False):
         seg1 = calc_segment(loc, 1)
@@ -593,9 +616,8 @@ class OptionsView(TemplateView):
             seg2sides[seg] = list()
         # for
 
-        qset = TwoSideOptions.objects.filter(processor=processor)
-        for two in qset:
-            seg2sides[two.segment].append(two.two_side)
+        for segment, options in load_segment_options(processor).items():
+            seg2sides[segment] = sorted(options)
         # for
 
         for loc in range(1, 64+1):
@@ -724,11 +746,7 @@ class OptionsView(TemplateView):
 
         start = time.monotonic()
 
-        processors = list(TwoSideOptions
-                          .objects
-                          .distinct('processor')
-                          .order_by('processor')
-                          .values_list('processor', flat=True))
+        processors = get_segment_option_processors()
         if len(processors) == 0:
             processors.append(0)
 
@@ -761,8 +779,8 @@ class OptionsView(TemplateView):
         for segment in range(256):
             segment2count[segment] = 0
         # for
-        for option in TwoSideOptions.objects.filter(processor=processor):
-            segment2count[option.segment] += 1
+        for segment, options in load_segment_options(processor).items():
+            segment2count[segment] = len(options)
         # for
         context['total_options'] = sum(segment2count.values())
 
@@ -783,6 +801,8 @@ class OptionsView(TemplateView):
 
         context['progress'] = self._get_progress(processor)
 
+        context['profiles'] = self._get_profiles(processor)
+
         context['auto_reload'] = True
 
         context['duration'] = round(time.monotonic() - start, 2)
@@ -825,12 +845,7 @@ class OptionsListView(TemplateView):
                 work2count[work.processor] = 1
         # for
 
-        two_side_count = dict()     # [processor] = count
-        for obj in TwoSideOptions.objects.values('processor').annotate(count=Count('processor')):
-            processor_nr = obj['processor']
-            count = obj['count']
-            two_side_count[processor_nr] = count
-        # for
+        two_side_count = get_segment_option_counts()     # [processor] = count
 
         for proc in context['work']:
             processor_nr = proc['processor']
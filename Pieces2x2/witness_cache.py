@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Persistent cache of the witnesses found by the SquareSearch
+
+    A witness is a complete fill of the locations of an evaluator, found while showing that
+    a TwoSide on a segment can still be used. The same locations are evaluated many times
+    (after propagation, on duplicated boards), so the witness found last time is tried first:
+    when it still fits the options and unused base pieces, no search is needed.
+
+    The witnesses are stored per (locations, segment, two_side) and shared between all boards.
+    The SquareSearch checks each witness before it is used, so an outdated witness only costs a miss.
+"""
+
+from Pieces2x2.models import SquareWitness
+
+
+def _locs_str(locs):
+    return ",".join([str(loc) for loc in locs])
+
+
+def load_witnesses(locs):
+    """ returns [(segment, two_side)] = (Piece2x2 nr, ..) for the evaluator with these locations """
+    witnesses = dict()
+    for segment, two_side, p2x2_nrs in (SquareWitness
+                                        .objects
+                                        .filter(locs=_locs_str(locs))
+                                        .values_list('segment', 'two_side', 'p2x2_nrs')):
+        witnesses[(segment, two_side)] = tuple(p2x2_nrs)
+    # for
+    return witnesses
+
+
+def save_witness(search, segment, two_side):
+    """ store the witness of the last has_solution of the search, unless it came from the cache """
+    witness = search.witness
+    key = (segment, two_side)
+    if witness and search.witnesses.get(key) != witness:
+        search.witnesses[key] = witness
+        SquareWitness.objects.update_or_create(locs=_locs_str(search.locs),
+                                               segment=segment,
+                                               two_side=two_side,
+                                               defaults={'p2x2_nrs': list(witness)})
+
+
+# end of file
@@ -5,7 +5,9 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from Pieces2x2.models import Piece2x2
+from Pieces2x2.piece_index import get_piece_index
 from Ring2.models import Ring2
 
 
@@ -18,10 +20,10 @@ class CanSolveRing2(object):
 
     def __init__(self):
         # 1..60 = borders + corners
-        self.unused = list(range(1, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(1, 256+1))
+        self.unused.take(ALL_HINT_NRS)
+
+        self.piece_index = get_piece_index()
 
         self._link_sides = False
 
@@ -46,12 +48,22 @@ class CanSolveRing2(object):
         self.exp_loc49_s2_set = qset.distinct('side4').values_list('side4', flat=True)
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
+        self.unused.take(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        self.unused.extend(p_nrs)
+        self.unused.give_back(p_nrs)
+
+    def _iter_fits(self, side1=None, side2=None, side3=None, side4=None, hint=None):
+        """ yields the Piece2x2 with the given sides that use only unused base pieces
+            hint: optional (pos, nr) for the hint piece, which is never in the unused set
+        """
+        unused = self.unused
+        if hint:
+            unused = unused.copy()
+            unused.give_back((hint[1],))
+
+        options = [None if side is None else [side] for side in (side1, side2, side3, side4)]
+        return self.piece_index.iter_fits(*options, unused, hint=hint)
 
     def _load_ring1(self, ring1):
         ring2 = Ring2()
@@ -160,19 +172,13 @@ class CanSolveRing2(object):
         self.exp_loc55_s3 = p2x2.side1
 
     def _check_side4_loc10(self, exp_loc10_s3):
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr1=208,
-                                       nr2__in=self.unused, nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc10_s1, side3=exp_loc10_s3, side4=self.exp_loc10_s4)
-        return qset.first() is not None
+        pieces = self._iter_fits(side1=self.exp_loc10_s1, side3=exp_loc10_s3, side4=self.exp_loc10_s4, hint=(1, 208))
+        return next(pieces, None) is not None
 
     def _find_side4_loc18(self, exp_loc18_s3):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side3=exp_loc18_s3, side4=self.exp_loc18_s4)
-        for p in qset:
+        pieces = self._iter_fits(side3=exp_loc18_s3, side4=self.exp_loc18_s4)
+        for p in pieces:
             exp_loc10_s3 = p.side1
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -185,11 +191,8 @@ class CanSolveRing2(object):
 
     def _find_side4_loc26(self, exp_loc26_s3):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side3=exp_loc26_s3, side4=self.exp_loc26_s4)
-        for p in qset:
+        pieces = self._iter_fits(side3=exp_loc26_s3, side4=self.exp_loc26_s4)
+        for p in pieces:
             exp_loc18_s3 = p.side1
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -202,11 +205,8 @@ class CanSolveRing2(object):
 
     def _find_side4_loc34(self, exp_loc34_s3):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side3=exp_loc34_s3, side4=self.exp_loc34_s4)
-        for p in qset:
+        pieces = self._iter_fits(side3=exp_loc34_s3, side4=self.exp_loc34_s4)
+        for p in pieces:
             exp_loc26_s3 = p.side1
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -219,11 +219,8 @@ class CanSolveRing2(object):
 
     def _find_side4_loc42(self, exp_loc42_s3):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side3=exp_loc42_s3, side4=self.exp_loc42_s4)
-        for p in qset:
+        pieces = self._iter_fits(side3=exp_loc42_s3, side4=self.exp_loc42_s4)
+        for p in pieces:
             exp_loc34_s3 = p.side1
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -236,11 +233,8 @@ class CanSolveRing2(object):
 
     def _find_side4_loc50(self):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr3=181,
-                                       nr1__in=self.unused, nr2__in=self.unused, nr4__in=self.unused,
-                                       side3=self.exp_loc50_s3, side4=self.exp_loc50_s4)
-        for p in qset:
+        pieces = self._iter_fits(side3=self.exp_loc50_s3, side4=self.exp_loc50_s4, hint=(3, 181))
+        for p in pieces:
             exp_loc42_s3 = p.side1
             p_nrs = (p.nr1, p.nr2, p.nr4)
             self._make_used(p_nrs)
@@ -255,13 +249,10 @@ class CanSolveRing2(object):
 
     def _find_side2_loc55(self, exp_loc55_s1):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr4=249,
-                                       nr1__in=self.unused, nr2__in=self.unused, nr3__in=self.unused,
-                                       side1=exp_loc55_s1, side2=self.exp_loc55_s2, side3=self.exp_loc55_s3)
+        pieces = self._iter_fits(side1=exp_loc55_s1, side2=self.exp_loc55_s2, side3=self.exp_loc55_s3, hint=(4, 249))
         if not self._link_sides:
-            return qset.first() is not None
-        for p in qset:
+            return next(pieces, None) is not None
+        for p in pieces:
             p_nrs = (p.nr1, p.nr2, p.nr3)
             self._make_used(p_nrs)
             found = self._find_side4_loc50()
@@ -273,11 +264,8 @@ class CanSolveRing2(object):
 
     def _find_side2_loc47(self, exp_loc47_s1):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=exp_loc47_s1, side2=self.exp_loc47_s2)
-        for p in qset:
+        pieces = self._iter_fits(side1=exp_loc47_s1, side2=self.exp_loc47_s2)
+        for p in pieces:
             exp_loc55_s1 = p.side3
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -290,11 +278,8 @@ class CanSolveRing2(object):
 
     def _find_side2_loc39(self, exp_loc39_s1):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=exp_loc39_s1, side2=self.exp_loc39_s2)
-        for p in qset:
+        pieces = self._iter_fits(side1=exp_loc39_s1, side2=self.exp_loc39_s2)
+        for p in pieces:
             exp_loc47_s1 = p.side3
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -307,11 +292,8 @@ class CanSolveRing2(object):
 
     def _find_side2_loc31(self, exp_loc31_s1):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=exp_loc31_s1, side2=self.exp_loc31_s2)
-        for p in qset:
+        pieces = self._iter_fits(side1=exp_loc31_s1, side2=self.exp_loc31_s2)
+        for p in pieces:
             exp_loc39_s1 = p.side3
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -324,11 +306,8 @@ class CanSolveRing2(object):
 
     def _find_side2_loc23(self, exp_loc23_s1):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=exp_loc23_s1, side2=self.exp_loc23_s2)
-        for p in qset:
+        pieces = self._iter_fits(side1=exp_loc23_s1, side2=self.exp_loc23_s2)
+        for p in pieces:
             exp_loc31_s1 = p.side3
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -341,11 +320,8 @@ class CanSolveRing2(object):
 
     def _find_side2_loc15(self):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr2=255,
-                                       nr1__in=self.unused, nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc15_s1, side2=self.exp_loc15_s2)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc15_s1, side2=self.exp_loc15_s2, hint=(2, 255))
+        for p in pieces:
             exp_loc23_s1 = p.side3
             p_nrs = (p.nr1, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -359,19 +335,13 @@ class CanSolveRing2(object):
     #####################################################################################
 
     def _check_side3_loc50(self, exp_loc50_s2):
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr3=181,
-                                       nr1__in=self.unused, nr2__in=self.unused, nr4__in=self.unused,
-                                       side2=exp_loc50_s2, side3=self.exp_loc50_s3, side4=self.exp_loc50_s4)
-        return qset.first() is not None
+        pieces = self._iter_fits(side2=exp_loc50_s2, side3=self.exp_loc50_s3, side4=self.exp_loc50_s4, hint=(3, 181))
+        return next(pieces, None) is not None
 
     def _find_side3_loc51(self, exp_loc51_s2):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side2=exp_loc51_s2, side3=self.exp_loc51_s3)
-        for p in qset:
+        pieces = self._iter_fits(side2=exp_loc51_s2, side3=self.exp_loc51_s3)
+        for p in pieces:
             exp_loc50_s2 = p.side4
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -384,11 +354,8 @@ class CanSolveRing2(object):
 
     def _find_side3_loc52(self, exp_loc52_s2):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side2=exp_loc52_s2, side3=self.exp_loc52_s3)
-        for p in qset:
+        pieces = self._iter_fits(side2=exp_loc52_s2, side3=self.exp_loc52_s3)
+        for p in pieces:
             exp_loc51_s2 = p.side4
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -401,11 +368,8 @@ class CanSolveRing2(object):
 
     def _find_side3_loc53(self, exp_loc53_s2):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side2=exp_loc53_s2, side3=self.exp_loc53_s3)
-        for p in qset:
+        pieces = self._iter_fits(side2=exp_loc53_s2, side3=self.exp_loc53_s3)
+        for p in pieces:
             exp_loc52_s2 = p.side4
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -418,11 +382,8 @@ class CanSolveRing2(object):
 
     def _find_side3_loc54(self, exp_loc54_s2):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side2=exp_loc54_s2, side3=self.exp_loc54_s3)
-        for p in qset:
+        pieces = self._iter_fits(side2=exp_loc54_s2, side3=self.exp_loc54_s3)
+        for p in pieces:
             exp_loc53_s2 = p.side4
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -435,11 +396,8 @@ class CanSolveRing2(object):
 
     def _find_side3_loc55(self):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr4=249,
-                                       nr1__in=self.unused, nr2__in=self.unused, nr3__in=self.unused,
-                                       side2=self.exp_loc55_s2, side3=self.exp_loc55_s3)
-        for p in qset:
+        pieces = self._iter_fits(side2=self.exp_loc55_s2, side3=self.exp_loc55_s3, hint=(4, 249))
+        for p in pieces:
             exp_loc54_s2 = p.side4
             p_nrs = (p.nr1, p.nr2, p.nr3)
             self._make_used(p_nrs)
@@ -454,13 +412,10 @@ class CanSolveRing2(object):
 
     def _find_side1_loc15(self, exp_loc15_s4):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr2=255,
-                                       nr1__in=self.unused, nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc15_s1, side2=self.exp_loc15_s2, side4=exp_loc15_s4)
+        pieces = self._iter_fits(side1=self.exp_loc15_s1, side2=self.exp_loc15_s2, side4=exp_loc15_s4, hint=(2, 255))
         if not self._link_sides:
-            return qset.first() is not None
-        for p in qset:
+            return next(pieces, None) is not None
+        for p in pieces:
             p_nrs = (p.nr1, p.nr3, p.nr4)
             self._make_used(p_nrs)
             found = self._find_side3_loc55()
@@ -472,11 +427,8 @@ class CanSolveRing2(object):
 
     def _find_side1_loc14(self, exp_loc14_s4):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc14_s1, side4=exp_loc14_s4)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc14_s1, side4=exp_loc14_s4)
+        for p in pieces:
             exp_loc15_s4 = p.side2
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -489,11 +441,8 @@ class CanSolveRing2(object):
 
     def _find_side1_loc13(self, exp_loc13_s4):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc13_s1, side4=exp_loc13_s4)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc13_s1, side4=exp_loc13_s4)
+        for p in pieces:
             exp_loc14_s4 = p.side2
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -506,11 +455,8 @@ class CanSolveRing2(object):
 
     def _find_side1_loc12(self, exp_loc12_s4):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc12_s1, side4=exp_loc12_s4)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc12_s1, side4=exp_loc12_s4)
+        for p in pieces:
             exp_loc13_s4 = p.side2
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -523,11 +469,8 @@ class CanSolveRing2(object):
 
     def _find_side1_loc11(self, exp_loc11_s4):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=False,
-                                       nr1__in=self.unused, nr2__in=self.unused,
-                                       nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc11_s1, side4=exp_loc11_s4)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc11_s1, side4=exp_loc11_s4)
+        for p in pieces:
             exp_loc12_s4 = p.side2
             p_nrs = (p.nr1, p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
@@ -540,11 +483,8 @@ class CanSolveRing2(object):
 
     def _find_side1_loc10(self):
         found = False
-        qset = Piece2x2.objects.filter(has_hint=True,
-                                       nr1=208,
-                                       nr2__in=self.unused, nr3__in=self.unused, nr4__in=self.unused,
-                                       side1=self.exp_loc10_s1, side4=self.exp_loc10_s4)
-        for p in qset:
+        pieces = self._iter_fits(side1=self.exp_loc10_s1, side4=self.exp_loc10_s4, hint=(1, 208))
+        for p in pieces:
             exp_loc11_s4 = p.side2
             p_nrs = (p.nr2, p.nr3, p.nr4)
             self._make_used(p_nrs)
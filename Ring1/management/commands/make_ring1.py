@@ -7,6 +7,7 @@
 from django.core.management.base import BaseCommand
 from BasePieces.border import GenerateBorder
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from BasePieces.models import BasePiece
 from Pieces2x2.models import Piece2x2
 from Ring1.models import Ring1
@@ -32,12 +33,10 @@ class Command(BaseCommand):
                         nr47=0, nr54=0, nr55=0)
 
         # 1..60 = borders + corners
-        self.unused = list(range(1, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(1, 256+1))
+        self.unused.take(ALL_HINT_NRS)
 
-        self.used = []
+        self.used = PieceSet()
 
         self.bcb1 = []
         self.bcb2 = []
@@ -87,16 +86,12 @@ class Command(BaseCommand):
         parser.add_argument('--clean', action='store_true')
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
-        self.used.extend(p_nrs)
+        self.unused.take(p_nrs)
+        self.used.give_back(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.used.remove(nr)
-        # for
-        self.unused.extend(p_nrs)
+        self.used.take(p_nrs)
+        self.unused.give_back(p_nrs)
 
     def _save_ring1(self):
         self.ring1.pk = None
@@ -7,9 +7,11 @@
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from BasePieces.models import BasePiece
 from Pieces2x2.helpers import calc_segment
-from Pieces2x2.models import Piece2x2, TwoSideOptions, EvalProgress
+from Pieces2x2.models import Piece2x2, EvalProgress
+from Pieces2x2.segment_options import load_segment_options
 from Ring1.models import Ring1
 from Ring2.models import Ring2
 from WorkQueue.models import ProcessorUsedPieces
@@ -34,12 +36,10 @@ class Command(BaseCommand):
         self.progress = None
 
         # 1..60 = borders + corners
-        self.unused = list(range(1, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(1, 256+1))
+        self.unused.take(ALL_HINT_NRS)
 
-        self.used = []
+        self.used = PieceSet()
         self.prev_tick = time.monotonic()
 
     def add_arguments(self, parser):
@@ -107,16 +107,12 @@ class Command(BaseCommand):
             self.stdout.write(msg)
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
-        self.used.extend(p_nrs)
+        self.unused.take(p_nrs)
+        self.used.give_back(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.used.remove(nr)
-        # for
-        self.unused.extend(p_nrs)
+        self.used.take(p_nrs)
+        self.unused.give_back(p_nrs)
 
     def _load_ring1(self, nr, processor):
         self.stdout.write('[INFO] Loading Ring1 %s' % nr)
@@ -232,102 +228,102 @@ class Command(BaseCommand):
         self.exp_loc55_s3 = p2x2.side1
 
         # get the segment limitations for the inner sides and free-start location
-        qset = TwoSideOptions.objects.filter(processor=processor)
+        seg2options = load_segment_options(processor)
 
         seg = calc_segment(50, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc50_sides1 = options
 
         seg = calc_segment(51, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc51_sides1 = options
 
         seg = calc_segment(52, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc52_sides1 = options
 
         seg = calc_segment(53, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc53_sides1 = options
 
         seg = calc_segment(54, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc54_sides1 = options
 
         seg = calc_segment(55, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc55_sides1 = options
 
         seg = calc_segment(10, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc10_sides2 = options
 
         seg = calc_segment(18, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc18_sides2 = options
 
         seg = calc_segment(26, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc26_sides2 = options
 
         seg = calc_segment(34, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc34_sides2 = options
 
         seg = calc_segment(42, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc42_sides2 = options
 
         seg = calc_segment(50, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc50_sides2 = options
 
         seg = calc_segment(10, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc10_sides3 = options
 
         seg = calc_segment(11, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc11_sides3 = options
 
         seg = calc_segment(12, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc12_sides3 = options
 
         seg = calc_segment(13, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc13_sides3 = options
 
         seg = calc_segment(14, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc14_sides3 = options
 
         seg = calc_segment(15, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc15_sides3 = options
 
         seg = calc_segment(15, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc15_sides4 = options
 
         seg = calc_segment(23, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc23_sides4 = options
 
         seg = calc_segment(31, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc31_sides4 = options
 
         seg = calc_segment(39, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc39_sides4 = options
 
         seg = calc_segment(47, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc47_sides4 = options
 
         seg = calc_segment(55, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc55_sides4 = options
 
         # TODO: add loc 19, 22, 42, 46
@@ -7,9 +7,11 @@
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from BasePieces.models import BasePiece
 from Pieces2x2.helpers import calc_segment
-from Pieces2x2.models import Piece2x2, EvalProgress, TwoSide, TwoSideOptions
+from Pieces2x2.models import Piece2x2, EvalProgress, TwoSide
+from Pieces2x2.segment_options import load_segment_options
 from Ring2.models import Ring2
 from WorkQueue.models import ProcessorUsedPieces
 from WorkQueue.operations import used_note_add
@@ -35,12 +37,10 @@ class Command(BaseCommand):
         self.progress = None
 
         # 1..60 = borders + corners
-        self.unused = list(range(61, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(61, 256+1))
+        self.unused.take(ALL_HINT_NRS)
 
-        self.used = []
+        self.used = PieceSet()
         self.prev_tick = time.monotonic()
 
     def add_arguments(self, parser):
@@ -51,38 +51,38 @@ class Command(BaseCommand):
     def _load_options(self, processor_nr):
 
         # get the segment limitations for some key locations
-        qset = TwoSideOptions.objects.filter(processor=processor_nr)
+        seg2options = load_segment_options(processor_nr)
 
         seg = calc_segment(10, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc10_sides1 = options
 
         seg = calc_segment(15, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc15_sides1 = options
 
         seg = calc_segment(15, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc15_sides2 = options
 
         seg = calc_segment(55, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc55_sides2 = options
 
         seg = calc_segment(55, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc55_sides3 = options
 
         seg = calc_segment(50, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc50_sides3 = options
 
         seg = calc_segment(50, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc50_sides4 = options
 
         seg = calc_segment(10, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc10_sides4 = options
 
     def _find_best(self):
@@ -145,16 +145,12 @@ class Command(BaseCommand):
             self.stdout.write(msg)
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
-        self.used.extend(p_nrs)
+        self.unused.take(p_nrs)
+        self.used.give_back(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.used.remove(nr)
-        # for
-        self.unused.extend(p_nrs)
+        self.used.take(p_nrs)
+        self.unused.give_back(p_nrs)
 
     def _save_ring2(self):
         self.ring2.pk = None
@@ -7,9 +7,11 @@
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from BasePieces.models import BasePiece
 from Pieces2x2.helpers import calc_segment
-from Pieces2x2.models import Piece2x2, EvalProgress, TwoSideOptions
+from Pieces2x2.models import Piece2x2, EvalProgress
+from Pieces2x2.segment_options import load_segment_options
 from Ring3.models import Ring3
 from WorkQueue.models import ProcessorUsedPieces
 from WorkQueue.operations import used_note_add
@@ -32,12 +34,10 @@ class Command(BaseCommand):
         self.ring3_count = 0
 
         # 1..60 = borders + corners
-        self.unused = list(range(61, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(61, 256+1))
+        self.unused.take(ALL_HINT_NRS)
 
-        self.used = []
+        self.used = PieceSet()
         self.progress = None
         self.prev_tick = time.monotonic()
 
@@ -58,38 +58,38 @@ class Command(BaseCommand):
 
     def _load_options(self, processor_nr):
         # get the segment limitations for some key locations
-        qset = TwoSideOptions.objects.filter(processor=processor_nr)
+        seg2options = load_segment_options(processor_nr)
 
         seg = calc_segment(10, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc11_sides4 = options
 
         seg = calc_segment(10, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc18_sides1 = options
 
         seg = calc_segment(15, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc23_sides1 = options
 
         seg = calc_segment(15, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc14_sides2 = options
 
         seg = calc_segment(50, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc42_sides3 = options
 
         seg = calc_segment(50, 2)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc51_sides4 = options
 
         seg = calc_segment(55, 1)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc47_sides3 = options
 
         seg = calc_segment(55, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_loc54_sides2 = options
 
     def _find_best(self):
@@ -131,16 +131,12 @@ class Command(BaseCommand):
             self.stdout.write('[%s] %s' % (stamp, msg))
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
-        self.used.extend(p_nrs)
+        self.unused.take(p_nrs)
+        self.used.give_back(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.used.remove(nr)
-        # for
-        self.unused.extend(p_nrs)
+        self.used.take(p_nrs)
+        self.unused.give_back(p_nrs)
 
     def _save_ring3(self):
         self.ring3_count += 1
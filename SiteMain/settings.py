@@ -172,6 +172,9 @@ STATICFILES_FINDER = [
     'django.contrib.staticfiles.finders.AppDirectoriesFinder'
 ]
 
+# binary snapshot of the Piece2x2 and TwoSide tables, written by make2x2 and mapped by the evaluators
+PIECE2X2_SNAPSHOT = str(BASE_DIR / 'SiteMain' / '.piece2x2.snapshot')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
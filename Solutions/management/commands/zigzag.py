@@ -7,9 +7,11 @@
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from BasePieces.hints import ALL_HINT_NRS
+from BasePieces.piece_set import PieceSet
 from BasePieces.models import BasePiece
 from Pieces2x2.helpers import calc_segment
-from Pieces2x2.models import Piece2x2, TwoSide, TwoSideOptions, EvalProgress
+from Pieces2x2.models import Piece2x2, TwoSide, EvalProgress
+from Pieces2x2.segment_options import load_segment_options
 from Solutions.models import Solution8x8
 import time
 
@@ -61,12 +63,10 @@ class Command(BaseCommand):
         # for
 
         # 1..60 = borders + corners
-        self.unused = list(range(1, 256+1))
-        for nr in ALL_HINT_NRS:
-            self.unused.remove(nr)
-        # for
+        self.unused = PieceSet(range(1, 256+1))
+        self.unused.take(ALL_HINT_NRS)
 
-        self.used = []
+        self.used = PieceSet()
         self.progress = None
         self.prev_tick = time.monotonic()
 
@@ -75,51 +75,47 @@ class Command(BaseCommand):
 
     def _load_options(self, processor_nr):
         # get the segment limitations for some key locations
-        qset = TwoSideOptions.objects.filter(processor=processor_nr)
+        seg2options = load_segment_options(processor_nr)
 
         seg = calc_segment(10, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides2[9] = options
 
         seg = calc_segment(10, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides1[18] = options
 
         seg = calc_segment(15, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides2[14] = options
 
         seg = calc_segment(15, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides1[23] = options
 
         seg = calc_segment(50, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides1[58] = options
 
         seg = calc_segment(50, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides2[49] = options
 
         seg = calc_segment(55, 3)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides1[63] = options
 
         seg = calc_segment(55, 4)
-        options = list(qset.filter(segment=seg).values_list('two_side', flat=True))
+        options = sorted(seg2options[seg])
         self.exp_sides2[54] = options
 
     def _make_used(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.unused.remove(nr)
-        # for
-        self.used.extend(p_nrs)
+        self.unused.take(p_nrs)
+        self.used.give_back(p_nrs)
 
     def _make_unused(self, p_nrs: tuple | list):
-        for nr in p_nrs:
-            self.used.remove(nr)
-        # for
-        self.unused.extend(p_nrs)
+        self.used.take(p_nrs)
+        self.unused.give_back(p_nrs)
 
     def _save_solution(self):
         self.solution.pk = None
@@ -5,7 +5,7 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.contrib import admin
-from WorkQueue.models import Work, ProcessorUsedPieces
+from WorkQueue.models import Work, ProcessorUsedPieces, EvalProfile, JobCost
 
 
 class WorkAdmin(admin.ModelAdmin):
@@ -20,7 +20,23 @@ class ProcessorUsedPiecesAdmin(admin.ModelAdmin):
     list_filter = ('reached_dead_end', 'processor',)
 
 
+class EvalProfileAdmin(admin.ModelAdmin):
+
+    list_filter = ('job_type', 'processor')
+
+    readonly_fields = ('work', 'when')
+
+
+class JobCostAdmin(admin.ModelAdmin):
+
+    list_display = ('job_type', 'seconds', 'runs', 'updated')
+
+    readonly_fields = ('updated',)
+
+
 admin.site.register(Work, WorkAdmin)
 admin.site.register(ProcessorUsedPieces, ProcessorUsedPiecesAdmin)
+admin.site.register(EvalProfile, EvalProfileAdmin)
+admin.site.register(JobCost, JobCostAdmin)
 
 # end of file
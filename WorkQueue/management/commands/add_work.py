@@ -5,7 +5,8 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from WorkQueue.models import Work, ProcessorUsedPieces
+from WorkQueue.models import Work
+from WorkQueue.operations import notify_work_added, request_board_scan
 
 
 class Command(BaseCommand):
@@ -15,6 +16,7 @@ class Command(BaseCommand):
     supported_job_types = ('eval_loc_1', 'eval_loc_4', 'eval_loc_9', 'eval_loc_16',
                            'eval_line1', 'eval_line2', 'eval_line3',
                            'eval_claims',
+                           'propagate_board', 'scan_board_1x1',
                            'scan1', 'scan9', 'delayed_scan1',
                            'make_ring2')
 
@@ -29,6 +31,17 @@ class Command(BaseCommand):
         parser.add_argument('--limit', default=0, type=int, help='Optional limit (1..289)')
         parser.add_argument('--nop', action='store_true', help='Do not propagate')
 
+    @staticmethod
+    def _add_bulk(bulk):
+        """ store the jobs; a job that is already pending is skipped (see the work_pending_unique constraint)
+            returns the number of jobs added
+        """
+        work = bulk[0]
+        qset = Work.objects.filter(processor=work.processor, job_type=work.job_type, done=False)
+        count_before = qset.count()
+        Work.objects.bulk_create(bulk, ignore_conflicts=True)
+        return qset.count() - count_before
+
     def handle(self, *args, **options):
         processor = options['processor']
         job_type = options['job']
@@ -42,25 +55,14 @@ class Command(BaseCommand):
             self.stdout.write('[INFO] Please choose from: %s' % repr(self.supported_job_types))
             return
 
-        if job_type == 'scan1':
-            job_type = 'eval_loc_1'
-            self.stdout.write('[INFO] Adding work: %s %s %s {1..64}' % (processor, job_type, prio_seed))
-
-            try:
-                used = ProcessorUsedPieces.objects.get(processor=processor)
-            except ProcessorUsedPieces.DoesNotExist:
-                used = ProcessorUsedPieces()
+        if job_type in ('scan1', 'scan_board_1x1'):
+            # all open locations are evaluated by a single job
+            job_type = 'scan_board_1x1'
+            self.stdout.write('[INFO] Adding work: %s %s %s' % (processor, job_type, prio_seed))
 
-            bulk = []
-            for loc in range(1, 64+1):
-                loc_str = 'loc%s' % loc
-                if getattr(used, loc_str) == 0:
-                    work = Work(processor=processor, job_type=job_type, priority=prio_seed,
-                                location=loc, nop=nop)
-                    bulk.append(work)
-            # for
-            Work.objects.bulk_create(bulk)
-            self.stdout.write('[INFO] Added %s jobs' % len(bulk))
+            if not request_board_scan(processor, prio_seed, nop):
+                self.stdout.write('[INFO] Job is already pending')
+            return
 
         elif job_type == 'scan9':
             job_type = 'eval_loc_9'
@@ -75,8 +77,8 @@ class Command(BaseCommand):
                             location=loc, nop=nop)
                 bulk.append(work)
             # for
-            Work.objects.bulk_create(bulk)
-            self.stdout.write('[INFO] Added %s jobs' % len(bulk))
+            count = self._add_bulk(bulk)
+            self.stdout.write('[INFO] Added %s jobs; %s already pending' % (count, len(bulk) - count))
 
         elif job_type == 'make_ring2':
             self.stdout.write('[INFO] Adding work: %s %s %s' % (processor, job_type, prio_seed))
@@ -91,7 +93,11 @@ class Command(BaseCommand):
                 '[INFO] Adding work: %s %s %s %s%s' % (processor, job_type, prio_seed, location, limit_str))
             work = Work(processor=processor, job_type=job_type, priority=prio_seed,
                         location=location, limit=limit, nop=nop)
-            work.save()
+            if self._add_bulk([work]) == 0:
+                self.stdout.write('[INFO] Job is already pending')
+                return
+
+        notify_work_added(job_type)
 
 
 # end of file
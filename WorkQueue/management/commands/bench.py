@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Reproducible benchmark of the evaluators and generators
+
+    The benchmark loads a fixed board from a fixture file (segment options, used pieces and the Ring1 it came from)
+    and times each case on that board, with a fixed budget of seconds per case.
+    Each case runs in its own process (for a clean peak RSS and cold caches) and inside a transaction
+    that is rolled back, so the database is left as it was and every case starts from the same board.
+    The witness cache is emptied inside that transaction, so earlier runs do not make a case faster.
+
+    Intended for a local database: the rolled back transaction holds locks until the case is done.
+
+    Create a fixture once from an existing board and keep it with the results:
+        ./manage.py bench board.json --save 123
+    Run the benchmark; the JSON report is written to stdout:
+        ./manage.py bench board.json --budget 60 > results.json
+"""
+
+from django.conf import settings
+from django.core import management
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, Error
+from django.db.models import Max, Sum
+from BasePieces.border import GenerateBorder
+from Pieces2x2.models import SquareWitness
+from Pieces2x2.segment_options import load_segment_options, store_segment_options
+from Ring1.models import Ring1
+from Ring1.can_solve_ring2 import CanSolveRing2
+from WorkQueue.models import ProcessorUsedPieces, EvalProfile
+import subprocess
+import platform
+import resource
+import hashlib
+import signal
+import json
+import time
+import sys
+import io
+
+FIXTURE_VERSION = 1
+
+# board number used for the fixture; only exists inside the rolled back transaction
+BENCH_PROCESSOR = 999999
+
+# [case] = unit of the count; 'jobs' is for the evaluators without search counters
+BENCH_CASES = {
+    'eval_loc_1': 'jobs',
+    'eval_loc_4': 'nodes',
+    'eval_loc_9': 'nodes',
+    'eval_loc_16': 'nodes',
+    'eval_claims': 'jobs',
+    'make_ring1': 'ring1',
+    'can_solve_ring2': 'verifications',
+    'generate_border': 'solutions',
+}
+
+# top-left location for the evaluators
+BENCH_LOC_1 = 28
+BENCH_LOC_SQUARE = 19
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the evaluators and generators on a fixed board"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.budget_reached = False
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture', type=str, help='Board fixture file (JSON)')
+        parser.add_argument('--save', default=0, type=int, help='Write the fixture from this processor')
+        parser.add_argument('--budget', default=60, type=int, help='Maximum seconds per case')
+        parser.add_argument('--seed', default=1, type=int, help='Seed for make_ring1 and generate_border')
+        parser.add_argument('--case', action='append', choices=tuple(BENCH_CASES.keys()),
+                            help='Run only this case (can be repeated)')
+        parser.add_argument('--run-case', choices=tuple(BENCH_CASES.keys()),
+                            help='Run one case in this process (used by the benchmark itself)')
+
+    @staticmethod
+    def _binary_fields():
+        return [field.name for field in ProcessorUsedPieces._meta.concrete_fields
+                if field.get_internal_type() == 'BinaryField']
+
+    def _save_fixture(self, fname, processor):
+        try:
+            used = ProcessorUsedPieces.objects.get(processor=processor)
+        except ProcessorUsedPieces.DoesNotExist:
+            self.stderr.write('[ERROR] Processor %s not found' % processor)
+            return
+
+        binary_fields = self._binary_fields()
+        used_fields = dict()
+        for field in ProcessorUsedPieces._meta.concrete_fields:
+            if field.name not in ('id', 'processor'):
+                value = getattr(used, field.name)
+                if field.name in binary_fields:
+                    value = bytes(value).hex()
+                used_fields[field.name] = value
+        # for
+
+        ring1_fields = None
+        ring1 = Ring1.objects.filter(nr=used.from_ring1).first()
+        if ring1:
+            ring1_fields = {field.name: getattr(ring1, field.name)
+                            for field in Ring1._meta.concrete_fields
+                            if field.name.startswith('nr') and field.name != 'nr'}
+        else:
+            self.stdout.write('[WARNING] No Ring1 for this processor; case can_solve_ring2 will be skipped')
+
+        seg2options = {str(segment): sorted(options)
+                       for segment, options in load_segment_options(processor).items()}
+
+        fixture = {
+            'version': FIXTURE_VERSION,
+            'processor': processor,
+            'segment_options': seg2options,
+            'used': used_fields,
+            'ring1': ring1_fields,
+        }
+
+        with open(fname, 'w') as f:
+            json.dump(fixture, f, indent=1, sort_keys=True)
+
+        self.stdout.write('[INFO] Written %s with %s options' % (fname, sum([len(options)
+                                                                           for options in seg2options.values()])))
+
+    def _load_fixture(self, fixture):
+        """ put the board of the fixture in the database as processor BENCH_PROCESSOR """
+        seg2options = {int(segment): options for segment, options in fixture['segment_options'].items()}
+        store_segment_options(BENCH_PROCESSOR, seg2options)
+
+        binary_fields = self._binary_fields()
+        used_fields = dict(fixture['used'])
+        for name in binary_fields:
+            if name in used_fields:
+                used_fields[name] = bytes.fromhex(used_fields[name])
+        # for
+
+        ProcessorUsedPieces.objects.filter(processor=BENCH_PROCESSOR).delete()
+        ProcessorUsedPieces.objects.create(processor=BENCH_PROCESSOR, **used_fields)
+
+        # start with an empty witness cache
+        SquareWitness.objects.all().delete()
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.monotonic() - start
+
+    def _on_budget(self, _signum, _frame):
+        # the commands stop their work on KeyboardInterrupt
+        self.budget_reached = True
+        raise KeyboardInterrupt()
+
+    @staticmethod
+    def _call(*args):
+        out = io.StringIO()
+        management.call_command(*args, stdout=out, stderr=out)
+
+    def _bench_command(self, case, fixture, seed):
+        if case == 'eval_loc_1':
+            self._call(case, str(BENCH_PROCESSOR), str(BENCH_LOC_1))
+        elif case == 'eval_claims':
+            self._call(case, str(BENCH_PROCESSOR))
+        else:
+            self._call(case, str(BENCH_PROCESSOR), str(BENCH_LOC_SQUARE))
+
+    def _bench_make_ring1(self, case, fixture, seed):
+        self._call('make_ring1', str(seed))
+
+    def _bench_can_solve_ring2(self, case, fixture, seed):
+        ring1 = Ring1(**fixture['ring1'])
+        count = 0
+        try:
+            while True:
+                solve = CanSolveRing2()
+                solve.verify(ring1)
+                count += 1
+            # while
+        except KeyboardInterrupt:
+            pass
+        return count
+
+    def _bench_generate_border(self, case, fixture, seed):
+        gen = GenerateBorder(seed)
+        count = 0
+        try:
+            for _ in gen.iter_solutions():
+                count += 1
+            # for
+        except KeyboardInterrupt:
+            pass
+        return count
+
+    def _run_case(self, case, fixture, budget, seed):
+        """ run one case in this process and return the results """
+        if case == 'make_ring1':
+            bench = self._bench_make_ring1
+        elif case == 'can_solve_ring2':
+            if not fixture['ring1']:
+                return {'skipped': 'no Ring1 in the fixture'}
+            bench = self._bench_can_solve_ring2
+        elif case == 'generate_border':
+            bench = self._bench_generate_border
+        else:
+            bench = self._bench_command
+
+        count = None
+        seconds = 0.0
+        try:
+            with transaction.atomic():
+                self._load_fixture(fixture)
+                last_ring1 = Ring1.objects.aggregate(Max('nr'))['nr__max'] or 0
+
+                self.queries = 0
+                self.db_seconds = 0.0
+                connection.execute_wrappers.append(self._execute_wrapper)
+                signal.signal(signal.SIGALRM, self._on_budget)
+                signal.alarm(budget)
+                start = time.monotonic()
+                try:
+                    count = bench(case, fixture, seed)
+                except KeyboardInterrupt:
+                    pass
+                finally:
+                    signal.alarm(0)
+                    seconds = time.monotonic() - start
+                    connection.execute_wrappers.remove(self._execute_wrapper)
+
+                if BENCH_CASES[case] == 'jobs':
+                    count = 0 if self.budget_reached else 1
+                elif case == 'make_ring1':
+                    count = Ring1.objects.filter(nr__gt=last_ring1).count()
+                elif BENCH_CASES[case] == 'nodes':
+                    # written by the profiler of the evaluator
+                    count = (EvalProfile
+                             .objects
+                             .filter(processor=BENCH_PROCESSOR)
+                             .aggregate(Sum('nodes'))['nodes__sum'])
+
+                # nothing is kept
+                transaction.set_rollback(True)
+            # atomic
+        except Error:
+            # the budget interrupted a query; the transaction is rolled back by the database
+            pass
+
+        per_second = None
+        if count is not None and seconds > 0:
+            per_second = round(count / seconds, 1)
+
+        return {
+            'seconds': round(seconds, 3),
+            'budget_reached': self.budget_reached,
+            'count': count,
+            'unit': BENCH_CASES[case],
+            'per_second': per_second,
+            'queries': self.queries,
+            'db_seconds': round(self.db_seconds, 3),
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        }
+
+    def _spawn_case(self, case, fname, budget, seed):
+        """ run one case in a new process and return the results """
+        args = [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'bench', fname,
+                '--run-case', case, '--budget', str(budget), '--seed', str(seed)]
+        proc = subprocess.run(args, capture_output=True, text=True)
+        lines = proc.stdout.strip().split('\n')
+        if proc.returncode != 0 or not lines[-1].startswith('{'):
+            errors = proc.stderr.strip().split('\n')
+            return {'error': errors[-1]}
+        return json.loads(lines[-1])
+
+    @staticmethod
+    def _get_commit():
+        proc = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        return proc.stdout.strip()
+
+    def handle(self, *args, **options):
+        fname = options['fixture']
+
+        if options['save']:
+            self._save_fixture(fname, options['save'])
+            return
+
+        with open(fname, 'rb') as f:
+            data = f.read()
+        fixture = json.loads(data)
+        if fixture['version'] != FIXTURE_VERSION:
+            self.stderr.write('[ERROR] Unsupported fixture version %s' % fixture['version'])
+            return
+
+        budget = options['budget']
+        seed = options['seed']
+
+        if options['run_case']:
+            results = self._run_case(options['run_case'], fixture, budget, seed)
+            self.stdout.write(json.dumps(results))
+            return
+
+        cases = options['case'] or list(BENCH_CASES.keys())
+
+        report = {
+            'commit': self._get_commit(),
+            'fixture': fname,
+            'fixture_sha1': hashlib.sha1(data).hexdigest(),
+            'budget': budget,
+            'seed': seed,
+            'python': platform.python_version(),
+            'cases': dict(),
+        }
+
+        for case in cases:
+            self.stderr.write('[INFO] Running %s' % case)
+            report['cases'][case] = results = self._spawn_case(case, fname, budget, seed)
+            self.stderr.write('[INFO] %s: %s' % (case, repr(results)))
+        # for
+
+        self.stdout.write(json.dumps(report, indent=1))
+
+
+# end of file
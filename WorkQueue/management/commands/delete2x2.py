@@ -5,8 +5,9 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions, Piece2x2
+from Pieces2x2.models import Piece2x2
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options
 
 
 class Command(BaseCommand):
@@ -16,6 +17,7 @@ class Command(BaseCommand):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.processor = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.reductions = 0
         self.do_commit = False
 
@@ -26,16 +28,12 @@ class Command(BaseCommand):
 
     def _get_loc_side_options(self, loc, side_nr):
         segment = calc_segment(loc, side_nr)
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
         # self.stdout.write('[DEBUG] Segment %s has %s options' % (segment, len(options)))
         return options
 
     def _get_side_options(self, loc):
+        self.seg2options = load_segment_options(self.processor)
         s1 = self._get_loc_side_options(loc, 1)
         s2 = self._get_loc_side_options(loc, 2)
         s3 = self._get_loc_side_options(loc, 3)
@@ -4,14 +4,18 @@
 #  All rights reserved.
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
-from django.db import transaction
+from django.db import connection
 from django.core import management
+from django.core.management import get_commands, load_command_class
 from django.utils import timezone
-from django.db.models import F
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import EvalProgress
-from WorkQueue.models import Work, ProcessorUsedPieces
+from Pieces2x2.models import EvalProgress, EvalCheckpoint
+from Pieces2x2.piece_index import get_piece_index, get_twoside_nrs
+from WorkQueue.models import Work, ProcessorUsedPieces, EvalProfile
+from WorkQueue.operations import request_board_scan, check_dead_end, WORK_NOTIFY_CHANNEL
+from WorkQueue.scheduler import WorkScheduler, get_default_tags, record_job_cost, ALL_TAGS
 import datetime
+import select
 import time
 import io
 
@@ -20,19 +24,65 @@ class Command(BaseCommand):
 
     help = "Execute work from the work queue"
 
-    RISKY_JOBS = ('eval_loc_1',
-                  'eval_claims')  # no concurrency risk, but good to handle quickly
-
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
+        self.use_call_command = False
+        self.runners = dict()           # [command name] = (command class, parser)
+        self.setup_total = 0.0          # seconds
+        self.setup_count = 0
+
+        self.scheduler = None
+        self.listen_conn = None         # database connection that is listening for new work
+        self.work_announced = False
+
     def add_arguments(self, parser):
         parser.add_argument('worker_nr', type=int, help='Instance number')
+        parser.add_argument('--call-command', action='store_true',
+                            help='Run each job through call_command instead of in-process')
+        parser.add_argument('--tags', default='',
+                            help='Job classes to take, comma separated: %s (default depends on worker_nr)' %
+                                 ",".join(ALL_TAGS))
+        parser.add_argument('--quota', action='append', default=[],
+                            help='Maximum running jobs of a job class over all workers, like search=6 (repeatable)')
 
     @staticmethod
     def _get_stamp():
         return timezone.localtime(timezone.now()).strftime('%Y-%m-%d %H:%M:%S')
 
+    def _get_runner(self, name):
+        """ returns the command class and argument parser, created once per worker """
+        try:
+            runner = self.runners[name]
+        except KeyError:
+            command = load_command_class(get_commands()[name], name)
+            parser = command.create_parser('manage.py', name)
+            runner = self.runners[name] = (command.__class__, parser)
+        return runner
+
+    def _run_in_process(self, args, stdout, stderr):
+        """ run the command directly, skipping the command lookup and parser creation of call_command
+            the data loaded by the commands (piece index, TwoSide) stays warm between jobs
+        """
+        started = time.monotonic()
+
+        command_class, parser = self._get_runner(args[0])
+        options = vars(parser.parse_args(args[1:]))
+        command = command_class(stdout=stdout, stderr=stderr)
+
+        setup = time.monotonic() - started
+        self.setup_total += setup
+        self.setup_count += 1
+
+        command.handle(**options)
+
+        duration = time.monotonic() - started
+        self.stdout.write('[INFO] Setup took %.1f ms (average %.1f ms over %s jobs); job took %.2f seconds' % (
+                                setup * 1000.0,
+                                self.setup_total * 1000.0 / self.setup_count,
+                                self.setup_count,
+                                duration))
+
     def _run_command(self, *args):
 
         args = [arg for arg in args if arg is not None]
@@ -44,7 +94,10 @@ class Command(BaseCommand):
 
         bad = False
         try:
-            management.call_command(*args, stderr=f1, stdout=f2)
+            if self.use_call_command:
+                management.call_command(*args, stderr=f1, stdout=f2)
+            else:
+                self._run_in_process(args, f2, f1)
         except SystemExit as exc:
             self.stdout.write('[WARNING] Exception "%s" from command %s' % (str(exc), repr(args)))
             bad = True
@@ -59,6 +112,7 @@ class Command(BaseCommand):
 
     def _do_work(self, work):
         self.stdout.write('[INFO] Start on work pk=%s at %s' % (work.pk, self._get_stamp()))
+        started = time.monotonic()
 
         bad = True
         do_later = False
@@ -67,25 +121,22 @@ class Command(BaseCommand):
             nop = '--nop'
 
         if work.job_type == 'delayed_scan1':
-            try:
-                used = ProcessorUsedPieces.objects.get(processor=work.processor)
-            except ProcessorUsedPieces.DoesNotExist:
-                used = ProcessorUsedPieces()
-
-            bulk = []
-            for loc in range(1, 64+1):
-                loc_str = 'loc%s' % loc
-                if getattr(used, loc_str) == 0:
-                    new_work = Work(processor=work.processor, job_type='eval_loc_1', priority=2, location=loc, nop=work.nop)
-                    bulk.append(new_work)
-            # for
-            Work.objects.bulk_create(bulk)
-            self.stdout.write('[INFO] Added %s jobs' % len(bulk))
+            # all open locations are evaluated by a single job
+            if request_board_scan(work.processor, 2, work.nop):
+                self.stdout.write('[INFO] Added scan_board_1x1 job')
+            else:
+                self.stdout.write('[INFO] A scan_board_1x1 job is already waiting')
             bad = False
 
         elif work.job_type == 'eval_loc_1':
             bad = self._run_command('eval_loc_1', str(work.processor), str(work.location), nop)
 
+        elif work.job_type == 'propagate_board':
+            bad = self._run_command('propagate_board', str(work.processor))
+
+        elif work.job_type == 'scan_board_1x1':
+            bad = self._run_command('scan_board_1x1', str(work.processor), nop)
+
         elif work.job_type == 'eval_loc_4':
             bad = self._run_command('eval_loc_4', str(work.processor), str(work.location), nop)
 
@@ -128,134 +179,71 @@ class Command(BaseCommand):
 
         else:
             self.stdout.write('[INFO] Finished on work pk=%s at %s' % (work.pk, self._get_stamp()))
+            record_job_cost(work.job_type, time.monotonic() - started)
             work.doing = False
             work.done = True
             work.when_done = timezone.now()
             work.save()
 
-    def _find_and_do_risky_one(self, group):
-        """ Find work for the worker that only handle eval_loc_1 and eval_claims
-            We prevent parallel processing to avoid claiming the same base piece multiple times
-        """
-
-        now = timezone.now()
-        do_work = None
-
-        qset = (Work
-                .objects
-                .filter(done=False,
-                        doing=False,
-                        job_type__in=self.RISKY_JOBS)
-                .exclude(start_after__gt=now)
-                .annotate(group=F('processor') % 4)
-                .filter(group=group)
-                .order_by('start_after'))  # oldest first
-
-        prios = qset.distinct('priority').order_by('priority').values_list('priority', flat=True)
-        if len(prios) == 0:
+    def _find_and_do_work(self):
+        works = self.scheduler.claim()
+        if not works:
             return False        # did no work
 
-        lowest_prio = prios[0]
-        self.stdout.write('[INFO] Lowest priority = %s' % lowest_prio)
-
-        with transaction.atomic():
-            qset = (Work
-                    .objects
-                    .select_for_update()
-                    .filter(done=False,
-                            doing=False,
-                            priority=lowest_prio,
-                            job_type__in=self.RISKY_JOBS)
-                    .exclude(start_after__gt=now)
-                    .annotate(group=F('processor') % 4)
-                    .filter(group=group)
-                    .order_by('start_after'))  # oldest first
-
-            for work in qset.all():
-                used = ProcessorUsedPieces.objects.filter(processor=work.processor).first()
-                if used:
-                    if used.reached_dead_end:
-                        work.delete()
-                        continue    # next job
-
-                work.doing = True
-                work.save(update_fields=['doing'])
-                do_work = work
-                break   # from the for
-            # for
-        # atomic
-
-        if do_work:
-            self._do_work(work)
-            return True
-
-        return False        # did no work
-
-    def _find_and_do_work_4plus(self, no_eval_loc_4):
-        # find some work to pick up
-        now = timezone.now()
-        do_work = None
-
-        # exclude all boards that have an eval_loc_1 pending
-        # skip_procs = list(Work
-        #                   .objects
-        #                   .filter(job_type='eval_loc_1',
-        #                           done=False)
-        #                   .distinct('processor')
-        #                   .values_list('processor', flat=True))
-        #
-        # self.stdout.write('[INFO] Skipping boards %s' % repr(skip_procs))
-
-        qset = (Work
-                .objects
-                .filter(done=False,
-                        doing=False)
-                .exclude(start_after__gt=now)
-                .exclude(job_type__in=self.RISKY_JOBS)
-                # .exclude(processor__in=skip_procs)
-                .order_by('start_after'))  # oldest first
-
-        prios = qset.distinct('priority').order_by('priority').values_list('priority', flat=True)
-        if len(prios) == 0:
-            return False        # did no work
+        if len(works) > 1:
+            self.stdout.write('[INFO] Claimed a batch of %s %s jobs' % (len(works), works[0].job_type))
 
-        lowest_prio = prios[0]
-        self.stdout.write('[INFO] Lowest priority = %s' % lowest_prio)
-
-        with transaction.atomic():
-            qset = (Work
-                    .objects
-                    .select_for_update()
-                    .filter(done=False,
-                            doing=False,
-                            priority=lowest_prio)
-                    .exclude(start_after__gt=now)
-                    .exclude(job_type__in=self.RISKY_JOBS)
-                    # .exclude(processor__in=skip_procs)
-                    .order_by('start_after'))  # oldest first
-
-            if no_eval_loc_4:
-                qset = qset.exclude(job_type='eval_loc_4')
-
-            for work in qset.all():
-                used = ProcessorUsedPieces.objects.filter(processor=work.processor).first()
-                if used:
-                    if used.reached_dead_end:
-                        work.delete()
-                        continue    # next job
-
-                work.doing = True
-                work.save(update_fields=['doing'])
-                do_work = work
-                break   # from the for
+        started = 0
+        try:
+            for nr, work in enumerate(works):
+                started = nr + 1
+                if nr > 0 and check_dead_end(work.processor):
+                    # the rest of the batch is no longer useful
+                    work.delete()
+                else:
+                    self._do_work(work)
             # for
-        # atomic
+        finally:
+            # a job raised an exception: hand back the jobs of the batch that did not run
+            pks = [work.pk for work in works[started:]]
+            if pks:
+                Work.objects.filter(pk__in=pks, done=False).update(doing=False)
+
+            self.scheduler.release()
+
+        return True
+
+    def _on_notify(self, notify):
+        # called by psycopg whenever a notification is received, also during other queries
+        if notify.channel == WORK_NOTIFY_CHANNEL:
+            if notify.payload == '' or self.scheduler.takes(notify.payload):
+                self.work_announced = True
+
+    def _listen(self):
+        """ start listening for new work; repeated after the database connection was re-opened """
+        connection.ensure_connection()
+        self.listen_conn = connection.connection
+        self.listen_conn.add_notify_handler(self._on_notify)
+        with connection.cursor() as cursor:
+            cursor.execute('LISTEN %s' % WORK_NOTIFY_CHANNEL)
+
+    def _wait_for_work(self, timeout):
+        """ block until new work is announced, or the timeout expires (delayed work, missed notifications) """
+        if connection.vendor != 'postgresql':
+            time.sleep(timeout)
+            return
+
+        if connection.connection is None or connection.connection is not self.listen_conn:
+            self._listen()
 
-        if do_work:
-            self._do_work(work)
-            return True
+        if not self.work_announced:
+            readable, _, _ = select.select([self.listen_conn.fileno()], [], [], timeout)
+            if readable:
+                # let psycopg read the notifications
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
 
-        return False        # did no work
+        self.work_announced = False
 
     def handle(self, *args, **options):
         worker_nr = options['worker_nr']
@@ -277,30 +265,65 @@ class Command(BaseCommand):
             self.stdout.write('[INFO] Deleting %s obsolete work (deleted boards)' % qset.count())
             qset.delete()
 
+            # keep the checkpoints of the ongoing work, so it can resume
+            qset = EvalCheckpoint.objects.exclude(processor__in=procs)
+            self.stdout.write('[INFO] Deleting %s obsolete checkpoints (deleted boards)' % qset.count())
+            qset.delete()
+
+            qset = EvalProfile.objects.exclude(processor__in=procs)
+            self.stdout.write('[INFO] Deleting %s obsolete profiles (deleted boards)' % qset.count())
+            qset.delete()
+
             # restart all ongoing work
             self.stdout.write('[INFO] Resetting all doing work')
             Work.objects.filter(done=False, doing=True).update(doing=False)
             EvalProgress.objects.all().delete()
             return
 
-        # keep one worker available for small tasks
-        only_concurrency_risks = worker_nr in (1, 2, 3, 4)
-        no_eval_loc_4 = worker_nr > 10
+        self.use_call_command = options['call_command']
+        if not self.use_call_command:
+            # load the shared data before the first job, so the jobs do not pay for it
+            started = time.monotonic()
+            piece_index = get_piece_index()
+            get_twoside_nrs()
+            self.stdout.write('[INFO] Loaded %s Piece2x2 from %s in %.1f seconds' % (
+                                    piece_index.count, piece_index.source, time.monotonic() - started))
+
+        if options['tags']:
+            tags = [tag.strip() for tag in options['tags'].split(',') if tag.strip()]
+        else:
+            tags = get_default_tags(worker_nr)
+
+        quotas = dict()
+        for quota in options['quota']:
+            job_class, _, count = quota.partition('=')
+            if not count.isdigit():
+                self.stderr.write('[ERROR] Invalid quota %s' % repr(quota))
+                return
+            quotas[job_class] = int(count)
+        # for
+
+        for job_class in list(tags) + list(quotas.keys()):
+            if job_class not in ALL_TAGS:
+                self.stderr.write('[ERROR] Unknown job class %s; choose from %s' % (repr(job_class), repr(ALL_TAGS)))
+                return
+        # for
 
-        duration = 2 if only_concurrency_risks else 10
+        self.stdout.write('[INFO] Tags: %s; quotas: %s' % (",".join(tags), repr(quotas)))
+        self.scheduler = WorkScheduler(tags, quotas)
+
+        # the timeout also covers the work with a delayed start
+        duration = 2 if 'serial' in tags else 10
+
+        if connection.vendor == 'postgresql':
+            self._listen()
 
         while worker_nr:
-            if only_concurrency_risks:
-                group = worker_nr % 4
-                did_work = self._find_and_do_risky_one(group)
-            else:
-                did_work = self._find_and_do_work_4plus(no_eval_loc_4)
+            did_work = self._find_and_do_work()
 
             if not did_work:
                 self.stdout.write('[INFO] Waiting for more work')
-                time.sleep(duration)
-            else:
-                time.sleep(0.1)
+                self._wait_for_work(duration)
         # while
 
 # end of file
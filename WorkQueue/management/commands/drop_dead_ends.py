@@ -5,7 +5,7 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions
+from Pieces2x2.segment_options import get_segment_option_processors, get_segment_option_counts, delete_segment_options
 from WorkQueue.models import ProcessorUsedPieces
 
 
@@ -117,8 +117,11 @@ class Command(BaseCommand):
         # clean up the TwoSideOptions
         if commit:
             proc_nrs = list(ProcessorUsedPieces.objects.distinct('processor').values_list('processor', flat=True))
-            TwoSideOptions.objects.exclude(processor__in=proc_nrs).delete()
-        count = TwoSideOptions.objects.count()
-        print('[INFO] %s TwoSideOption records left' % count)
+            for processor in get_segment_option_processors():
+                if processor not in proc_nrs:
+                    delete_segment_options(processor)
+            # for
+        count = sum(get_segment_option_counts().values())
+        print('[INFO] %s TwoSideOptions left' % count)
 
 # end of file
@@ -5,10 +5,12 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions, Piece2x2
+from Pieces2x2.models import Piece2x2
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
 from WorkQueue.models import ProcessorUsedPieces
-from WorkQueue.operations import set_loc_used, used_note_add
+from WorkQueue.operations import set_loc_used, used_note_add, clone_board, get_unused
+import time
 
 
 class Command(BaseCommand):
@@ -33,26 +35,16 @@ class Command(BaseCommand):
         parser.add_argument('processor', type=int, help='Processor to duplicate')
 
     def _load_filled_locations(self):
-        for loc in range(1, 64+1):
-            loc_str = 'loc%s' % loc
-            if getattr(self.proc, loc_str) == 0:
+        for loc, p2x2_nr in enumerate(self.proc.loc_nrs, start=1):
+            if p2x2_nr == 0:
                 self.locs_free.append(loc)
         # for
         if self.verbose:
             self.stdout.write('[INFO] %s unfilled locations' % len(self.locs_free))
 
     def _load_unused(self):
-        unused_border = list(range(1, 256 + 1))
-        unused_center = list(range(61, 256 + 1))
-        for nr in range(1, 256 + 1):
-            nr_str = 'nr%s' % nr
-            if getattr(self.proc, nr_str, False):
-                # this piece is used
-                if nr in unused_center:
-                    unused_center.remove(nr)
-                if nr in unused_border:
-                    unused_border.remove(nr)
-        # for
+        unused_border = get_unused(self.proc)
+        unused_center = [nr for nr in unused_border if nr > 60]
         if self.verbose:
             self.stdout.write('[INFO] %s unused pieces in the border' % len(unused_border))
             self.stdout.write('[INFO] %s unused pieces in the center' % len(unused_center))
@@ -92,19 +84,15 @@ class Command(BaseCommand):
         for loc in self.locs_free:
             self.loc2claims[loc] = list()
 
-        for claim in self.proc.claimed_nrs_single.split(','):
-            if claim:
-                base_nr_str, loc_str = claim.split(':')
-                loc_nr = int(loc_str)
-                base_nr = int(base_nr_str)
-                self.loc2claims[loc_nr].append(base_nr)
-
-                # remove as available piece for all locs except where needed
-                for loc in self.locs_free:
-                    if loc != loc_nr:
-                        if base_nr in self.loc2unused[loc]:
-                            self.loc2unused[loc].remove(base_nr)
-                # for
+        for base_nr, loc_nr in self.proc.claims_single:
+            self.loc2claims[loc_nr].append(base_nr)
+
+            # remove as available piece for all locs except where needed
+            for loc in self.locs_free:
+                if loc != loc_nr:
+                    if base_nr in self.loc2unused[loc]:
+                        self.loc2unused[loc].remove(base_nr)
+            # for
         # for
 
         # for claim in used.claimed_nrs_double.split(','):
@@ -120,11 +108,8 @@ class Command(BaseCommand):
         # # for
 
     def _load_side_options(self):
-        for segment in range(1, 165+1):
-            self.segment2two_sides[segment] = list()
-        # for
-        for option in TwoSideOptions.objects.filter(processor=self.proc.processor):
-            self.segment2two_sides[option.segment].append(option.two_side)
+        for segment, options in load_segment_options(self.proc.processor).items():
+            self.segment2two_sides[segment] = sorted(options)
         # for
 
     def _determine_loc_with_fewest_options(self):
@@ -185,31 +170,11 @@ class Command(BaseCommand):
         if self.verbose:
             self.stdout.write('[INFO] Creating new processor %s' % new_processor)
 
-        # load a copy, then modify and save
-        work = ProcessorUsedPieces.objects.get(processor=self.proc.processor)
-        work.pk = None
-        work.processor = new_processor
-        work.created_from = self.proc.processor
-        work.save()
-
-        used_note_add(work.processor, 'Duplicated from %s by dup_fix_lowest' % work.created_from)
-
-        # clean-up (just in case)
-        TwoSideOptions.objects.filter(processor=new_processor).all().delete()
-
-        # copy all the TwoSideOptions
-        bulk = []
-        for segment, two_sides in self.segment2two_sides.items():
-            for two_side in two_sides:
-                option = TwoSideOptions(
-                            processor=new_processor,
-                            segment=segment,
-                            two_side=two_side)
-                bulk.append(option)
-        # for
-        TwoSideOptions.objects.bulk_create(bulk)
+        started = time.monotonic()
+        work = clone_board(self.proc.processor, new_processor,
+                           'Duplicated from %s by dup_fix_lowest' % self.proc.processor)
         if self.verbose:
-            self.stdout.write('[INFO] Copied %s two-side options' % len(bulk))
+            self.stdout.write('[INFO] Cloned board in %.3f seconds' % (time.monotonic() - started))
 
         return work
 
@@ -225,13 +190,10 @@ class Command(BaseCommand):
 
         bulk_reduce = dict()       # [segment] = [two_side, ..]
 
+        seg2options = load_segment_options(work.processor)
         for side_nr in (1, 2, 3, 4):
             segment = calc_segment(loc, side_nr)
-            side_options = list(TwoSideOptions
-                                .objects
-                                .filter(processor=work.processor,
-                                        segment=segment)
-                                .values_list('two_side', flat=True))
+            side_options = sorted(seg2options[segment])
 
             side_field = 'side%s' % side_nr
             side_new = getattr(p2x2, side_field)
@@ -248,8 +210,7 @@ class Command(BaseCommand):
         # for
 
         for segment, two_sides in bulk_reduce.items():
-            qset = TwoSideOptions.objects.filter(processor=work.processor, segment=segment, two_side__in=two_sides)
-            qset.delete()
+            remove_segment_options(work.processor, segment, two_sides)
         # for
 
         set_loc_used(work.processor, loc, p2x2)
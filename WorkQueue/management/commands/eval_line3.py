@@ -6,9 +6,13 @@
 
 from django.utils import timezone
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2, EvalProgress
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.models import Piece2x2, EvalProgress
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.piece_index import get_piece_index, get_twoside_nr
+from Pieces2x2.segment_options import load_segment_options, has_segment_option, remove_segment_options
 from WorkQueue.operations import propagate_segment_reduction, get_unused_for_locs, check_dead_end
+from WorkQueue.profiling import EvalProfiler
 import time
 
 
@@ -58,9 +62,10 @@ class Command(BaseCommand):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.twoside_border = TwoSide.objects.get(two_sides='XX').nr
+        self.twoside_border = get_twoside_nr('XX')
 
         self.processor = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.locs = (1, 2, 3, 4, 5, 6, 7, 8,
                      9, 10, 11, 12, 13, 14, 15, 16,
                      17, 18, 19, 20, 21, 22, 23, 24,
@@ -92,12 +97,14 @@ class Command(BaseCommand):
             self.board[loc] = None
 
         self.board_order = []   # solve order (for popping)
-        self.board_unused = []
+        self.board_unused = PieceSet()
+        self.piece_index = None
         self.solve_order = []
         self.requested_order = []
         self.prev_tick = time.monotonic()
         self.deadline = 0
         self.progress = None
+        self.profiler = None
 
         self.progress_15min = -1
 
@@ -175,16 +182,12 @@ class Command(BaseCommand):
 
     def _query_segment_options(self, segment):
         """ Return the options remaining for a specific segment """
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
         # self.stdout.write('[DEBUG] Segment %s has %s options' % (segment, len(options)))
         return options
 
     def _get_segments_options(self):
+        self.seg2options = load_segment_options(self.processor)
         for loc in self.locs:
             for side in range(1, 4+1):
                 segment = calc_segment(loc, side)
@@ -216,56 +219,43 @@ class Command(BaseCommand):
     def _board_place(self, p_nr: int, p2x2):
         self.board_order.append(p_nr)
         self.board[p_nr] = p2x2
-        self.board_unused.remove(p2x2.nr1)
-        self.board_unused.remove(p2x2.nr2)
-        self.board_unused.remove(p2x2.nr3)
-        self.board_unused.remove(p2x2.nr4)
+        self.board_unused.take((p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
 
     def _board_pop(self):
         p_nr = self.board_order[-1]
         self.board_order = self.board_order[:-1]
         p2x2 = self.board[p_nr]
         self.board[p_nr] = None
-        self.board_unused.extend([p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4])
+        self.board_unused.give_back((p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
 
     def _iter(self, loc, options_side1, options_side2, options_side3, options_side4):
-        unused = self.board_unused[:]
+        unused = self.board_unused.copy()
 
         # if loc != 36 and 139 in unused:
-        #     unused.remove(139)
+        #     unused.discard(139)
 
         if loc != 10 and 208 in unused:
-            unused.remove(208)
+            unused.discard(208)
 
         if loc != 15 and 255 in unused:
-            unused.remove(255)
+            unused.discard(255)
 
         if loc != 50 and 181 in unused:
-            unused.remove(181)
+            unused.discard(181)
 
         if loc != 55 and 249 in unused:
-            unused.remove(249)
+            unused.discard(249)
 
-        for p in (Piece2x2
-                  .objects
-                  .filter(side1__in=options_side1,
-                          side2__in=options_side2,
-                          side3__in=options_side3,
-                          side4__in=options_side4,
-                          nr1__in=unused,
-                          nr2__in=unused,
-                          nr3__in=unused,
-                          nr4__in=unused)
-                  .iterator(chunk_size=10000)):
+        for p in self.piece_index.iter_fits(options_side1, options_side2, options_side3, options_side4, unused):
+            self.profiler.candidates += 1
             yield p
         # for
 
     def _reduce(self, segment, two_side):
-        qset = TwoSideOptions.objects.filter(processor=self.processor, segment=segment, two_side=two_side)
-        if qset.count() == 1:
+        if has_segment_option(self.processor, segment, two_side):
             self.stdout.write('[INFO] Reduction segment %s: %s' % (segment, two_side))
             if self.do_commit:
-                qset.delete()
+                remove_segment_options(self.processor, segment, [two_side])
                 propagate_segment_reduction(self.processor, segment)
             self.reductions += 1
         # else: most likely deleted by a parallel operation
@@ -292,17 +282,14 @@ class Command(BaseCommand):
                     twoside_open.append(p2x2.side4)
         # for
 
-        qset = Piece2x2.objects.filter(nr1__in=self.board_unused, nr2__in=self.board_unused,
-                                       nr3__in=self.board_unused, nr4__in=self.board_unused)
         # counts = dict()
         for side in set(twoside_open):
             # ensure we have a Piece2x2 that can connect to this side
-            p2x2 = qset.filter(side1=side).first()
-            if not p2x2:
+            if not self.piece_index.has_fit([side], None, None, None, self.board_unused):
                 # no solution
                 # print('[DEBUG] check_open_ends: out of options for side: %s' % repr(side))
                 return False
-            # counts[side] = qset.filter(side1=side_rev).count()
+            # counts[side] = self.piece_index.count_fits([side], None, None, None, self.board_unused)
         # for
 
         # print('[DEBUG] check_open_ends: all good: %s' % repr(counts))
@@ -319,11 +306,6 @@ class Command(BaseCommand):
 
         # decide the next best position on the board to solve
 
-        qset = Piece2x2.objects.filter(nr1__in=self.board_unused,
-                                       nr2__in=self.board_unused,
-                                       nr3__in=self.board_unused,
-                                       nr4__in=self.board_unused)
-
         loc_counts = []
         for loc in self.locs:
             if self.board[loc] is None:
@@ -352,10 +334,8 @@ class Command(BaseCommand):
                     if p:
                         options_side4 = [p.side2]
 
-                count = qset.filter(side1__in=options_side1,
-                                    side2__in=options_side2,
-                                    side3__in=options_side3,
-                                    side4__in=options_side4).count()
+                count = self.piece_index.count_fits(options_side1, options_side2, options_side3, options_side4,
+                                                    self.board_unused)
                 tup = (count, loc)
                 loc_counts.append(tup)
 
@@ -379,6 +359,8 @@ class Command(BaseCommand):
         return -1, True
 
     def _find_recurse(self):
+        self.profiler.count_node(len(self.board_order))
+
         tick = time.monotonic()
         if tick - self.prev_tick > 5:
             self.prev_tick = tick
@@ -431,6 +413,7 @@ class Command(BaseCommand):
             if self._check_open_ends():
                 found = self._find_recurse()
             else:
+                self.profiler.pruned += 1
                 found = False
 
             self._board_pop()
@@ -507,6 +490,9 @@ class Command(BaseCommand):
             self.progress.updated = timezone.now()
             self.progress.save(update_fields=['left_count', 'updated'])
 
+            nodes = self.profiler.nodes
+            start = time.monotonic()
+
             # place the first piece
             seg1, seg2, seg3, seg4 = self.segment_nrs[loc]
             options_side1 = self.segment_options[seg1]
@@ -536,8 +522,10 @@ class Command(BaseCommand):
                     break
             # for
 
+            seconds = time.monotonic() - start
             if not found:
                 self._reduce(segment, side)
+            self.profiler.option_done(segment, side, found, self.profiler.nodes - nodes, seconds)
 
             todo -= 1
             self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
@@ -554,66 +542,76 @@ class Command(BaseCommand):
         side = options['side'][0]
         self.stdout.write('[INFO] Side: %s' % side)
 
-        if side == 1:
-            self.locs = (1, 2, 3, 4, 10, 9, 11, 5, 6, 7, 8, 15, 16, 14, 13, 12, 11, 17, 18, 19, 20, 21, 22, 23, 24)
-            segments = (102, 103, 104, 105, 106, 107, 108, 9, 10, 11, 12, 13, 14, 15, 16,
-                        110, 111, 112, 113, 114, 115, 116, 17, 18, 19, 20, 21, 22, 23, 24)
-        elif side == 2:
-            self.locs = (8, 16, 24, 32, 15, 7, 23, 40, 48, 56, 64, 55, 63, 47, 39, 31, 6, 14, 22, 30, 38, 46, 54, 62)
-            segments = (16, 24, 32, 40, 48, 56, 64, 108, 116, 124, 132, 140, 148, 156, 164,
-                        15, 23, 31, 39, 47, 55, 63, 107, 115, 123, 131, 139, 147, 155, 163)
-        elif side == 3:
-            self.locs = (57, 58, 59, 60, 50, 49, 51, 61, 62, 63, 64, 55, 56, 54, 53, 52, 41, 42, 43, 44, 45, 46, 47, 48)
-            segments = (158, 159, 160, 161, 162, 163, 164, 57, 58, 59, 60, 61, 62, 63, 64,
-                        150, 151, 152, 153, 154, 155, 156, 49, 50, 51, 52, 53, 54, 55, 56)
-        else:
-            self.locs = (1, 9, 17, 25, 10, 2, 18, 33, 41, 49, 57, 50, 58, 42, 34, 26, 3, 11, 19, 27, 35, 43, 51, 59)
-            segments = (9, 17, 25, 33, 41, 49, 57, 102, 110, 118, 126, 134, 142, 150, 158,
-                        10, 18, 26, 34, 42, 50, 58, 103, 111, 119, 127, 135, 143, 151, 159)
+        self.profiler = EvalProfiler(self.processor, 'eval_line3', side)
+        self.profiler.start()
+        try:
+            if side == 1:
+                self.locs = (1, 2, 3, 4, 10, 9, 11, 5, 6, 7, 8, 15, 16, 14, 13, 12, 11, 17, 18, 19, 20, 21, 22, 23, 24)
+                segments = (102, 103, 104, 105, 106, 107, 108, 9, 10, 11, 12, 13, 14, 15, 16,
+                            110, 111, 112, 113, 114, 115, 116, 17, 18, 19, 20, 21, 22, 23, 24)
+            elif side == 2:
+                self.locs = (8, 16, 24, 32, 15, 7, 23, 40, 48, 56, 64, 55,
+                             63, 47, 39, 31, 6, 14, 22, 30, 38, 46, 54, 62)
+                segments = (16, 24, 32, 40, 48, 56, 64, 108, 116, 124, 132, 140, 148, 156, 164,
+                            15, 23, 31, 39, 47, 55, 63, 107, 115, 123, 131, 139, 147, 155, 163)
+            elif side == 3:
+                self.locs = (57, 58, 59, 60, 50, 49, 51, 61, 62, 63, 64, 55,
+                             56, 54, 53, 52, 41, 42, 43, 44, 45, 46, 47, 48)
+                segments = (158, 159, 160, 161, 162, 163, 164, 57, 58, 59, 60, 61, 62, 63, 64,
+                            150, 151, 152, 153, 154, 155, 156, 49, 50, 51, 52, 53, 54, 55, 56)
+            else:
+                self.locs = (1, 9, 17, 25, 10, 2, 18, 33, 41, 49, 57, 50, 58, 42, 34, 26, 3, 11, 19, 27, 35, 43, 51, 59)
+                segments = (9, 17, 25, 33, 41, 49, 57, 102, 110, 118, 126, 134, 142, 150, 158,
+                            10, 18, 26, 34, 42, 50, 58, 103, 111, 119, 127, 135, 143, 151, 159)
 
-        self.requested_order = self.locs[:]
+            self.requested_order = self.locs[:]
 
-        # self.stdout.write('[INFO] Initial solve order: %s' % repr(self.requested_order))
+            # self.stdout.write('[INFO] Initial solve order: %s' % repr(self.requested_order))
 
-        self.prev_tick = time.monotonic()
+            self.prev_tick = time.monotonic()
 
-        self.progress = EvalProgress(
-                        eval_size=96,  # 4x8x3 = 96
-                        eval_loc=self.locs[0],
-                        processor=self.processor,
-                        segment=0,
-                        todo_count=0,
-                        left_count=0,
-                        solve_order='',
-                        updated=timezone.now())
-        self.progress.save()
+            self.piece_index = get_piece_index()
 
-        try:
-            for segment in segments:
-                if check_dead_end(self.processor):
-                    self.stdout.write('[WARNING] Dead-end')
-                    return
+            self.progress = EvalProgress(
+                            eval_size=96,  # 4x8x3 = 96
+                            eval_loc=self.locs[0],
+                            processor=self.processor,
+                            segment=0,
+                            todo_count=0,
+                            left_count=0,
+                            solve_order='',
+                            updated=timezone.now())
+            self.progress.save()
 
-                # due to runtime, refresh for every segment
-                self.board_unused = self._get_unused()
-                self._get_segments_options()
-                self._find_filled_locs()
+            try:
+                for segment in segments:
+                    if check_dead_end(self.processor):
+                        self.stdout.write('[WARNING] Dead-end')
+                        return
 
-                loc, _ = self._segment_to_loc(segment)
-                self.requested_order = [loc]
+                    # due to runtime, refresh for every segment
+                    self.board_unused = PieceSet(self._get_unused())
+                    self._get_segments_options()
+                    self._find_filled_locs()
 
-                self._find_reduce(segment)
+                    loc, _ = self._segment_to_loc(segment)
+                    self.requested_order = [loc]
 
-        except KeyboardInterrupt:
-            pass
+                    self._find_reduce(segment)
 
-        self.progress.delete()
+            except KeyboardInterrupt:
+                pass
 
-        if self.reductions == 0:
-            self.stdout.write('[INFO] No reductions')
-        else:
-            self.stdout.write('[INFO] Reductions: %s' % self.reductions)
-            if not self.do_commit:
-                self.stdout.write('[WARNING] Drop the --dryrun to keep')
+            self.progress.delete()
+            self.profiler.save()
+
+            if self.reductions == 0:
+                self.stdout.write('[INFO] No reductions')
+            else:
+                self.stdout.write('[INFO] Reductions: %s' % self.reductions)
+                if not self.do_commit:
+                    self.stdout.write('[WARNING] Drop the --dryrun to keep')
+        finally:
+            self.profiler.stop()
 
 # end of file
@@ -6,10 +6,12 @@
 
 from django.utils import timezone
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2, EvalProgress
+from Pieces2x2.models import EvalProgress
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.piece_index import get_piece_index, get_twoside_nr
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
 from WorkQueue.models import ProcessorUsedPieces
-from WorkQueue.operations import (propagate_segment_reduction, get_unused_for_locs, set_loc_used, request_eval_claims,
+from WorkQueue.operations import (propagate_segment_reductions, get_unused_for_locs, set_loc_used, request_eval_claims,
                                   set_dead_end)
 import sys
 
@@ -21,9 +23,10 @@ class Command(BaseCommand):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.twoside_border = TwoSide.objects.get(two_sides='XX').nr
+        self.twoside_border = get_twoside_nr('XX')
 
         self.processor_nr = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.loc = 0
         self.reductions = {1: 0, 2: 0, 3: 0, 4: 0}     # [side_nr] = count
         self.bulk_reduce = dict()       # [segment] = [two_side, ..]
@@ -63,12 +66,7 @@ class Command(BaseCommand):
 
     def _get_side_options(self, side_nr):
         segment = calc_segment(self.loc, side_nr)
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor_nr,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
 
         # print('segment %s options: %s' % (segment, repr(options)))
         return options
@@ -108,6 +106,7 @@ class Command(BaseCommand):
 
         unused = self._get_unused(options['claimed'])
 
+        self.seg2options = load_segment_options(self.processor_nr)
         side1_options = self._get_side_options(1)
         side2_options = self._get_side_options(2)
         side3_options = self._get_side_options(3)
@@ -120,29 +119,21 @@ class Command(BaseCommand):
 
         self.stdout.write('[INFO] Side options: %s, %s, %s, %s' % (count1, count2, count3, count4))
 
-        qset = (Piece2x2
-                .objects
-                .filter(side1__in=side1_options,
-                        side2__in=side2_options,
-                        side3__in=side3_options,
-                        side4__in=side4_options,
-                        nr1__in=unused,
-                        nr2__in=unused,
-                        nr3__in=unused,
-                        nr4__in=unused))
-
+        hint = None
         if self.loc == 36:
-            qset = qset.filter(nr2=139)
+            hint = (2, 139)
         elif self.loc == 10:
-            qset = qset.filter(nr1=208)
+            hint = (1, 208)
         elif self.loc == 15:
-            qset = qset.filter(nr2=255)
+            hint = (2, 255)
         elif self.loc == 50:
-            qset = qset.filter(nr3=181)
+            hint = (3, 181)
         elif self.loc == 55:
-            qset = qset.filter(nr4=249)
+            hint = (4, 249)
 
-        count = qset.count()
+        piece_index = get_piece_index()
+        bits = piece_index.fits(side1_options, side2_options, side3_options, side4_options, unused, hint)
+        count = bits.bit_count()
 
         if count == 0:
             # not filled in and no options left --> dead end
@@ -173,10 +164,10 @@ class Command(BaseCommand):
 
         self.stdout.write('[INFO] Number of Piece2x2: %s' % count)
 
-        side1_new = list(qset.distinct('side1').values_list('side1', flat=True))
-        side2_new = list(qset.distinct('side2').values_list('side2', flat=True))
-        side3_new = list(qset.distinct('side3').values_list('side3', flat=True))
-        side4_new = list(qset.distinct('side4').values_list('side4', flat=True))
+        side1_new = piece_index.get_remaining_options(bits, 1, side1_options)
+        side2_new = piece_index.get_remaining_options(bits, 2, side2_options)
+        side3_new = piece_index.get_remaining_options(bits, 3, side3_options)
+        side4_new = piece_index.get_remaining_options(bits, 4, side4_options)
 
         if len(side1_new) != count1:
             # reduction
@@ -211,24 +202,21 @@ class Command(BaseCommand):
             # for
 
         for segment, two_sides in self.bulk_reduce.items():
-            qset2 = TwoSideOptions.objects.filter(processor=self.processor_nr, segment=segment, two_side__in=two_sides)
-            qset2.delete()
+            remove_segment_options(self.processor_nr, segment, two_sides)
         # for
 
         if not nop:
-            for segment in self.bulk_reduce.keys():
-                propagate_segment_reduction(self.processor_nr, segment)
-            # for
+            propagate_segment_reductions(self.processor_nr, self.bulk_reduce.keys())
 
         if count == 1:
             # only 1 solution left: set the base pieces as used
             self.stdout.write('[INFO] Single solution left for loc %s' % self.loc)
-            p2x2 = qset.first()
+            p2x2 = next(piece_index.iter_pieces(bits))
             set_loc_used(self.processor_nr, self.loc, p2x2)
             return
 
         if count < 10:
-            for p2x2 in qset:
+            for p2x2 in piece_index.iter_pieces(bits):
                 print('[DEBUG] p2x2 nr %s has base nrs [%s, %s, %s, %s]' % (p2x2.nr,
                                                                             p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
             # for
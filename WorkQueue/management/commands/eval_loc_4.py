@@ -6,11 +6,15 @@
 
 from django.utils import timezone
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2, EvalProgress
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.models import EvalProgress
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options, has_segment_option, remove_segment_options
+from Pieces2x2.square_search import SquareSearch, SquareSearchPool
+from Pieces2x2.witness_cache import load_witnesses, save_witness
 from WorkQueue.models import Work
 from WorkQueue.operations import propagate_segment_reduction, get_unused_for_locs, check_dead_end
-import time
+from WorkQueue.profiling import EvalProfiler
 
 
 class Command(BaseCommand):
@@ -34,24 +38,18 @@ class Command(BaseCommand):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.twoside_border = TwoSide.objects.get(two_sides='XX').nr
-
         self.processor = 0
         self.locs = (0, 0, 0, 0)        # p0..p3
-        self.side_options = ([], [], [], [], [], [], [], [], [], [], [], [])        # s0..s11
         self.variation = 99
 
         self.reductions = 0
         self.segment_limit = 50
-        self.unused0 = []
+        self.search = None
+        self.pool = None
         self.progress = None
+        self.profiler = None
         self.do_commit = True
 
-        # disabled, because of some reason this fails to remove options
-        # self._sides5_seen = []
-        # self._sides6_seen = []
-        # self._sides8_seen = []
-
         self.nop = False
 
     def add_arguments(self, parser):
@@ -59,6 +57,7 @@ class Command(BaseCommand):
         parser.add_argument('loc', type=int, help='Top-left location on the board (1..55)')
         parser.add_argument('--limit', default=50, type=int, help='Skip segment evaluation above this limit')
         parser.add_argument('--nop', action='store_true', help='Do not propagate')
+        parser.add_argument('--jobs', default=1, type=int, help='Number of options to evaluate in parallel')
         parser.add_argument('--dryrun', action='store_true')
 
     def _get_unused(self):
@@ -82,47 +81,6 @@ class Command(BaseCommand):
         self.stdout.write('[INFO] %s base pieces in use or claimed' % (256 - len(unused)))
         return unused
 
-    def _get_loc_side_options(self, loc, side_nr):
-        segment = calc_segment(loc, side_nr)
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
-        # self.stdout.write('[DEBUG] Segment %s has %s options' % (segment, len(options)))
-        return options
-
-    def _get_side_options(self):
-        """
-                  s0          s1
-                +----+      +----+
-            s2  | p0 |  s3  | p1 |  s4
-                +----+      +----+
-                  s5          s6
-                +----+      +----+
-            s7  | p2 |  s8  | p3 |  s9
-                +----+      +----+
-                 s10         s11
-        """
-        s0 = self._get_loc_side_options(self.locs[0], 1)
-        s1 = self._get_loc_side_options(self.locs[1], 1)
-        s2 = self._get_loc_side_options(self.locs[0], 4)
-        s3 = self._get_loc_side_options(self.locs[0], 2)
-        s4 = self._get_loc_side_options(self.locs[1], 2)
-        s5 = self._get_loc_side_options(self.locs[2], 1)
-        s6 = self._get_loc_side_options(self.locs[3], 1)
-        s7 = self._get_loc_side_options(self.locs[2], 4)
-        s8 = self._get_loc_side_options(self.locs[2], 2)
-        s9 = self._get_loc_side_options(self.locs[3], 2)
-        s10 = self._get_loc_side_options(self.locs[2], 3)
-        s11 = self._get_loc_side_options(self.locs[3], 3)
-
-        self.side_options = [s0, s1, s2, s3, s4, s5, s6, s7, s8, s9, s10, s11]
-
-        self.variation = sum([sum(options) for options in self.side_options])
-        self.stdout.write('[INFO] Variation is %s' % self.variation)
-
     def _limit_work(self, options):
         if len(options) >= 5 * self.segment_limit:      # default: 250
             # 250..289 --> reduce to 1/6 = 33..48
@@ -151,175 +109,22 @@ class Command(BaseCommand):
 
         return options
 
-    @staticmethod
-    def _iter(loc, unused1, options_side1, options_side2, options_side3, options_side4):
-        if len(options_side1) == 1 and len(options_side2) == 1 and len(options_side3) == 1 and len(options_side4) == 1:
-            # special case: this location is already filled, so it can be skipped
-            p2x2 = Piece2x2(nr=0,
-                            nr1=0, nr2=0, nr3=0, nr4=0,
-                            side1=options_side1[0],
-                            side2=options_side2[0],
-                            side3=options_side3[0],
-                            side4=options_side4[0])
-            yield p2x2, unused1
-            return
-
-        qset = (Piece2x2
-                .objects
-                .filter(side1__in=options_side1,
-                        side2__in=options_side2,
-                        side3__in=options_side3,
-                        side4__in=options_side4,
-                        nr1__in=unused1,
-                        nr2__in=unused1,
-                        nr3__in=unused1,
-                        nr4__in=unused1))
-
-        if loc == 36:
-            qset = qset.filter(nr2=139)
-        elif loc == 10:
-            qset = qset.filter(nr1=208)
-        elif loc == 15:
-            qset = qset.filter(nr2=255)
-        elif loc == 50:
-            qset = qset.filter(nr3=181)
-        elif loc == 55:
-            qset = qset.filter(nr4=249)
-
-        for p in qset.iterator(chunk_size=1000):
-            unused2 = unused1[:]
-            unused2.remove(p.nr1)
-            unused2.remove(p.nr2)
-            unused2.remove(p.nr3)
-            unused2.remove(p.nr4)
-            yield p, unused2
-        # for
-
     def _reduce(self, segment, two_side):
-        qset = TwoSideOptions.objects.filter(processor=self.processor, segment=segment, two_side=two_side)
-        if qset.count() == 1:
+        if has_segment_option(self.processor, segment, two_side):
             self.stdout.write('[INFO] Reduction segment %s: %s' % (segment, two_side))
             if self.do_commit:
-                qset.delete()
+                remove_segment_options(self.processor, segment, [two_side])
             self.reductions += 1
             if not self.nop:
                 propagate_segment_reduction(self.processor, segment)
         # else: most likely deleted by parallel operation
 
-    def _reduce_s3(self):
-        """
-                  s0          s1
-                +----+      +----+
-            s2  | p0 |  s3  | p1 |  s4
-                +----+      +----+
-                  s5          s6
-                +----+      +----+
-            s7  | p2 |  s8  | p3 |  s9
-                +----+      +----+
-                 s10         s11
-        """
-        segment = calc_segment(self.locs[0], 2)
-        sides = self.side_options[3]
-        original_todo = len(sides)
-        sides = self._limit_work(sides)
-        todo = len(sides)
-
-        self.progress.segment = segment
-        self.progress.todo_count = todo
-        self.progress.left_count = todo
-        self.progress.save(update_fields=['segment', 'todo_count', 'left_count'])
-
-        self.stdout.write('[INFO] Checking %s of %s options in segment %s' % (todo, original_todo, segment))
-        for side in sides:
-            if check_dead_end(self.processor):
-                return
-
-            self.progress.left_count -= 1
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['left_count', 'updated'])
-
-            deadline = time.monotonic() + self.MAX_SECONDS_SEARCH
-
-            p0_exp_s2 = side
-            p1_exp_s4 = side
-            found = False
-            for p0, unused1 in self._iter(self.locs[0],
-                                          self.unused0,
-                                          self.side_options[0],
-                                          [p0_exp_s2],
-                                          self.side_options[5],
-                                          self.side_options[2]):
-                p2_exp_s1 = p0.side3
-
-                for p1, unused2 in self._iter(self.locs[1],
-                                              unused1,
-                                              self.side_options[1],
-                                              self.side_options[4],
-                                              self.side_options[6],
-                                              [p1_exp_s4]):
-                    p3_exp_s1 = p1.side3
-
-                    for p2, unused3 in self._iter(self.locs[2],
-                                                  unused2,
-                                                  [p2_exp_s1],
-                                                  self.side_options[8],
-                                                  self.side_options[10],
-                                                  self.side_options[7]):
-                        p3_exp_s4 = p2.side2
-
-                        for p3, _ in self._iter(self.locs[3],
-                                                unused3,
-                                                [p3_exp_s1],
-                                                self.side_options[9],
-                                                self.side_options[11],
-                                                [p3_exp_s4]):
-                            # found a combi of p0..p3
-                            found = True
-                            # avoid repeating
-                            # self._sides5_seen.append(p2.side1)
-                            # self._sides6_seen.append(p3.side1)
-                            # self._sides8_seen.append(p2.side2)
-                            break
-                        # for
-
-                        if time.monotonic() > deadline:
-                            found = True
-
-                        if found:
-                            break
-                    # for
-                    if found:
-                        break
-                # for
-                if found:
-                    break
-            # for
-
-            if not found:
-                self._reduce(segment, side)
-                # built up history is no longer valid
-                # self._sides5_seen = []
-                # self._sides6_seen = []
-                # self._sides8_seen = []
-
-            todo -= 1
-            self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
-        # for
-
-    def _reduce_s5(self):
+    def _reduce_segment(self, p_nr, side_n):
+        """ check each option of one of the inner segments: s3 (p0 side 2), s5 (p0 side 3),
+            s6 (p1 side 3) or s8 (p2 side 2)
         """
-                  s0          s1
-                +----+      +----+
-            s2  | p0 |  s3  | p1 |  s4
-                +----+      +----+
-                  s5          s6
-                +----+      +----+
-            s7  | p2 |  s8  | p3 |  s9
-                +----+      +----+
-                 s10         s11
-        """
-        segment = calc_segment(self.locs[0], 3)
-        sides = self.side_options[5]
+        segment = calc_segment(self.locs[p_nr], side_n)
+        sides = self.search.get_side_options(p_nr, side_n)
         original_todo = len(sides)
         sides = self._limit_work(sides)
         todo = len(sides)
@@ -330,275 +135,27 @@ class Command(BaseCommand):
         self.progress.save(update_fields=['segment', 'todo_count', 'left_count'])
 
         self.stdout.write('[INFO] Checking %s of %s options in segment %s' % (todo, original_todo, segment))
-        for side in sides:
-            # if side in self._sides5_seen:
-            #     continue
 
-            if check_dead_end(self.processor):
-                return
-
-            self.progress.left_count -= 1
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['left_count', 'updated'])
-
-            deadline = time.monotonic() + self.MAX_SECONDS_SEARCH
-
-            p0_exp_s3 = side
-            p2_exp_s1 = side
-            found = False
-            for p0, unused1 in self._iter(self.locs[0],
-                                          self.unused0,
-                                          self.side_options[0],
-                                          self.side_options[3],
-                                          [p0_exp_s3],
-                                          self.side_options[2]):
-                p1_exp_s4 = p0.side2
-
-                for p2, unused2 in self._iter(self.locs[2],
-                                              unused1,
-                                              [p2_exp_s1],
-                                              self.side_options[8],
-                                              self.side_options[10],
-                                              self.side_options[7]):
-                    p3_exp_s4 = p2.side2
-
-                    for p1, unused3 in self._iter(self.locs[1],
-                                                  unused2,
-                                                  self.side_options[1],
-                                                  self.side_options[4],
-                                                  self.side_options[6],
-                                                  [p1_exp_s4]):
-                        p3_exp_s1 = p1.side3
-
-                        for p3, _ in self._iter(self.locs[3],
-                                                unused3,
-                                                [p3_exp_s1],
-                                                self.side_options[9],
-                                                self.side_options[11],
-                                                [p3_exp_s4]):
-                            # found a combi of p0..p3
-                            found = True
-                            # avoid repeating
-                            # self._sides6_seen.append(p3.side1)
-                            # self._sides8_seen.append(p2.side2)
-                            break
-                        # for
-
-                        if time.monotonic() > deadline:
-                            found = True
-
-                        if found:
-                            break
-                    # for
-                    if found:
-                        break
-                # for
-                if found:
-                    break
-            # for
-
-            if not found:
+        # assume a solution is still possible when the time limit is reached
+        searcher = self.pool or self.search
+        for side, found, _, nodes, seconds in searcher.iter_results(p_nr, side_n, sides,
+                                                                    time_limit=self.MAX_SECONDS_SEARCH):
+            if found:
+                save_witness(self.search, segment, side)
+            else:
                 self._reduce(segment, side)
-                # built up history is no longer valid
-                # self._sides6_seen = []
-                # self._sides8_seen = []
+            self.profiler.option_done(segment, side, found, nodes, seconds)
 
             todo -= 1
             self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
-        # for
-
-    def _reduce_s6(self):
-        """
-                  s0          s1
-                +----+      +----+
-            s2  | p0 |  s3  | p1 |  s4
-                +----+      +----+
-                  s5          s6
-                +----+      +----+
-            s7  | p2 |  s8  | p3 |  s9
-                +----+      +----+
-                 s10         s11
-        """
-        segment = calc_segment(self.locs[1], 3)
-        sides = self.side_options[6]
-        original_todo = len(sides)
-        sides = self._limit_work(sides)
-        todo = len(sides)
-
-        self.progress.segment = segment
-        self.progress.todo_count = todo
-        self.progress.left_count = todo
-        self.progress.save(update_fields=['segment', 'todo_count', 'left_count'])
-
-        self.stdout.write('[INFO] Checking %s of %s options in segment %s' % (todo, original_todo, segment))
-        for side in sides:
-            # if side in self._sides6_seen:
-            #     continue
 
-            if check_dead_end(self.processor):
-                return
-
-            self.progress.left_count -= 1
+            # update the progress record in the database
+            self.progress.left_count = todo
             self.progress.updated = timezone.now()
             self.progress.save(update_fields=['left_count', 'updated'])
 
-            deadline = time.monotonic() + self.MAX_SECONDS_SEARCH
-
-            p1_exp_s3 = side
-            p3_exp_s1 = side
-            found = False
-            for p1, unused1 in self._iter(self.locs[1],
-                                          self.unused0,
-                                          self.side_options[1],
-                                          self.side_options[4],
-                                          [p1_exp_s3],
-                                          self.side_options[3]):
-                p0_exp_s2 = p1.side4
-
-                for p3, unused2 in self._iter(self.locs[3],
-                                              unused1,
-                                              [p3_exp_s1],
-                                              self.side_options[9],
-                                              self.side_options[11],
-                                              self.side_options[8]):
-                    p2_exp_s2 = p3.side4
-
-                    for p0, unused3 in self._iter(self.locs[0],
-                                                  unused2,
-                                                  self.side_options[0],
-                                                  [p0_exp_s2],
-                                                  self.side_options[5],
-                                                  self.side_options[2]):
-                        p2_exp_s1 = p0.side3
-
-                        for p2, _ in self._iter(self.locs[2],
-                                                unused3,
-                                                [p2_exp_s1],
-                                                [p2_exp_s2],
-                                                self.side_options[10],
-                                                self.side_options[7]):
-                            # found a combi of p0..p3
-                            found = True
-                            # avoid repeating
-                            # self._sides8_seen.append(p2.side2)
-                            break
-                        # for
-
-                        if time.monotonic() > deadline:
-                            found = True
-
-                        if found:
-                            break
-                    # for
-                    if found:
-                        break
-                # for
-                if found:
-                    break
-            # for
-
-            if not found:
-                self._reduce(segment, side)
-                # built up history is no longer valid
-                # self._sides8_seen = []
-
-            todo -= 1
-            self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
-        # for
-
-    def _reduce_s8(self):
-        """
-                  s0          s1
-                +----+      +----+
-            s2  | p0 |  s3  | p1 |  s4
-                +----+      +----+
-                  s5          s6
-                +----+      +----+
-            s7  | p2 |  s8  | p3 |  s9
-                +----+      +----+
-                 s10         s11
-        """
-        segment = calc_segment(self.locs[2], 2)
-        sides = self.side_options[8]
-        original_todo = len(sides)
-        sides = self._limit_work(sides)
-        todo = len(sides)
-
-        self.progress.segment = segment
-        self.progress.todo_count = todo
-        self.progress.left_count = todo
-        self.progress.save(update_fields=['segment', 'todo_count', 'left_count'])
-
-        self.stdout.write('[INFO] Checking %s of %s options in segment %s' % (todo, original_todo, segment))
-        for side in sides:
-            # if side in self._sides8_seen:
-            #     continue
-
             if check_dead_end(self.processor):
                 return
-
-            self.progress.left_count -= 1
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['left_count', 'updated'])
-
-            deadline = time.monotonic() + self.MAX_SECONDS_SEARCH
-
-            p2_exp_s2 = side
-            p3_exp_s4 = side
-            found = False
-            for p2, unused1 in self._iter(self.locs[2],
-                                          self.unused0,
-                                          self.side_options[5],
-                                          [p2_exp_s2],
-                                          self.side_options[10],
-                                          self.side_options[7]):
-                p0_exp_s3 = p2.side1
-
-                for p3, unused2 in self._iter(self.locs[3],
-                                              unused1,
-                                              self.side_options[6],
-                                              self.side_options[9],
-                                              self.side_options[11],
-                                              [p3_exp_s4]):
-                    p1_exp_s3 = p3.side1
-
-                    for p0, unused3 in self._iter(self.locs[0],
-                                                  unused2,
-                                                  self.side_options[0],
-                                                  self.side_options[3],
-                                                  [p0_exp_s3],
-                                                  self.side_options[2]):
-                        p1_exp_s4 = p0.side2
-
-                        for _ in self._iter(self.locs[1],
-                                            unused3,
-                                            self.side_options[1],
-                                            self.side_options[4],
-                                            [p1_exp_s3],
-                                            [p1_exp_s4]):
-                            # found a combi of p0..p3
-                            found = True
-                            break
-                        # for
-
-                        if time.monotonic() > deadline:
-                            found = True
-
-                        if found:
-                            break
-                    # for
-                    if found:
-                        break
-                # for
-                if found:
-                    break
-            # for
-
-            if not found:
-                self._reduce(segment, side)
-
-            todo -= 1
-            self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
         # for
 
     def handle(self, *args, **options):
@@ -628,90 +185,94 @@ class Command(BaseCommand):
 
         self.processor = options['processor']
         self.stdout.write('[INFO] Processor=%s' % self.processor)
-        try:
-            work = Work.objects.get(processor=self.processor, job_type='eval_loc_4', location=loc)
-        except Work.DoesNotExist:
-            work = None
-        else:
-            work.doing = True
-            work.save(update_fields=['doing'])
-
-        self.segment_limit = options['limit']
-        self.stdout.write('[INFO] Segment limit: %s' % self.segment_limit)
-
-        self.nop = options['nop']
-
-        self.unused0 = self._get_unused()
-
-        self._get_side_options()
-        # self.stdout.write('%s' % ", ".join([str(len(opt)) for opt in self.side_options]))
-
-        msg = "[%s, %s, %s, %s]" % (calc_segment(self.locs[0], 2),
-                                    calc_segment(self.locs[0], 3),
-                                    calc_segment(self.locs[1], 3),
-                                    calc_segment(self.locs[2], 2))
-
-        self.progress = EvalProgress(
-                            eval_size=4,
-                            eval_loc=loc,
-                            processor=self.processor,
-                            segment=0,
-                            todo_count=0,
-                            left_count=0,
-                            solve_order=msg,
-                            updated=timezone.now())
-        self.progress.save()
 
+        self.profiler = EvalProfiler(self.processor, 'eval_loc_4', loc)
+        self.profiler.start()
         try:
-            self._reduce_s3()
+            try:
+                work = Work.objects.get(processor=self.processor, job_type='eval_loc_4', location=loc)
+            except Work.DoesNotExist:
+                work = None
+            else:
+                work.doing = True
+                work.save(update_fields=['doing'])
 
-            if check_dead_end(self.processor):
-                self.stdout.write('[WARNING] Dead end')
-                return
+            self.segment_limit = options['limit']
+            self.stdout.write('[INFO] Segment limit: %s' % self.segment_limit)
 
-            self.progress.solve_order = msg
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['solve_order', 'updated'])
-            # self._sides5_seen = frozenset(self._sides5_seen)
-            self._reduce_s5()
+            self.nop = options['nop']
 
-            if check_dead_end(self.processor):
-                self.stdout.write('[WARNING] Dead end')
-                return
+            unused = PieceSet(self._get_unused())
 
-            self.progress.solve_order = msg
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['solve_order', 'updated'])
-            # self._sides6_seen = frozenset(self._sides6_seen)
-            self._reduce_s6()
+            self.search = SquareSearch(self.locs, load_segment_options(self.processor), unused)
+            self.search.witnesses = load_witnesses(self.locs)
 
-            if check_dead_end(self.processor):
-                self.stdout.write('[WARNING] Dead end')
-                return
+            self.variation = self.search.calc_variation()
+            self.stdout.write('[INFO] Variation is %s' % self.variation)
 
-            self.progress.solve_order = msg
-            self.progress.updated = timezone.now()
-            self.progress.save(update_fields=['solve_order', 'updated'])
-            # self._sides8_seen = frozenset(self._sides8_seen)
-            self._reduce_s8()
-
-            if work:
-                work.done = True
-                work.doing = False
-                work.save(update_fields=['done', 'doing'])
-
-        except KeyboardInterrupt:
-            if work:
-                work.doing = False
-                work.save(update_fields=['doing'])
+            if options['jobs'] > 1:
+                self.stdout.write('[INFO] Jobs: %s' % options['jobs'])
+                self.pool = SquareSearchPool(self.search, options['jobs'])
+
+            msg = "[%s, %s, %s, %s]" % (calc_segment(self.locs[0], 2),
+                                        calc_segment(self.locs[0], 3),
+                                        calc_segment(self.locs[1], 3),
+                                        calc_segment(self.locs[2], 2))
 
-        self.progress.delete()
+            self.progress = EvalProgress(
+                                eval_size=4,
+                                eval_loc=loc,
+                                processor=self.processor,
+                                segment=0,
+                                todo_count=0,
+                                left_count=0,
+                                solve_order=msg,
+                                updated=timezone.now())
+            self.progress.save()
+
+            try:
+                # s3, s5, s6, s8
+                for p_nr, side_n in ((0, 2), (0, 3), (1, 3), (2, 2)):
+                    if check_dead_end(self.processor):
+                        self.stdout.write('[WARNING] Dead end')
+                        return
+
+                    self.progress.solve_order = msg
+                    self.progress.updated = timezone.now()
+                    self.progress.save(update_fields=['solve_order', 'updated'])
+
+                    self._reduce_segment(p_nr, side_n)
+                # for
 
-        if self.reductions == 0:
-            self.stdout.write('[INFO] No reductions')
-        else:
-            self.stdout.write('[INFO] Reductions: %s' % self.reductions)
-            if not self.do_commit:
-                self.stdout.write('[WARNING] Use --commit to keep')
+                if work:
+                    work.done = True
+                    work.doing = False
+                    work.save(update_fields=['done', 'doing'])
+
+            except KeyboardInterrupt:
+                if work:
+                    work.doing = False
+                    work.save(update_fields=['doing'])
+            finally:
+                if self.pool:
+                    self.pool.close()
+
+            self.progress.delete()
+
+            self.profiler.add_search(self.search)
+            self.profiler.save()
+
+            self.stdout.write('[INFO] Search nodes: %s' % self.search.nodes)
+            self.stdout.write('[INFO] Witness cache: %s hits, %s misses' % (self.search.witness_hits,
+                                                                          self.search.witness_misses))
+
+            if self.reductions == 0:
+                self.stdout.write('[INFO] No reductions')
+            else:
+                self.stdout.write('[INFO] Reductions: %s' % self.reductions)
+                if not self.do_commit:
+                    self.stdout.write('[WARNING] Use --commit to keep')
+        finally:
+            self.profiler.stop()
 
 # end of file
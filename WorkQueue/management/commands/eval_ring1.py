@@ -6,8 +6,12 @@
 
 from django.utils import timezone
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2, EvalProgress
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.models import Piece2x2, EvalProgress
+from Pieces2x2.eval_checkpoint import Checkpointer
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.piece_index import get_piece_index, get_twoside_nr
+from Pieces2x2.segment_options import load_segment_options, has_segment_option, remove_segment_options
 from WorkQueue.operations import propagate_segment_reduction, get_unused_for_locs
 import time
 
@@ -39,9 +43,10 @@ class Command(BaseCommand):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        self.twoside_border = TwoSide.objects.get(two_sides='XX').nr
+        self.twoside_border = get_twoside_nr('XX')
 
         self.processor = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.segment = 0
         self.locs = (1, 2, 3, 4, 5, 6, 7, 8,
                      9, 10, 15, 16,
@@ -74,12 +79,14 @@ class Command(BaseCommand):
             self.board[loc] = None
 
         self.board_order = []   # solve order (for popping)
-        self.board_unused = []
+        self.board_unused = PieceSet()
+        self.piece_index = None
         self.solve_order = []
         self.requested_order = []
         self.prev_tick = time.monotonic()
         self.deadline = 0
         self.progress = None
+        self.checkpoint = None
 
         self.progress_15min = -1
 
@@ -158,16 +165,12 @@ class Command(BaseCommand):
 
     def _query_segment_options(self, segment):
         """ Return the options remaining for a specific segment """
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
         # self.stdout.write('[DEBUG] Segment %s has %s options' % (segment, len(options)))
         return options
 
     def _get_segments_options(self):
+        self.seg2options = load_segment_options(self.processor)
         for loc in self.locs:
             for side in range(1, 4+1):
                 segment = calc_segment(loc, side)
@@ -198,56 +201,42 @@ class Command(BaseCommand):
     def _board_place(self, p_nr: int, p2x2):
         self.board_order.append(p_nr)
         self.board[p_nr] = p2x2
-        self.board_unused.remove(p2x2.nr1)
-        self.board_unused.remove(p2x2.nr2)
-        self.board_unused.remove(p2x2.nr3)
-        self.board_unused.remove(p2x2.nr4)
+        self.board_unused.take((p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
 
     def _board_pop(self):
         p_nr = self.board_order[-1]
         self.board_order = self.board_order[:-1]
         p2x2 = self.board[p_nr]
         self.board[p_nr] = None
-        self.board_unused.extend([p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4])
+        self.board_unused.give_back((p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
 
     def _iter(self, loc, options_side1, options_side2, options_side3, options_side4):
-        unused = self.board_unused[:]
+        unused = self.board_unused.copy()
 
         # if loc != 36 and 139 in unused:
-        #     unused.remove(139)
+        #     unused.discard(139)
 
         # if loc != 10 and 208 in unused:
-        #     unused.remove(208)
+        #     unused.discard(208)
         #
         # if loc != 15 and 255 in unused:
-        #     unused.remove(255)
+        #     unused.discard(255)
         #
         # if loc != 50 and 181 in unused:
-        #     unused.remove(181)
+        #     unused.discard(181)
         #
         # if loc != 55 and 249 in unused:
-        #     unused.remove(249)
+        #     unused.discard(249)
 
-        for p in (Piece2x2
-                  .objects
-                  .filter(side1__in=options_side1,
-                          side2__in=options_side2,
-                          side3__in=options_side3,
-                          side4__in=options_side4,
-                          nr1__in=unused,
-                          nr2__in=unused,
-                          nr3__in=unused,
-                          nr4__in=unused)
-                  .iterator(chunk_size=10000)):
+        for p in self.piece_index.iter_fits(options_side1, options_side2, options_side3, options_side4, unused):
             yield p
         # for
 
     def _reduce(self, segment, two_side):
-        qset = TwoSideOptions.objects.filter(processor=self.processor, segment=segment, two_side=two_side)
-        if qset.count() == 1:
+        if has_segment_option(self.processor, segment, two_side):
             self.stdout.write('[INFO] Reduction segment %s: %s' % (segment, two_side))
             if self.do_commit:
-                qset.delete()
+                remove_segment_options(self.processor, segment, [two_side])
                 propagate_segment_reduction(self.processor, segment)
             self.reductions += 1
         # else: most likely deleted by a parallel operation
@@ -274,17 +263,14 @@ class Command(BaseCommand):
                     twoside_open.append(p2x2.side4)
         # for
 
-        qset = Piece2x2.objects.filter(nr1__in=self.board_unused, nr2__in=self.board_unused,
-                                       nr3__in=self.board_unused, nr4__in=self.board_unused)
         # counts = dict()
         for side in set(twoside_open):
             # ensure we have a Piece2x2 that can connect to this side
-            p2x2 = qset.filter(side1=side).first()
-            if not p2x2:
+            if not self.piece_index.has_fit([side], None, None, None, self.board_unused):
                 # no solution
                 # print('[DEBUG] check_open_ends: out of options for side: %s' % repr(side))
                 return False
-            # counts[side] = qset.filter(side1=side_rev).count()
+            # counts[side] = self.piece_index.count_fits([side], None, None, None, self.board_unused)
         # for
 
         # print('[DEBUG] check_open_ends: all good: %s' % repr(counts))
@@ -301,11 +287,6 @@ class Command(BaseCommand):
 
         # decide the next best position on the board to solve
 
-        qset = Piece2x2.objects.filter(nr1__in=self.board_unused,
-                                       nr2__in=self.board_unused,
-                                       nr3__in=self.board_unused,
-                                       nr4__in=self.board_unused)
-
         loc_counts = []
         for loc in self.locs:
             if self.board[loc] is None:
@@ -334,10 +315,8 @@ class Command(BaseCommand):
                     if p:
                         options_side4 = [p.side2]
 
-                count = qset.filter(side1__in=options_side1,
-                                    side2__in=options_side2,
-                                    side3__in=options_side3,
-                                    side4__in=options_side4).count()
+                count = self.piece_index.count_fits(options_side1, options_side2, options_side3, options_side4,
+                                                    self.board_unused)
                 tup = (count, loc)
                 loc_counts.append(tup)
 
@@ -469,6 +448,10 @@ class Command(BaseCommand):
             # no work
             return
 
+        # skip the options decided before a restart
+        sides = [side for side in sides if not self.checkpoint.is_decided(self.segment, side)]
+        todo = len(sides)
+
         self.solve_order = self.requested_order[:]       # allow deciding optimal order anew
 
         loc, side_n = self._segment_to_loc(self.segment)
@@ -514,6 +497,7 @@ class Command(BaseCommand):
 
             if not found:
                 self._reduce(self.segment, side)
+            self.checkpoint.add(self.segment, side, not found)
 
             todo -= 1
             self.stdout.write('[INFO] Left: %s/%s' % (todo, len(sides)))
@@ -583,7 +567,7 @@ class Command(BaseCommand):
 
         self.stdout.write('[INFO] Initial solve order: %s' % repr(self.requested_order))
 
-        self.board_unused = self._get_unused()
+        self.board_unused = PieceSet(self._get_unused())
 
         self._get_segments_options()
         # self.stdout.write('%s' % ", ".join([str(len(opt)) for opt in self.side_options]))
@@ -595,6 +579,12 @@ class Command(BaseCommand):
 
         self.prev_tick = time.monotonic()
 
+        self.piece_index = get_piece_index()
+
+        self.checkpoint = Checkpointer(self.processor, 48, 1, self.segment, self.segment_options, self.board_unused)
+        if self.checkpoint.resumed_count():
+            self.stdout.write('[INFO] Resuming with %s decided options' % self.checkpoint.resumed_count())
+
         self.progress = EvalProgress(
                         eval_size=48,  # 8x8-4x4 = 64-16 = 48
                         eval_loc=1,
@@ -608,8 +598,12 @@ class Command(BaseCommand):
 
         try:
             self._find_reduce()
+
+            # complete: nothing to resume
+            self.checkpoint.delete()
+
         except KeyboardInterrupt:
-            pass
+            self.checkpoint.save()
 
         self.progress.delete()
 
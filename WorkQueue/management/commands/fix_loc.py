@@ -5,9 +5,10 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2
+from Pieces2x2.models import TwoSide, Piece2x2
 from Pieces2x2.helpers import calc_segment
-from WorkQueue.operations import (propagate_segment_reduction, set_loc_used, get_unused_for_locs, request_eval_claims,
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
+from WorkQueue.operations import (propagate_segment_reductions, set_loc_used, get_unused_for_locs, request_eval_claims,
                                   used_note_add)
 
 
@@ -22,6 +23,7 @@ class Command(BaseCommand):
 
         self.loc = 0
         self.processor = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.reductions = {1: 0, 2: 0, 3: 0, 4: 0}     # [side_nr] = count
         self.unused = []
         self.do_commit = False
@@ -63,12 +65,7 @@ class Command(BaseCommand):
 
     def _get_side_options(self, side_nr):
         segment = calc_segment(self.loc, side_nr)
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
 
         # print('segment %s options: %s' % (segment, repr(options)))
         return options
@@ -97,6 +94,7 @@ class Command(BaseCommand):
 
         self._get_unused(options['claimed'])
 
+        self.seg2options = load_segment_options(self.processor)
         options1 = self._get_side_options(1)
         options2 = self._get_side_options(2)
         options3 = self._get_side_options(3)
@@ -195,15 +193,12 @@ class Command(BaseCommand):
 
         if self.do_commit:
             for segment, two_sides in self.bulk_reduce.items():
-                qset = TwoSideOptions.objects.filter(processor=self.processor, segment=segment, two_side__in=two_sides)
-                qset.delete()
+                remove_segment_options(self.processor, segment, two_sides)
             # for
             set_loc_used(self.processor, self.loc, p2x2)
 
             if not nop:
-                for segment in self.bulk_reduce.keys():
-                    propagate_segment_reduction(self.processor, segment)
-            # for
+                propagate_segment_reductions(self.processor, self.bulk_reduce.keys())
 
         total = sum(self.reductions.values())
         if total == 0:
@@ -5,8 +5,8 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSideOptions
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
 from WorkQueue.operations import propagate_segment_reduction, request_eval_claims, used_note_add
 
 
@@ -27,12 +27,7 @@ class Command(BaseCommand):
 
     @staticmethod
     def _get_side_options(processor, segment):
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        return list(options)
+        return sorted(load_segment_options(processor)[segment])
 
     def handle(self, *args, **options):
 
@@ -46,12 +41,7 @@ class Command(BaseCommand):
         segment = calc_segment(loc, side)
         self.stdout.write('[INFO] Processor=%s; Segment: %s' % (processor, segment))
 
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = self._get_side_options(processor, segment)
 
         self.stdout.write('[INFO] Selecting %s / %s' % (index, len(options)))
         if 0 <= index < len(options):
@@ -60,11 +50,11 @@ class Command(BaseCommand):
             self.stderr.write('[ERROR] Invalid index')
             return
 
-        qset = TwoSideOptions.objects.filter(processor=processor, segment=segment).exclude(two_side=keep)
-        self.stdout.write('[INFO] Reductions: %s' % qset.count())
+        reduce = [two_side for two_side in options if two_side != keep]
+        self.stdout.write('[INFO] Reductions: %s' % len(reduce))
 
         if do_commit:
-            qset.delete()
+            remove_segment_options(processor, segment, reduce)
 
             msg = 'fix_seg %s %s' % (segment, index)
             used_note_add(processor, msg)
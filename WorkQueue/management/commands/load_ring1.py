@@ -5,9 +5,11 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.core.management.base import BaseCommand
-from Pieces2x2.models import TwoSide, TwoSideOptions, Piece2x2
+from Pieces2x2.models import TwoSide, Piece2x2
 from Pieces2x2.helpers import calc_segment
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
 from WorkQueue.models import ProcessorUsedPieces
+from WorkQueue.operations import mark_loc_used
 from Ring1.models import Ring1
 
 
@@ -21,6 +23,7 @@ class Command(BaseCommand):
         self.twoside_border = TwoSide.objects.get(two_sides='XX').nr
 
         self.processor = 0
+        self.seg2options = dict()       # [segment] = frozenset(two_side, ..)
         self.do_commit = False
         self.bulk_reduce = dict()       # [segment] = [two_side, ..]
 
@@ -30,12 +33,7 @@ class Command(BaseCommand):
 
     def _get_loc_side_options(self, loc, side_nr):
         segment = calc_segment(loc, side_nr)
-        options = (TwoSideOptions
-                   .objects
-                   .filter(processor=self.processor,
-                           segment=segment)
-                   .values_list('two_side', flat=True))
-        options = list(options)
+        options = sorted(self.seg2options[segment])
 
         # print('segment %s options: %s' % (segment, repr(options)))
         return options
@@ -66,6 +64,8 @@ class Command(BaseCommand):
             self.stderr.write('[ERROR] Processor not found')
             return
 
+        self.seg2options = load_segment_options(self.processor)
+
         locs = (1, 2, 3, 4, 5, 6, 7, 8,
                 9, 10, 11, 14, 15, 16,
                 17, 18, 23, 24,
@@ -82,14 +82,8 @@ class Command(BaseCommand):
             # print('loc %s ring1 %s = %s' % (loc, field_str, p2x2_nr))
             if p2x2_nr > 0:
 
-                field_str = 'loc%s' % loc
-                setattr(processor, field_str, p2x2_nr)
                 p2x2 = Piece2x2.objects.get(nr=p2x2_nr)
-
-                for base_nr in (p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4):
-                    field_str = 'nr%s' % base_nr
-                    setattr(processor, field_str, True)
-                # for
+                mark_loc_used(processor, loc, p2x2)
 
                 # reduce the segment options
                 for side_nr in (1, 2, 3, 4):
@@ -113,8 +107,7 @@ class Command(BaseCommand):
         processor.save()
 
         for segment, two_sides in self.bulk_reduce.items():
-            qset = TwoSideOptions.objects.filter(processor=self.processor, segment=segment, two_side__in=two_sides)
-            qset.delete()
+            remove_segment_options(self.processor, segment, two_sides)
         # for
 
 
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+from django.db import transaction
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from BasePieces.piece_set import PieceSet
+from Pieces2x2.models import EvalProgress
+from Pieces2x2.helpers import calc_segment
+from Pieces2x2.piece_index import get_piece_index
+from Pieces2x2.segment_options import load_segment_options, remove_segment_options
+from Pieces2x2.square_search import LOC_HINTS
+from WorkQueue.models import ProcessorUsedPieces
+from WorkQueue.operations import (segment_to_loc_1, set_loc_used, set_dead_end, request_eval_claims,
+                                  get_used_mask)
+import collections
+import time
+
+
+class Command(BaseCommand):
+
+    help = "Run eval_loc_1 for a complete board in memory, until no more reductions are found"
+
+    """
+        Loads all TwoSideOptions of the board once and evaluates one location at a time, exactly like eval_loc_1.
+        A reduced segment puts the locations next to it back on the worklist (see propagate_segment_reduction),
+        so the evaluation order follows the work queue, without the round-trips through the Work table.
+
+        All deletions and filled locations are written in a single transaction at the end.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.processor_nr = 0
+        self.piece_index = None
+
+        self.seg2options = dict()       # [segment] = [two_side, ..]
+        self.removed = dict()           # [segment] = [two_side, ..]
+        self.filled = dict()            # [loc] = Piece2x2
+        self.new_filled = dict()        # [loc] = Piece2x2
+        self.used = PieceSet()          # base pieces in use
+        self.claims_single = []         # [(nr, loc), ..]
+        self.claims_double = []         # [(nr, loc1, loc2), ..]
+
+        self.eval_count = 0
+        self.dead_end_loc = 0
+
+    def add_arguments(self, parser):
+        parser.add_argument('processor', type=int, help='Processor number to use')
+        parser.add_argument('--dry-run', action='store_true', help='Report, but do not store the results')
+
+    def _load_board(self, used):
+        self.used = PieceSet.from_mask(get_used_mask(used))
+
+        for loc, p2x2_nr in enumerate(used.loc_nrs, start=1):
+            if p2x2_nr > 0:
+                self.filled[loc] = p2x2_nr
+        # for
+
+        self.claims_single = [tuple(claim) for claim in used.claims_single]
+        self.claims_double = [tuple(claim) for claim in used.claims_double]
+
+        for segment, options in load_segment_options(self.processor_nr).items():
+            self.seg2options[segment] = sorted(options)
+        # for
+
+    def _get_unused(self, loc):
+        """ same as get_unused_for_locs + removal of the hints, for a single location """
+        unused = PieceSet(range(1, 256+1))
+        unused.take(self.used)
+
+        for nr, claim_loc in self.claims_single:
+            if claim_loc != loc:
+                unused.discard(nr)
+        # for
+
+        for nr, loc1, loc2 in self.claims_double:
+            if loc1 != loc and loc2 != loc:
+                unused.discard(nr)
+        # for
+
+        for hint_loc, hint in LOC_HINTS.items():
+            if hint_loc != loc:
+                unused.discard(hint[1])
+        # for
+
+        return unused
+
+    def _eval_loc(self, loc):
+        """ returns the reduced segments, or None when the location cannot be filled anymore """
+        self.eval_count += 1
+
+        unused = self._get_unused(loc)
+        segments = [calc_segment(loc, side) for side in (1, 2, 3, 4)]
+        options = [self.seg2options.get(segment, []) for segment in segments]
+
+        bits = self.piece_index.fits(options[0], options[1], options[2], options[3], unused, LOC_HINTS.get(loc, None))
+        count = bits.bit_count()
+        if count == 0:
+            return None
+
+        reduced = []
+        for side in (1, 2, 3, 4):
+            side_options = options[side - 1]
+            side_new = self.piece_index.get_remaining_options(bits, side, side_options)
+            if len(side_new) != len(side_options):
+                segment = segments[side - 1]
+                self.removed.setdefault(segment, []).extend([two_side
+                                                             for two_side in side_options
+                                                             if two_side not in side_new])
+                self.seg2options[segment] = side_new
+                reduced.append(segment)
+        # for
+
+        if count == 1:
+            # only 1 solution left: set the base pieces as used
+            p2x2 = next(self.piece_index.iter_pieces(bits))
+            self.stdout.write('[INFO] Single solution left for loc %s: p2x2 nr %s' % (loc, p2x2.nr))
+            self.filled[loc] = p2x2.nr
+            self.new_filled[loc] = p2x2
+            self.used.give_back((p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4))
+
+        return reduced
+
+    def _propagate(self):
+        todo = collections.deque([loc for loc in range(1, 64+1) if loc not in self.filled])
+        pending = set(todo)
+
+        while len(todo):
+            loc = todo.popleft()
+            if loc not in self.filled:
+                reduced = self._eval_loc(loc)
+                if reduced is None:
+                    self.dead_end_loc = loc
+                    break
+
+                for segment in reduced:
+                    for loc2 in segment_to_loc_1(segment):
+                        if loc2 not in pending:
+                            pending.add(loc2)
+                            todo.append(loc2)
+                    # for
+                # for
+
+            pending.remove(loc)
+        # while
+
+    def _store(self):
+        with transaction.atomic():
+            for segment, two_sides in self.removed.items():
+                remove_segment_options(self.processor_nr, segment, two_sides)
+            # for
+
+            for loc, p2x2 in self.new_filled.items():
+                set_loc_used(self.processor_nr, loc, p2x2)
+            # for
+
+            if self.dead_end_loc:
+                set_dead_end(self.processor_nr)
+
+                EvalProgress.objects.get_or_create(
+                                eval_size=1,
+                                eval_loc=self.dead_end_loc,
+                                processor=self.processor_nr,
+                                segment=0,
+                                todo_count=0,
+                                left_count=0,
+                                solve_order="Safety stop!",
+                                defaults={'updated': timezone.now()})
+        # atomic
+
+    def handle(self, *args, **options):
+
+        self.processor_nr = options['processor']
+        dry_run = options['dry_run']
+
+        self.stdout.write('[INFO] Processor=%s' % self.processor_nr)
+
+        try:
+            used = ProcessorUsedPieces.objects.get(processor=self.processor_nr)
+        except ProcessorUsedPieces.DoesNotExist:
+            self.stderr.write('[ERROR] Board not found')
+            return
+
+        if used.reached_dead_end:
+            self.stdout.write('[INFO] No work: board reached a dead end')
+            return
+
+        started = time.monotonic()
+
+        self.piece_index = get_piece_index()
+        self._load_board(used)
+        self._propagate()
+
+        removed = sum([len(two_sides) for two_sides in self.removed.values()])
+        self.stdout.write('[INFO] %s evaluations; %s options removed from %s segments; %s locations filled' % (
+                            self.eval_count, removed, len(self.removed), len(self.new_filled)))
+
+        if self.dead_end_loc:
+            self.stdout.write('[INFO] No solution possible for loc %s' % self.dead_end_loc)
+
+        if dry_run:
+            self.stdout.write('[INFO] Dry run: nothing stored')
+        else:
+            self._store()
+
+            if self.dead_end_loc:
+                self.stderr.write('[ERROR] Safety stop')
+            elif removed > 0:
+                request_eval_claims(self.processor_nr)
+
+        self.stdout.write('[INFO] Finished in %.1f seconds' % (time.monotonic() - started))
+
+
+# end of file
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+from django.utils import timezone
+from django.core.management.base import BaseCommand
+from Pieces2x2.board_scan import BoardScan1x1, get_other_hints_mask
+from Pieces2x2.models import EvalProgress
+from Pieces2x2.piece_index import get_piece_index
+from Pieces2x2.segment_options import load_segment_options
+from WorkQueue.models import ProcessorUsedPieces
+from WorkQueue.operations import set_dead_end, request_eval_claims, get_unused_mask_for_locs, apply_board_scan
+import time
+import sys
+
+
+class Command(BaseCommand):
+
+    help = "Eval a possible reduction in TwoSideOptions for all open locations of a board in one pass"
+
+    """
+        Replaces the eval_loc_1 job for each open location (scan1, delayed_scan1).
+        The options and the unused base pieces are loaded once; BoardScan1x1 evaluates all open locations,
+        until no more reductions are found. All deletions and filled locations are written in a single transaction.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.processor_nr = 0
+
+    def add_arguments(self, parser):
+        parser.add_argument('processor', type=int, help='Processor number to use')
+        parser.add_argument('--nop', action='store_true', help='Do not propagate')
+        parser.add_argument('--no-numpy', action='store_true', help='Use the bitsets instead of NumPy')
+
+    @staticmethod
+    def _get_loc2unused(used):
+        """ returns [loc] = unused mask, for each open location """
+        loc2unused = dict()
+        for loc, p2x2_nr in enumerate(used.loc_nrs, start=1):
+            if p2x2_nr == 0:
+                loc2unused[loc] = get_unused_mask_for_locs(used, [loc]) & ~get_other_hints_mask(loc)
+        # for
+        return loc2unused
+
+    def _dead_end(self, loc):
+        self.stdout.write('[INFO] No solution possible for loc %s' % loc)
+        self.stderr.write('[ERROR] Safety stop')
+        set_dead_end(self.processor_nr)
+
+        EvalProgress.objects.get_or_create(
+                        eval_size=1,
+                        eval_loc=loc,
+                        processor=self.processor_nr,
+                        segment=0,
+                        todo_count=0,
+                        left_count=0,
+                        solve_order="Safety stop!",
+                        defaults={'updated': timezone.now()})
+
+    def handle(self, *args, **options):
+
+        self.processor_nr = options['processor']
+        nop = options['nop']
+
+        self.stdout.write('[INFO] Processor=%s' % self.processor_nr)
+
+        try:
+            used = ProcessorUsedPieces.objects.get(processor=self.processor_nr)
+        except ProcessorUsedPieces.DoesNotExist:
+            self.stderr.write('[ERROR] Board not found')
+            return
+
+        if used.reached_dead_end:
+            self.stdout.write('[INFO] No work: board reached a dead end')
+            return
+
+        started = time.monotonic()
+
+        piece_index = get_piece_index()
+        scan = BoardScan1x1(load_segment_options(self.processor_nr), self._get_loc2unused(used),
+                            piece_index, use_numpy=not options['no_numpy'])
+        self.stdout.write('[INFO] %s open locations; engine: %s' % (len(scan.loc2unused), scan.engine))
+
+        if not scan.scan():
+            self._dead_end(scan.dead_loc)
+            sys.exit(1)
+
+        for loc, idx in scan.fills.items():
+            self.stdout.write('[INFO] Single solution left for loc %s: p2x2 nr %s' % (loc, piece_index.nrs[idx]))
+        # for
+
+        removed = apply_board_scan(self.processor_nr, scan)
+        self.stdout.write('[INFO] %s evaluations in %s rounds; %s options removed from %s segments; '
+                          '%s locations filled' % (scan.evaluations, scan.rounds, removed,
+                                                   len(scan.reductions), len(scan.fills)))
+
+        if removed == 0:
+            self.stdout.write('[INFO] No reductions')
+        elif not nop:
+            request_eval_claims(self.processor_nr)
+
+        self.stdout.write('[INFO] Finished in %.1f seconds' % (time.monotonic() - started))
+
+
+# end of file
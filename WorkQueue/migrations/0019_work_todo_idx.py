@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0018_processorusedpieces_from_ring3'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='work',
+            index=models.Index(condition=models.Q(('doing', False), ('done', False)),
+                               fields=['priority', 'start_after'], name='work_todo_idx'),
+        ),
+    ]
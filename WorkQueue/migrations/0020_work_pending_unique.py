@@ -0,0 +1,26 @@
+# Generated by Django 4.2.13 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0019_work_todo_idx'),
+    ]
+
+    operations = [
+        # remove the pending duplicates, keeping the oldest job
+        migrations.RunSQL(
+            sql='DELETE FROM "WorkQueue_work" a USING "WorkQueue_work" b '
+                'WHERE a.done = false AND b.done = false AND a.location > 0 '
+                'AND a.processor = b.processor AND a.job_type = b.job_type AND a.location = b.location '
+                'AND a.id > b.id',
+            reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='work',
+            constraint=models.UniqueConstraint(condition=models.Q(('done', False), ('location__gt', 0)),
+                                               fields=('processor', 'job_type', 'location'),
+                                               name='work_pending_unique'),
+        ),
+    ]
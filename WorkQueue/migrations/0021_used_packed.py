@@ -0,0 +1,77 @@
+# Generated by Django 4.2.13 on 2026-10-18 15:10
+
+import WorkQueue.models
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+def fill_packed(apps, schema_editor):
+    """ fill the new packed fields from the nrN, locN and claimed_nrs_* fields """
+
+    klass = apps.get_model('WorkQueue', 'ProcessorUsedPieces')
+
+    for used in klass.objects.all():
+        mask = 0
+        for nr in range(1, 256+1):
+            if getattr(used, 'nr%s' % nr):
+                mask |= 1 << nr
+        # for
+        used.used_bits = mask.to_bytes(WorkQueue.models.USED_BITS_SIZE, 'little')
+
+        used.loc_nrs = [getattr(used, 'loc%s' % loc) for loc in range(1, 64+1)]
+
+        used.claims_single = list()
+        for claim in used.claimed_nrs_single.split(','):
+            if claim:
+                nr_str, loc_str = claim.split(':')
+                used.claims_single.append([int(nr_str), int(loc_str)])
+        # for
+
+        used.claims_double = list()
+        for claim in used.claimed_nrs_double.split(','):
+            if claim:
+                nr_str, locs_str = claim.split(':')
+                spl = locs_str.split('+')
+                used.claims_double.append([int(nr_str), int(spl[0]), int(spl[1])])
+        # for
+
+        used.save(update_fields=['used_bits', 'loc_nrs', 'claims_single', 'claims_double'])
+    # for
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0020_work_pending_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processorusedpieces',
+            name='used_bits',
+            field=models.BinaryField(default=bytes(33)),
+        ),
+        migrations.AddField(
+            model_name='processorusedpieces',
+            name='loc_nrs',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.PositiveIntegerField(),
+                                                           default=WorkQueue.models._empty_loc_nrs, size=64),
+        ),
+        migrations.AddField(
+            model_name='processorusedpieces',
+            name='claims_single',
+            field=django.contrib.postgres.fields.ArrayField(
+                        base_field=django.contrib.postgres.fields.ArrayField(
+                                        base_field=models.PositiveSmallIntegerField(), size=2),
+                        blank=True, default=list, size=None),
+        ),
+        migrations.AddField(
+            model_name='processorusedpieces',
+            name='claims_double',
+            field=django.contrib.postgres.fields.ArrayField(
+                        base_field=django.contrib.postgres.fields.ArrayField(
+                                        base_field=models.PositiveSmallIntegerField(), size=3),
+                        blank=True, default=list, size=None),
+        ),
+        migrations.RunPython(fill_packed, migrations.RunPython.noop),
+    ]
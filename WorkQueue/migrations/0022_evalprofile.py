@@ -0,0 +1,42 @@
+# Generated by Django 4.2.13 on 2026-10-18 18:05
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0021_used_packed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EvalProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('processor', models.PositiveIntegerField(default=0)),
+                ('job_type', models.CharField(default='', max_length=20)),
+                ('location', models.PositiveSmallIntegerField(default=0)),
+                ('when', models.DateTimeField(auto_now_add=True)),
+                ('seconds', models.FloatField(default=0.0)),
+                ('db_seconds', models.FloatField(default=0.0)),
+                ('db_queries', models.PositiveIntegerField(default=0)),
+                ('nodes', models.BigIntegerField(default=0)),
+                ('candidates', models.BigIntegerField(default=0)),
+                ('pruned', models.BigIntegerField(default=0)),
+                ('depth_counts', django.contrib.postgres.fields.ArrayField(
+                                    base_field=models.BigIntegerField(), blank=True, default=list, size=None)),
+                ('options', django.contrib.postgres.fields.ArrayField(
+                                base_field=django.contrib.postgres.fields.ArrayField(
+                                                base_field=models.BigIntegerField(), size=8),
+                                blank=True, default=list, size=None)),
+                ('work', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL,
+                                           to='WorkQueue.work')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processor', 'when'], name='eval_profile_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0022_evalprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processorusedpieces',
+            name='claimed_nrs_double',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='processorusedpieces',
+            name='claimed_nrs_single',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
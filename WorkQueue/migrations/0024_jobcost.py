@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('WorkQueue', '0023_claims_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobCost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_type', models.CharField(max_length=20, unique=True)),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('seconds', models.FloatField(default=0.0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -5,6 +5,14 @@
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
 from django.db import models
+from django.contrib.postgres.fields import ArrayField
+
+# size of ProcessorUsedPieces.used_bits in bytes: bit nr = base piece nr (1..256)
+USED_BITS_SIZE = 33
+
+
+def _empty_loc_nrs():
+    return [0] * 64
 
 
 class Work(models.Model):
@@ -56,6 +64,20 @@ class Work(models.Model):
     class Meta:
         verbose_name_plural = verbose_name = 'Work'
 
+        indexes = [
+            # supports the job claim in do_work
+            models.Index(fields=['priority', 'start_after'],
+                         condition=models.Q(done=False, doing=False),
+                         name='work_todo_idx'),
+        ]
+
+        constraints = [
+            # at most one pending job per location (see _add_work_bulk)
+            models.UniqueConstraint(fields=['processor', 'job_type', 'location'],
+                                    condition=models.Q(done=False, location__gt=0),
+                                    name='work_pending_unique'),
+        ]
+
     objects = models.Manager()  # for the editor only
 
 
@@ -397,10 +419,10 @@ class ProcessorUsedPieces(models.Model):
     loc64 = models.PositiveIntegerField(default=0)
 
     # claimed_nrs_single: "nr:loc,nr:loc" etc
-    claimed_nrs_single = models.CharField(max_length=512, default='', blank=True)
+    claimed_nrs_single = models.TextField(default='', blank=True)
 
-    # claimed_nrs_double: "nr:loc;loc,nr:loc;loc" etc.
-    claimed_nrs_double = models.CharField(max_length=512, default='', blank=True)
+    # claimed_nrs_double: "nr:loc+loc,nr:loc+loc" etc.
+    claimed_nrs_double = models.TextField(default='', blank=True)
 
     # track when the claim was last evaluated, for automatically triggering a new check
     claimed_at_twoside_count = models.PositiveIntegerField(default=99999)
@@ -412,6 +434,15 @@ class ProcessorUsedPieces(models.Model):
     # logbook of the manual fixes
     choices = models.TextField(default='', blank=True)
 
+    # packed form of the fields above, used by the solvers (see WorkQueue.operations)
+    # the nrN, locN and claimed_nrs_* fields are kept in sync for the admin and the views
+    used_bits = models.BinaryField(default=bytes(USED_BITS_SIZE))
+    loc_nrs = ArrayField(models.PositiveIntegerField(), size=64, default=_empty_loc_nrs)    # [loc - 1] = p2x2 nr
+    claims_single = ArrayField(ArrayField(models.PositiveSmallIntegerField(), size=2),     # [[nr, loc], ..]
+                               default=list, blank=True)
+    claims_double = ArrayField(ArrayField(models.PositiveSmallIntegerField(), size=3),     # [[nr, loc1, loc2], ..]
+                               default=list, blank=True)
+
     def __str__(self):
         msg = "Processor %s" % self.processor
         if self.reached_dead_end:
@@ -419,4 +450,71 @@ class ProcessorUsedPieces(models.Model):
         return msg
 
 
+class EvalProfile(models.Model):
+
+    """ Counters and timing of one evaluator job, for the profiling report on the options page
+
+        Written by the EvalProfiler in WorkQueue.profiling when the job ends.
+    """
+
+    # the job that was profiled, when it came from the work queue
+    work = models.ForeignKey(Work, on_delete=models.SET_NULL, null=True, blank=True)
+
+    # same as Work
+    processor = models.PositiveIntegerField(default=0)
+    job_type = models.CharField(max_length=20, default='')
+    location = models.PositiveSmallIntegerField(default=0)
+
+    # when did the job end?
+    when = models.DateTimeField(auto_now_add=True)
+
+    # run time of the job and the part of it spent on database queries
+    seconds = models.FloatField(default=0.0)
+    db_seconds = models.FloatField(default=0.0)
+    db_queries = models.PositiveIntegerField(default=0)
+
+    # search counters
+    nodes = models.BigIntegerField(default=0)
+    candidates = models.BigIntegerField(default=0)      # length of all candidate lists generated
+    pruned = models.BigIntegerField(default=0)          # placements undone by forward checking / open ends check
+
+    # [depth] = nodes
+    depth_counts = ArrayField(models.BigIntegerField(), default=list, blank=True)
+
+    # [[segment, two_side, found, rounds, nodes, search_ms, db_queries, db_ms], ..]
+    options = ArrayField(ArrayField(models.BigIntegerField(), size=8), default=list, blank=True)
+
+    def __str__(self):
+        return '[%s] %s %s %s' % (self.when.strftime('%Y-%m-%d %H:%M'), self.job_type, self.processor, self.location)
+
+    class Meta:
+        indexes = [
+            # supports the options page
+            models.Index(fields=['processor', 'when'], name='eval_profile_idx'),
+        ]
+
+    objects = models.Manager()  # for the editor only
+
+
+class JobCost(models.Model):
+
+    """ Learned run time of a job type, used by the WorkScheduler in WorkQueue.scheduler """
+
+    job_type = models.CharField(max_length=20, unique=True)
+
+    # number of finished jobs
+    runs = models.PositiveIntegerField(default=0)
+
+    # moving average of the run time of the recent jobs
+    seconds = models.FloatField(default=0.0)
+
+    # when was the last job finished?
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '%s: %.1f seconds (%s runs)' % (self.job_type, self.seconds, self.runs)
+
+    objects = models.Manager()  # for the editor only
+
+
 # end of file
@@ -4,12 +4,20 @@
 #  All rights reserved.
 #  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
 
+from django.db import connection, transaction
 from django.utils import timezone
-from Pieces2x2.models import TwoSideOptions
-from WorkQueue.models import Work, ProcessorUsedPieces
+from BasePieces.piece_set import PieceSet, calc_mask
+from Pieces2x2.segment_options import count_segment_options, copy_segment_options, remove_segment_options
+from WorkQueue.models import Work, ProcessorUsedPieces, USED_BITS_SIZE
 
+# Postgres NOTIFY channel used to wake up the workers (see do_work)
+WORK_NOTIFY_CHANNEL = 'e2_work_added'
 
-def _segment_to_loc_1(segment):
+# all 256 base pieces
+ALL_PIECES_MASK = calc_mask(range(1, 256+1))
+
+
+def segment_to_loc_1(segment):
     """ reverse of calc_segment
         returns the locations above/below or left/right of the segment
     """
@@ -40,7 +48,7 @@ def _segment_to_loc_4(segment):
         returns the locations where to run the eval_loc_4
     """
 
-    loc1_a, loc1_b = _segment_to_loc_1(segment)
+    loc1_a, loc1_b = segment_to_loc_1(segment)
 
     if segment > 100:
         # left/right
@@ -85,7 +93,7 @@ def _segment_to_loc_9(segment):
     """ reverse of calc_segment
         returns the locations where to run the eval_loc_9
     """
-    loc1_a, loc1_b = _segment_to_loc_1(segment)
+    loc1_a, loc1_b = segment_to_loc_1(segment)
 
     if segment > 128:
         # left/right
@@ -141,28 +149,51 @@ def _segment_to_loc_9(segment):
     return tuple(locs)
 
 
-def _add_work(processor_nr: int, priority: int, job_type: str, location: int):
-    if location > 0:
-        count = Work.objects.filter(done=False,
-                                    processor=processor_nr, job_type=job_type, location=location).count()
-
-        if count == 0:
-            # not a duplicate
-            # (new duplicate due to race condition is still possible though)
-            Work(done=False, doing=False,
+def notify_work_added(job_type=''):
+    """ tell the waiting workers that new work was added
+        the notification is delivered when the current transaction commits
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)', [WORK_NOTIFY_CHANNEL, job_type])
+
+
+def _add_work_bulk(processor_nr: int, priority: int, job_type: str, locations):
+    """ add work for each location with a single query
+        pending duplicates are skipped by the database (see the work_pending_unique constraint)
+    """
+    bulk = [Work(done=False, doing=False,
                  processor=processor_nr, job_type=job_type, location=location,
-                 priority=priority).save()
+                 priority=priority)
+            for location in sorted(set(locations))
+            if location > 0]
 
+    if len(bulk):
+        Work.objects.bulk_create(bulk, ignore_conflicts=True)
+        notify_work_added(job_type)
 
-def propagate_segment_reduction(processor, segment):
+
+def _add_work(processor_nr: int, priority: int, job_type: str, location: int):
+    _add_work_bulk(processor_nr, priority, job_type, [location])
+
+
+def propagate_segment_reductions(processor, segments):
+    """ queue the evaluation of all locations next to the reduced segments, using a single query """
 
     # Note: propagating results in repeated evaluation of the same location
 
     # eval_loc_1
-    loc_a, loc_b = _segment_to_loc_1(segment)
+    locs = []
+    for segment in segments:
+        locs.extend(segment_to_loc_1(segment))
+    # for
+
+    _add_work_bulk(processor, 2, 'eval_loc_1', locs)
+
+
+def propagate_segment_reduction(processor, segment):
 
-    _add_work(processor, 2, 'eval_loc_1', loc_a)
-    _add_work(processor, 2, 'eval_loc_1', loc_b)
+    # eval_loc_1
+    propagate_segment_reductions(processor, (segment,))
 
     # eval_loc_4
     # loc_a, loc_b, loc_c, loc_d, loc_e, loc_f = _segment_to_loc_4(segment)
@@ -194,21 +225,34 @@ def propagate_segment_reduction(processor, segment):
     # location = segment_to_loc_16(segment)
 
 
+def get_used_mask(used):
+    """ returns the PieceSet mask of the base pieces in use """
+    return int.from_bytes(bytes(used.used_bits), 'little')
+
+
 def get_unused(used=None, nr=0):
     """ return the list with unused based piece numbers """
 
     if not used:
         used = ProcessorUsedPieces.objects.get(processor=nr)
 
-    unused = list(range(1, 256+1))
-    for nr in range(1, 256+1):
-        nr_str = 'nr%s' % nr
-        if getattr(used, nr_str, False):
-            # this piece is used
-            unused.remove(nr)
+    return list(PieceSet.from_mask(ALL_PIECES_MASK & ~get_used_mask(used)))
+
+
+def get_unused_mask_for_locs(used, locs):
+    """ returns the PieceSet mask of the base pieces that are not used and not claimed by other locations """
+    claimed = 0
+    for nr, loc in used.claims_single:
+        if loc not in locs:
+            claimed |= 1 << nr
+    # for
+
+    for nr, loc1, loc2 in used.claims_double:
+        if loc1 not in locs and loc2 not in locs:
+            claimed |= 1 << nr
     # for
 
-    return unused
+    return ALL_PIECES_MASK & ~get_used_mask(used) & ~claimed
 
 
 def get_unused_for_locs(processor, locs):
@@ -216,43 +260,13 @@ def get_unused_for_locs(processor, locs):
         when working on the given locations
     """
 
-    unused = list(range(1, 256+1))
     try:
         used = ProcessorUsedPieces.objects.get(processor=processor)
     except ProcessorUsedPieces.DoesNotExist:
         # not available; so simple return all
-        pass
-    else:
-        for nr in range(1, 256+1):
-            nr_str = 'nr%s' % nr
-            if getattr(used, nr_str, False):
-                # this piece is used
-                unused.remove(nr)
-        # for
-
-        for claim in used.claimed_nrs_single.split(','):
-            if claim:
-                nr_str, loc_str = claim.split(':')
-                loc = int(loc_str)
-                if loc not in locs:
-                    nr = int(nr_str)
-                    if nr in unused:
-                        unused.remove(nr)
-        # for
+        return list(range(1, 256+1))
 
-        for claim in used.claimed_nrs_double.split(','):
-            if claim:
-                nr_str, locs_str = claim.split(':')
-                spl = locs_str.split('+')
-                loc1 = int(spl[0])
-                loc2 = int(spl[1])
-                if loc1 not in locs and loc2 not in locs:
-                    nr = int(nr_str)
-                    if nr in unused:
-                        unused.remove(nr)
-        # for
-
-    return unused
+    return list(PieceSet.from_mask(get_unused_mask_for_locs(used, locs)))
 
 
 # def set_used(processor, base_nrs):
@@ -271,22 +285,70 @@ def get_unused_for_locs(processor, locs):
 #         used.save(update_fields=updated)
 
 
+def mark_loc_used(used, loc, p2x2):
+    """ in-memory version of set_loc_used, for callers that save the ProcessorUsedPieces themselves """
+    used.loc_nrs[loc - 1] = p2x2.nr
+    setattr(used, 'loc%s' % loc, p2x2.nr)
+
+    mask = get_used_mask(used)
+    for nr in (p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4):
+        mask |= 1 << nr
+        setattr(used, 'nr%s' % nr, True)
+    # for
+    used.used_bits = mask.to_bytes(USED_BITS_SIZE, 'little')
+
+
 def set_loc_used(processor, loc, p2x2):
-    try:
-        used = ProcessorUsedPieces.objects.get(processor=processor)
-    except ProcessorUsedPieces.DoesNotExist:
-        # not available; so simple skip
-        pass
-    else:
-        loc_str = 'loc%s' % loc
-        setattr(used, loc_str, p2x2.nr)
-        updated = [loc_str]
-        for nr in [p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4]:
-            nr_str = 'nr%s' % nr
-            setattr(used, nr_str, True)
-            updated.append(nr_str)
+    """ fill a location and mark its base pieces as used, with a single UPDATE
+        setting the bits inside the database means concurrent fills of other locations are not lost
+    """
+    nrs = [p2x2.nr1, p2x2.nr2, p2x2.nr3, p2x2.nr4]
+
+    expr = 'used_bits'
+    for _ in nrs:
+        expr = 'set_bit(%s, %%s, 1)' % expr
+    # for
+
+    # also update the nrN and locN fields
+    legacy = ", ".join(['"nr%s" = true' % nr for nr in nrs])
+
+    sql = ('UPDATE "%s" SET used_bits = %s, loc_nrs[%%s] = %%s, "loc%s" = %%s, %s WHERE processor = %%s'
+           % (ProcessorUsedPieces._meta.db_table, expr, int(loc), legacy))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, nrs + [loc, p2x2.nr, p2x2.nr, processor])
+    # with
+
+
+def apply_board_scan(processor, scan):
+    """ store the reductions and filled locations of a BoardScan1x1 in a single transaction
+        returns the number of options removed
+    """
+    with transaction.atomic():
+        for segment, two_sides in scan.reductions.items():
+            remove_segment_options(processor, segment, sorted(two_sides))
         # for
-        used.save(update_fields=updated)
+
+        for loc, idx in scan.fills.items():
+            set_loc_used(processor, loc, scan.piece_index.get_piece(idx))
+        # for
+    # atomic
+
+    return sum([len(two_sides) for two_sides in scan.reductions.values()])
+
+
+def set_claims_single(used, claims):
+    """ store the single claims: [(nr, loc), ..] """
+    used.claims_single = [[nr, loc] for nr, loc in claims]
+    used.claimed_nrs_single = ",".join(['%s:%s' % (nr, loc) for nr, loc in claims])
+    used.save(update_fields=['claims_single', 'claimed_nrs_single'])
+
+
+def set_claims_double(used, claims):
+    """ store the double claims: [(nr, loc1, loc2), ..] """
+    used.claims_double = [[nr, loc1, loc2] for nr, loc1, loc2 in claims]
+    used.claimed_nrs_double = ",".join(['%s:%s+%s' % (nr, loc1, loc2) for nr, loc1, loc2 in claims])
+    used.save(update_fields=['claims_double', 'claimed_nrs_double'])
 
 
 def used_note_add(processor, msg):
@@ -302,6 +364,44 @@ def used_note_add(processor, msg):
         used.save(update_fields=['choices'])
 
 
+def clone_board(source, processor, msg):
+    """ duplicate a board: the ProcessorUsedPieces record and the segment options, in one transaction
+        both are copied inside the database; the note is added to the choices of the new board
+
+        returns the ProcessorUsedPieces of the new board
+    """
+    table = ProcessorUsedPieces._meta.db_table
+    columns = [field.column
+               for field in ProcessorUsedPieces._meta.concrete_fields
+               if not field.primary_key and field.column not in ('processor', 'created_from', 'choices')]
+    columns_str = ", ".join(['"%s"' % column for column in columns])
+
+    now = timezone.localtime(timezone.now())
+    stamp_str = now.strftime('%Y-%m-%d %H:%M')
+    note = "[%s] %s\n" % (stamp_str, msg)
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO "%s" (processor, created_from, choices, %s) '
+                           'SELECT %%s, processor, choices || %%s, %s FROM "%s" WHERE processor = %%s '
+                           'RETURNING id' % (table, columns_str, columns_str, table),
+                           [processor, note, source])
+            row = cursor.fetchone()
+        # with
+
+        if row:
+            used = ProcessorUsedPieces.objects.get(pk=row[0])
+        else:
+            # source has no record; start a new one
+            used = ProcessorUsedPieces(processor=processor, created_from=source, choices=note)
+            used.save()
+
+        copy_segment_options(source, processor)
+    # atomic
+
+    return used
+
+
 def request_eval_claims(processor):
     try:
         used = ProcessorUsedPieces.objects.get(processor=processor)
@@ -309,14 +409,25 @@ def request_eval_claims(processor):
         # not available; so simple skip
         pass
     else:
-        count = TwoSideOptions.objects.filter(processor=processor).count()
-        diff = used.claimed_at_twoside_count - count
-        if diff > 5:
-            perc = diff / count
-            if perc > 0.05:
-                # 5% reduction
-                if Work.objects.filter(processor=processor, job_type='eval_claims', done=False).count() == 0:
-                    Work(processor=processor, job_type='eval_claims', priority='1').save()
+        # the claim matrix is cheap: evaluate again after every reduction
+        # a running eval_claims job (doing) does not see the latest reductions, so only look at the waiting jobs
+        if used.claimed_at_twoside_count != count_segment_options(processor):
+            if Work.objects.filter(processor=processor, job_type='eval_claims', done=False, doing=False).count() == 0:
+                Work(processor=processor, job_type='eval_claims', priority='1').save()
+                notify_work_added('eval_claims')
+
+
+def request_board_scan(processor, priority, nop=False):
+    """ queue a scan_board_1x1 job for the board, unless one is already waiting
+        the work_pending_unique constraint does not cover the board level jobs (location 0)
+        returns True when the job was added
+    """
+    if Work.objects.filter(processor=processor, job_type='scan_board_1x1', done=False, doing=False).exists():
+        return False
+
+    Work(processor=processor, job_type='scan_board_1x1', priority=priority, location=0, nop=nop).save()
+    notify_work_added('scan_board_1x1')
+    return True
 
 
 def set_dead_end(processor):
@@ -325,6 +436,9 @@ def set_dead_end(processor):
     """
     ProcessorUsedPieces.objects.filter(processor=processor).update(reached_dead_end=True)
 
+    # the pending work for this board is no longer useful
+    Work.objects.filter(processor=processor, done=False, doing=False).delete()
+
 
 def check_dead_end(processor):
     """ Returns True when a dead end has been reached and processing should stop """
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Profiling of the evaluator jobs
+
+    The EvalProfiler collects where the time of an evaluator job goes:
+        - the search counters: nodes, candidates generated, placements pruned and nodes per depth
+        - the number of database queries and the time spent on them
+        - per segment option: the result, the search effort and the database work that followed it
+
+    The result is stored in an EvalProfile record, linked to the Work record of the job,
+    and shown on the options page of the processor.
+"""
+
+from django.db import connection
+from WorkQueue.models import Work, EvalProfile
+import time
+
+
+class EvalProfiler(object):
+
+    """ Collects the counters and timing of one evaluator job """
+
+    def __init__(self, processor, job_type, location):
+        self.processor = processor
+        self.job_type = job_type
+        self.location = location
+        self.work = None
+
+        self.db_queries = 0
+        self.db_seconds = 0.0
+
+        self.nodes = 0
+        self.candidates = 0
+        self.pruned = 0
+        self.depth_counts = []      # [depth] = nodes
+
+        # [[segment, two_side, found, rounds, nodes, search_ms, db_queries, db_ms], ..]
+        self.options = []
+
+        self._start = time.monotonic()
+        self._option_db = (0, 0.0)  # db_queries, db_seconds at the end of the previous option
+        self._is_started = False
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_seconds += time.monotonic() - start
+
+    def start(self):
+        """ find the Work record of the job and start counting the database queries """
+        self._start = time.monotonic()
+        self.work = (Work
+                     .objects
+                     .filter(processor=self.processor,
+                             job_type=self.job_type,
+                             location=self.location,
+                             done=False)
+                     .first())
+        if not self._is_started:
+            connection.execute_wrappers.append(self._execute_wrapper)
+            self._is_started = True
+
+    def stop(self):
+        """ stop counting the database queries """
+        if self._is_started:
+            connection.execute_wrappers.remove(self._execute_wrapper)
+            self._is_started = False
+
+    def count_node(self, depth):
+        """ for the evaluators with their own search: count a node at this depth """
+        self.nodes += 1
+        if depth >= len(self.depth_counts):
+            self.depth_counts.extend([0] * (depth + 1 - len(self.depth_counts)))
+        self.depth_counts[depth] += 1
+
+    def add_search(self, search):
+        """ take over the counters of a SquareSearch """
+        self.nodes += search.nodes
+        self.candidates += search.candidates_count
+        self.pruned += search.pruned
+        for depth, count in enumerate(search.depth_counts):
+            if depth >= len(self.depth_counts):
+                self.depth_counts.append(0)
+            self.depth_counts[depth] += count
+        # for
+
+    def option_done(self, segment, two_side, found, nodes, seconds, rounds=1):
+        """ record the result of one segment option
+            the database queries since the previous option are assigned to this option
+        """
+        db_queries = self.db_queries - self._option_db[0]
+        db_seconds = self.db_seconds - self._option_db[1]
+        self._option_db = (self.db_queries, self.db_seconds)
+
+        self.options.append([segment, two_side, int(found), rounds, nodes,
+                             int(seconds * 1000), db_queries, int(db_seconds * 1000)])
+
+    def save(self):
+        """ store the profile; linked to the Work record of the job, when there is one """
+        self.stop()
+
+        EvalProfile.objects.create(
+                        work=self.work,
+                        processor=self.processor,
+                        job_type=self.job_type,
+                        location=self.location,
+                        seconds=time.monotonic() - self._start,
+                        db_seconds=self.db_seconds,
+                        db_queries=self.db_queries,
+                        nodes=self.nodes,
+                        candidates=self.candidates,
+                        pruned=self.pruned,
+                        depth_counts=self.depth_counts,
+                        options=self.options)
+
+
+# end of file
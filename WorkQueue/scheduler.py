@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+#  Copyright (c) 2024 Ramon van der Winkel.
+#  All rights reserved.
+#  Licensed under BSD-3-Clause-Clear. See LICENSE file for details.
+
+""" Scheduling of the work queue
+
+    The WorkScheduler decides which jobs a worker (see do_work) takes next:
+        - capability tags: a worker only takes the job classes in its tags (see JOB_CLASSES)
+        - job class quotas: a job class that reached its maximum number of running jobs is not handed out
+        - fair share: a board that already runs its share of the jobs only gets a worker
+          when no other board has work for it
+        - after that: the lowest priority first, then the oldest
+
+    The jobs of the 'serial' class change the used pieces and claims of a board and never run in parallel
+    for the same board: the worker holds an advisory lock on the board while running them.
+
+    The run time of each job type is learned from the finished jobs (JobCost).
+    A cheap job is claimed together with more jobs of the same type for the same board, up to BATCH_SECONDS.
+"""
+
+from django.db import connection
+from django.db.models import F, Count
+from django.utils import timezone
+from WorkQueue.models import Work, ProcessorUsedPieces, JobCost
+import math
+import time
+
+# [job type] = job class
+JOB_CLASSES = {
+    'eval_loc_1': 'serial',
+    'propagate_board': 'serial',
+    'scan_board_1x1': 'serial',
+    'eval_claims': 'serial',
+
+    'eval_loc_4': 'square4',
+
+    'eval_loc_9': 'search',
+    'eval_loc_16': 'search',
+    'eval_line1': 'search',
+    'eval_line2': 'search',
+    'eval_line3': 'search',
+
+    'delayed_scan1': 'other',
+    'make_ring2': 'other',
+}
+
+# job class for unknown job types
+DEFAULT_JOB_CLASS = 'other'
+
+ALL_TAGS = ('serial', 'square4', 'search', 'other')
+
+# first key of the advisory locks on the boards, for the serial jobs
+SERIAL_LOCK_KEY = 2023
+
+# claim more cheap jobs, up to this many seconds of estimated work
+BATCH_SECONDS = 5.0
+MAX_BATCH = 20
+
+# weight of the latest run time in the moving average of JobCost
+COST_WEIGHT = 0.2
+
+# reload the costs after this many seconds
+COST_REFRESH_SECONDS = 60
+
+
+def get_job_class(job_type):
+    return JOB_CLASSES.get(job_type, DEFAULT_JOB_CLASS)
+
+
+def get_default_tags(worker_nr):
+    """ returns the tags for a worker started without --tags
+        same division as before the tags: workers 1..4 only serial, workers above 10 no eval_loc_4
+    """
+    if worker_nr <= 4:
+        return ('serial',)
+    if worker_nr > 10:
+        return 'search', 'other'
+    return 'square4', 'search', 'other'
+
+
+def calc_over_share(running, pending, workers):
+    """ returns the boards that already run at least their fair share of the jobs
+
+        running: [processor] = number of running jobs
+        pending: boards with waiting work
+        workers: number of busy workers, including the asking worker
+    """
+    boards = set(running.keys()) | set(pending)
+    if not boards:
+        return set()
+    share = max(1, math.ceil(workers / len(boards)))
+    return set([processor for processor, count in running.items() if count >= share])
+
+
+def record_job_cost(job_type, seconds):
+    """ update the moving average of the run time of the job type """
+    count = (JobCost
+             .objects
+             .filter(job_type=job_type)
+             .update(runs=F('runs') + 1,
+                     seconds=F('seconds') * (1.0 - COST_WEIGHT) + seconds * COST_WEIGHT,
+                     updated=timezone.now()))
+    if count == 0:
+        JobCost.objects.get_or_create(job_type=job_type, defaults={'runs': 1, 'seconds': seconds})
+
+
+class WorkScheduler(object):
+
+    """ Claims the next jobs for one worker """
+
+    def __init__(self, tags, quotas=None):
+        """
+            tags: job classes this worker takes
+            quotas: [job class] = maximum number of running jobs over all workers
+        """
+        self.tags = tuple(tags)
+        self.quotas = dict(quotas or {})
+        self.costs = dict()         # [job type] = seconds
+        self._costs_loaded = 0.0
+        self._locked = []           # processors with an advisory lock held by this worker
+
+    def takes(self, job_type):
+        """ does this worker take jobs of this type? used to filter the notifications """
+        return get_job_class(job_type) in self.tags
+
+    def get_cost(self, job_type):
+        """ returns the estimated run time in seconds, or None when unknown """
+        now = time.monotonic()
+        if now - self._costs_loaded > COST_REFRESH_SECONDS:
+            self.costs = {job_type: seconds
+                          for job_type, seconds in JobCost.objects.values_list('job_type', 'seconds')}
+            self._costs_loaded = now
+        return self.costs.get(job_type, None)
+
+    @staticmethod
+    def _get_load():
+        """ returns the running jobs per board, the boards with waiting work and the running jobs per class """
+        running = dict()            # [processor] = count
+        pending = set()
+        class_running = dict()      # [job class] = count
+
+        qset = (Work
+                .objects
+                .filter(done=False)
+                .order_by()
+                .values('processor', 'job_type', 'doing')
+                .annotate(count=Count('id')))
+        for row in qset:
+            processor = row['processor']
+            if row['doing']:
+                running[processor] = running.get(processor, 0) + row['count']
+                job_class = get_job_class(row['job_type'])
+                class_running[job_class] = class_running.get(job_class, 0) + row['count']
+            else:
+                pending.add(processor)
+        # for
+
+        return running, pending, class_running
+
+    def _get_job_type_filter(self, class_running):
+        """ returns the SQL condition on the job type for the classes this worker can take now, with parameters """
+        allowed = [job_class for job_class in self.tags
+                   if job_class not in self.quotas or class_running.get(job_class, 0) < self.quotas[job_class]]
+        if not allowed:
+            return None, []
+
+        if DEFAULT_JOB_CLASS in allowed:
+            # also the unknown job types
+            excluded = [job_type for job_type, job_class in JOB_CLASSES.items() if job_class not in allowed]
+            if not excluded:
+                return 'true', []
+            return 'w.job_type NOT IN (%s)' % ', '.join(['%s'] * len(excluded)), excluded
+
+        included = [job_type for job_type, job_class in JOB_CLASSES.items() if job_class in allowed]
+        return 'w.job_type IN (%s)' % ', '.join(['%s'] * len(included)), included
+
+    @staticmethod
+    def _claim_one(job_filter, job_params, over_share, skip_processors):
+        """ Claim the next job: boards below their fair share first, then the lowest priority, then the oldest
+            A single statement picks the job, skips jobs claimed by other workers and boards that reached
+            a dead end, and marks it as doing. Returns None when no work is available.
+        """
+        where = ['w.done = false',
+                 'w.doing = false',
+                 'w.start_after <= %s',
+                 job_filter]
+        params = [timezone.now()] + job_params
+
+        if skip_processors:
+            where.append('w.processor NOT IN (%s)' % ', '.join(['%s'] * len(skip_processors)))
+            params.extend(skip_processors)
+
+        params.append(sorted(over_share))
+
+        sql = """UPDATE {work} SET doing = true
+                 WHERE id = (SELECT w.id
+                             FROM {work} w
+                             WHERE {where}
+                               AND NOT EXISTS (SELECT 1
+                                               FROM {used} u
+                                               WHERE u.processor = w.processor
+                                                 AND u.reached_dead_end)
+                             ORDER BY w.processor = ANY(%s::integer[]), w.priority, w.start_after
+                             LIMIT 1
+                             FOR UPDATE SKIP LOCKED)
+                 RETURNING *""".format(work=connection.ops.quote_name(Work._meta.db_table),
+                                       used=connection.ops.quote_name(ProcessorUsedPieces._meta.db_table),
+                                       where=' AND '.join(where))
+
+        for work in Work.objects.raw(sql, params):
+            return work
+        # for
+
+        return None
+
+    @staticmethod
+    def _claim_more(work, count):
+        """ claim up to count more jobs of the same type for the same board """
+        sql = """UPDATE {work} SET doing = true
+                 WHERE id IN (SELECT w.id
+                              FROM {work} w
+                              WHERE w.done = false
+                                AND w.doing = false
+                                AND w.start_after <= %s
+                                AND w.job_type = %s
+                                AND w.processor = %s
+                              ORDER BY w.priority, w.start_after
+                              LIMIT %s
+                              FOR UPDATE SKIP LOCKED)
+                 RETURNING *""".format(work=connection.ops.quote_name(Work._meta.db_table))
+
+        return list(Work.objects.raw(sql, [timezone.now(), work.job_type, work.processor, count]))
+
+    @staticmethod
+    def _lock_board(processor):
+        """ returns True when the advisory lock on the board was taken """
+        if connection.vendor != 'postgresql':
+            return True
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s, %s)', [SERIAL_LOCK_KEY, processor])
+            return cursor.fetchone()[0]
+
+    @staticmethod
+    def _unlock_board(processor):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s, %s)', [SERIAL_LOCK_KEY, processor])
+
+    def claim(self):
+        """ returns the list of claimed jobs, for the same board and job type, or an empty list
+            call release() when the jobs are done
+        """
+        running, pending, class_running = self._get_load()
+        job_filter, job_params = self._get_job_type_filter(class_running)
+        if job_filter is None:
+            return []
+
+        over_share = calc_over_share(running, pending, sum(running.values()) + 1)
+
+        skip_processors = []
+        for _ in range(3):
+            work = self._claim_one(job_filter, job_params, over_share, skip_processors)
+            if not work:
+                return []
+
+            if get_job_class(work.job_type) != 'serial' or self._lock_board(work.processor):
+                break
+
+            # a serial job for this board is running on another worker: hand it back
+            Work.objects.filter(pk=work.pk).update(doing=False)
+            skip_processors.append(work.processor)
+            work = None
+        # for
+
+        if not work:
+            return []
+
+        if get_job_class(work.job_type) == 'serial':
+            self._locked.append(work.processor)
+
+        works = [work]
+        cost = self.get_cost(work.job_type)
+        if cost is not None and cost < BATCH_SECONDS:
+            count = min(MAX_BATCH, int(BATCH_SECONDS / max(cost, 0.01))) - 1
+            if count > 0:
+                works.extend(self._claim_more(work, count))
+
+        return works
+
+    def release(self):
+        """ the claimed jobs are done: allow other workers to run serial jobs for the board """
+        for processor in self._locked:
+            self._unlock_board(processor)
+        # for
+        self._locked = []
+
+
+# end of file